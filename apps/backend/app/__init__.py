@@ -39,6 +39,12 @@ def create_app(config_name="default"):
 
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
+    from .services import metrics, profiling, tracing
+
+    metrics.init_app(app)
+    tracing.init_app(app)
+    profiling.init_app(app)
+
     @jwt.expired_token_loader
     def expired_token_response(jwt_header, jwt_payload):
         return jsonify({"ok": False, "message": "Session expired. Please log in again."}), 401
@@ -1,17 +1,22 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from flask_jwt_extended import current_user, get_jwt_identity, jwt_required
 from spectree import Response
 
 from app import db, spec
+from config import HISTORY_SEMANTIC_SEARCH
 
+from ..core.rag.history_index import shared_indexer
 from ..core.rag.llm import LLM
 from ..core.rag.retriever import Retriever
 from ..core.rag.vectorstore import VectorStore
 from ..models import Chat, Message, User
-from ..schemas import ChatHistoryResponse, ChatMessageRequest, ChatMessageResponse
+from ..schemas import ChatHistoryResponse, ChatMessageRequest, ChatMessageResponse, PageQuery
 from ..services.logger import get_logger
+from ..services.memory import ConversationMemory, contextualize_query, to_chat_messages
+from ..services.metrics import stage_timer
 from . import api
 from .errors import abort_forbidden, abort_not_found
+from .pagination import paginate
 
 logger = get_logger(__name__)
 
@@ -40,10 +45,11 @@ def create_chat():
 
 
 @api.route("/chat/<chat_id>", methods=["GET"])
+@spec.validate(query=PageQuery)
 @jwt_required()
 def get_chat_history(chat_id):
-    """Return the chat history for a chat id. Only owner may fetch."""
-    chat = Chat.query.get(chat_id)
+    """Return one page of a chat's history, oldest first. Only owner may fetch."""
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
@@ -51,10 +57,19 @@ def get_chat_history(chat_id):
     if chat.user_id != current_user.id:
         abort_forbidden("You are not allowed to view this chat")
 
-    messages = Message.query.filter_by(chat_id=chat.id).order_by(Message.timestamp.asc()).all()
+    page = request.context.query
+    messages, next_cursor = paginate(
+        Message.query.filter_by(chat_id=chat.id),
+        Message.seq,
+        None,
+        page.limit,
+        page.after,
+    )
     resp_msgs = [ChatMessageResponse.model_validate(m).model_dump() for m in messages]
 
-    resp = ChatHistoryResponse(chat_id=chat.id, title=chat.title, messages=resp_msgs)
+    resp = ChatHistoryResponse(
+        chat_id=chat.id, title=chat.title, messages=resp_msgs, next_cursor=next_cursor
+    )
     return jsonify(resp.model_dump()), 200
 
 
@@ -71,7 +86,7 @@ def post_message(chat_id):
     if not user:
         abort_not_found("User not found")
 
-    chat = Chat.query.get(chat_id)
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
@@ -85,17 +100,35 @@ def post_message(chat_id):
     # Save user message
     user_msg = Message(chat_id=chat.id, role="user", content=content)
     db.session.add(user_msg)
-    db.session.commit()
-
-    # Initialize RAG components (use default model 'hf')
+    with stage_timer("db_commit_user_message"):
+        db.session.commit()
+
+    # Bounded conversation memory: recent turns plus the chat's rolling summary
+    memory = ConversationMemory()
+    with stage_timer("memory_load"):
+        window = memory.recent_messages(chat, before_seq=user_msg.seq)
+        history = to_chat_messages(window)
+
+    # Initialize RAG components (providers from EMBEDDINGS_PROVIDER / LLM_PROVIDER)
+    llm = None
+    generated = False
     try:
-        vs = VectorStore(use_model="hf")
-        retriever = Retriever(vector_store=vs)
-        llm = LLM()
+        with stage_timer("rag_init"):
+            vs = VectorStore()
+            retriever = Retriever(vector_store=vs)
+            llm = LLM()
 
         retriever_runnable = retriever.as_runnable()
 
-        assistant_text = llm.get_response(content, retriever_runnable)
+        with stage_timer("rag_total", vs.model, llm.primary_provider.name):
+            assistant_text = llm.get_response(
+                content,
+                retriever_runnable,
+                history=history,
+                summary=chat.summary,
+                retrieval_query=contextualize_query(content, history),
+            )
+        generated = True
     except Exception as e:
         logger.error(f"RAG generation failed: {e}")
         assistant_text = "Sorry, I couldn't generate a response right now."
@@ -103,7 +136,19 @@ def post_message(chat_id):
     # Save assistant message
     assistant_msg = Message(chat_id=chat.id, role="assistant", content=assistant_text)
     db.session.add(assistant_msg)
-    db.session.commit()
+    with stage_timer("db_commit_assistant_message"):
+        db.session.commit()
+
+    # Embed both turns for semantic history search, off the request path
+    if HISTORY_SEMANTIC_SEARCH:
+        indexed = [(user_msg.id, content)]
+        if generated:
+            indexed.append((assistant_msg.id, assistant_text))
+        shared_indexer().submit(user.id, indexed)
+
+    # Fold turns that left the window into the summary, off the request path
+    if llm is not None and memory.needs_summary(chat, window):
+        memory.update_summary_async(current_app._get_current_object(), chat.id, llm)
 
     resp = ChatMessageResponse.model_validate(assistant_msg).model_dump()
     return jsonify(resp), 201
@@ -9,10 +9,12 @@ from ..schemas import (
     ComplaintCreateRequest,
     ComplaintListResponse,
     ComplaintResponse,
+    PageQuery,
 )
 from ..services.logger import get_logger
 from . import api
 from .errors import abort_forbidden, abort_not_found
+from .pagination import paginate
 
 logger = get_logger(__name__)
 
@@ -45,23 +47,24 @@ def create_complaint():
 
 
 @api.route("/complaints", methods=["GET"])
-@spec.validate(resp=Response(HTTP_200=ComplaintListResponse))
+@spec.validate(query=PageQuery, resp=Response(HTTP_200=ComplaintListResponse))
 @jwt_required()
 def list_complaints():
-    """List complaints for the current user."""
+    """List one page of complaints for the current user, newest first."""
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
     if not user:
         abort_not_found("User not found")
     # If the requester is a confirmed non-guest (testing), show all complaints
     if getattr(user, "is_confirmed", False) and not getattr(user, "is_guest", False):
-        complaints_q = Complaint.query.order_by(Complaint.created_at.desc())
+        complaints_q = Complaint.query
     else:
-        complaints_q = Complaint.query.filter_by(user_id=user.id).order_by(
-            Complaint.created_at.desc()
-        )
+        complaints_q = Complaint.query.filter_by(user_id=user.id)
 
-    complaints = complaints_q.all()
+    page = request.context.query
+    complaints, next_cursor = paginate(
+        complaints_q, Complaint.created_at, Complaint.id, page.limit, page.after, descending=True
+    )
 
     out = []
     for c in complaints:
@@ -73,7 +76,7 @@ def list_complaints():
             item["created_at"] = str(ca) if ca is not None else None
         out.append(item)
 
-    return jsonify({"complaints": out}), 200
+    return jsonify({"complaints": out, "next_cursor": next_cursor}), 200
 
 
 @api.route("/complaints/<int:complaint_id>", methods=["GET"])
@@ -1,8 +1,10 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from spectree import Response
 
 from app import db, spec
+from config import CLEAR_CHATS_SYNC_MAX_MESSAGES, HISTORY_SEMANTIC_SEARCH
 
+from ..core.rag.history_index import shared_indexer
 from ..models import Chat, Message
 from ..schemas import (
     ChatHistoryResponse,
@@ -10,23 +12,41 @@ from ..schemas import (
     ChatsListResponse,
     DeleteResponse,
     LikeMessageRequest,
+    PageQuery,
+    SearchQuery,
     SearchResponse,
 )
+from ..services.deletion import (
+    count_messages,
+    delete_chats,
+    purge_deleted_chats_async,
+    soft_delete_chats,
+)
 from ..services.logger import get_logger
+from ..services.search import hybrid_hits, matching_messages, render_snippet, semantic_hits
 from . import api
 from .decorators import member_required
 from .errors import abort_bad_request, abort_forbidden, abort_not_found
+from .pagination import paginate, paginate_ranked
 
 logger = get_logger(__name__)
 
 
 @api.route("/history/chats", methods=["GET"])
-@spec.validate(resp=Response(HTTP_200=ChatsListResponse))
+@spec.validate(query=PageQuery, resp=Response(HTTP_200=ChatsListResponse))
 @member_required(check_owner=False)
 def list_chats(current_user=None):
-    """List all chats for the current user."""
+    """List one page of the current user's chats, newest first."""
     # current_user is attached by the decorator
-    chats = Chat.query.filter_by(user_id=current_user.id).order_by(Chat.created_at.desc()).all()
+    page = request.context.query
+    chats, next_cursor = paginate(
+        Chat.query.filter_by(user_id=current_user.id, deleted_at=None),
+        Chat.created_at,
+        Chat.id,
+        page.limit,
+        page.after,
+        descending=True,
+    )
     out = [
         {
             "id": c.id,
@@ -35,39 +55,58 @@ def list_chats(current_user=None):
         }
         for c in chats
     ]
-    return jsonify({"chats": out}), 200
+    return jsonify({"chats": out, "next_cursor": next_cursor}), 200
 
 
 @api.route("/history/chats", methods=["DELETE"])
 @spec.validate(resp=Response(HTTP_200=DeleteResponse))
 @member_required(check_owner=False)
 def clear_all_chats(current_user=None):
-    """Delete all chats and messages for the current user."""
-    chats = Chat.query.filter_by(user_id=current_user.id).all()
-    if not chats:
+    """Delete all chats and messages for the current user.
+
+    Up to CLEAR_CHATS_SYNC_MAX_MESSAGES messages are deleted right away;
+    larger histories are hidden at once and purged in the background.
+    """
+    owned = Chat.user_id == current_user.id
+    live = Chat.deleted_at.is_(None)
+    if Chat.query.filter(owned, live).first() is None:
         return jsonify({"message": "No chats to delete"}), 200
 
-    for c in chats:
-        db.session.delete(c)
-
-    db.session.commit()
+    cap = CLEAR_CHATS_SYNC_MAX_MESSAGES + 1
+    if count_messages(owned, live, cap=cap) > CLEAR_CHATS_SYNC_MAX_MESSAGES:
+        soft_delete_chats(owned)
+        db.session.commit()
+        purge_deleted_chats_async(current_app._get_current_object())
+    else:
+        delete_chats(owned)
+        db.session.commit()
+
+    if HISTORY_SEMANTIC_SEARCH:
+        shared_indexer().index.drop(current_user.id)
     logger.info(f"Cleared all chats for user {current_user.id}")
     return jsonify({"message": "All chats deleted"}), 200
 
 
 @api.route("/history/chat/<chat_id>/messages", methods=["GET"])
-@spec.validate(resp=Response(HTTP_200=ChatHistoryResponse))
+@spec.validate(query=PageQuery, resp=Response(HTTP_200=ChatHistoryResponse))
 @member_required(check_owner=False)
 def get_messages(chat_id, current_user=None):
-    """Return messages for a chat. Owner only."""
-    chat = Chat.query.get(chat_id)
+    """Return one page of a chat's messages, oldest first. Owner only."""
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
     if chat.user_id != current_user.id:
         abort_forbidden("You are not allowed to view this chat")
 
-    messages = Message.query.filter_by(chat_id=chat.id).order_by(Message.timestamp.asc()).all()
+    page = request.context.query
+    messages, next_cursor = paginate(
+        Message.query.filter_by(chat_id=chat.id),
+        Message.seq,
+        None,
+        page.limit,
+        page.after,
+    )
     resp_msgs = []
     for m in messages:
         jm = {
@@ -88,6 +127,7 @@ def get_messages(chat_id, current_user=None):
         "chat_id": chat.id,
         "title": chat.title,
         "messages": resp_msgs,
+        "next_cursor": next_cursor,
     }
     return jsonify(resp), 200
 
@@ -97,14 +137,14 @@ def get_messages(chat_id, current_user=None):
 @member_required(check_owner=False)
 def delete_chat(chat_id, current_user=None):
     """Delete a specific chat and its messages. Owner only."""
-    chat = Chat.query.get(chat_id)
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
     if chat.user_id != current_user.id:
         abort_forbidden("You are not allowed to delete this chat")
 
-    db.session.delete(chat)
+    delete_chats(Chat.id == chat.id)
     db.session.commit()
     logger.info(f"Deleted chat {chat_id} for user {current_user.id}")
     return jsonify({"message": "Chat deleted"}), 200
@@ -115,7 +155,7 @@ def delete_chat(chat_id, current_user=None):
 @member_required(check_owner=False)
 def delete_message(chat_id, msg_id, current_user=None):
     """Delete a single message in a chat. Owner only."""
-    chat = Chat.query.get(chat_id)
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
@@ -137,7 +177,7 @@ def delete_message(chat_id, msg_id, current_user=None):
 @member_required(check_owner=False)
 def like_message(chat_id, msg_id, current_user=None):
     """Like or unlike a message. Body: {"like": true|false}"""
-    chat = Chat.query.get(chat_id)
+    chat = Chat.query.filter_by(id=chat_id, deleted_at=None).first()
     if not chat:
         abort_not_found("Chat not found")
 
@@ -175,38 +215,42 @@ def like_message(chat_id, msg_id, current_user=None):
 
 
 @api.route("/history/search", methods=["GET"])
-@spec.validate(resp=Response(HTTP_200=SearchResponse))
+@spec.validate(query=SearchQuery, resp=Response(HTTP_200=SearchResponse))
 @member_required(check_owner=False)
 def search_messages(current_user=None):
-    """Search messages across user's chats using `q` query param."""
-    q = request.args.get("q", "").strip()
+    """Search across the user's chats using `q`, best matches first.
+
+    `mode` is `fulltext` (default), or `semantic` / `hybrid` when
+    HISTORY_SEMANTIC_SEARCH is enabled.
+    """
+    page = request.context.query
+    q = page.q.strip()
     if not q:
         abort_bad_request("Missing search query parameter `q`")
 
-    # Simple case-insensitive search within messages belonging to user's chats
-    msgs = (
-        Message.query.join(Chat, Message.chat_id == Chat.id)
-        .filter(Chat.user_id == current_user.id)
-        .filter(Message.content.ilike(f"%{q}%"))
-        .order_by(Message.timestamp.desc())
-        .limit(50)
-        .all()
-    )
+    if page.mode == "fulltext":
+        query, rank, message_id = matching_messages(current_user.id, q)
+        hits, next_cursor = paginate(
+            query, rank, message_id, page.limit, page.after, descending=True
+        )
+    elif not HISTORY_SEMANTIC_SEARCH:
+        abort_bad_request("Semantic search is not enabled")
+    else:
+        found = (semantic_hits if page.mode == "semantic" else hybrid_hits)(current_user.id, q)
+        hits, next_cursor = paginate_ranked(found, page.limit, page.after)
 
     results = []
-    for m in msgs:
-        jm = {
-            "id": m.id,
-            "role": m.role,
-            "content": m.content,
-            "timestamp": None,
-            "is_liked": m.is_liked,
-        }
-        if getattr(m, "timestamp", None) is not None:
-            try:
-                jm["timestamp"] = m.timestamp.isoformat()
-            except Exception:
-                jm["timestamp"] = str(m.timestamp)
-        results.append(jm)
-
-    return jsonify({"results": results}), 200
+    for hit in hits:
+        results.append(
+            {
+                "id": hit.id,
+                "chat_id": hit.chat_id,
+                "role": hit.role,
+                "content": render_snippet(hit.snippet),
+                "timestamp": hit.timestamp.isoformat() if hit.timestamp else None,
+                "is_liked": hit.is_liked,
+                "rank": hit.rank,
+            }
+        )
+
+    return jsonify({"results": results, "next_cursor": next_cursor}), 200
@@ -0,0 +1,111 @@
+"""Keyset (cursor) pagination for the listing endpoints.
+
+Pages are ordered by a sort column, plus the row id as a tie-breaker when
+the sort column is not unique, and the `after` cursor is an opaque token
+holding the last row's key. The next page is `WHERE key > cursor ORDER BY
+key LIMIT n` (or `<` for newest-first listings), which walks the indexes
+declared in `models.py`, so every page costs the same however deep it is.
+"""
+
+import base64
+from datetime import datetime
+import json
+
+from sqlalchemy import DateTime, Float, Integer, Select, column
+
+from .. import db
+from .errors import abort_bad_request
+
+# Sort key of ranked search results, best first
+_RANK_KEY = (column("rank", Float), column("id", Integer))
+
+
+def encode_cursor(*key) -> str:
+    """Opaque cursor for the row whose sort key is `key`."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in key]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    """Return the key values of a cursor over `columns`; 400 if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the listing's sort key")
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(columns, values, strict=True)
+        ]
+    except Exception:
+        abort_bad_request("Invalid pagination cursor")
+
+
+def keyset_query(
+    query,
+    sort_column,
+    id_column,
+    limit: int,
+    after: str | None = None,
+    descending: bool = False,
+):
+    """`query` narrowed to the rows after the `after` cursor, ordered and limited.
+
+    Pass `id_column=None` when `sort_column` is already unique in `query`.
+    """
+    columns = (sort_column,) if id_column is None else (sort_column, id_column)
+    if after:
+        values = decode_cursor(after, columns)
+
+        def beyond(column, value):
+            return column < value if descending else column > value
+
+        condition = beyond(sort_column, values[0])
+        if id_column is not None:
+            condition = condition | ((sort_column == values[0]) & beyond(id_column, values[1]))
+        query = query.filter(condition)
+
+    order = [column.desc() if descending else column for column in columns]
+    return query.order_by(None).order_by(*order).limit(limit)
+
+
+def paginate(
+    query,
+    sort_column,
+    id_column,
+    limit: int,
+    after: str | None = None,
+    descending: bool = False,
+) -> tuple[list, str | None]:
+    """Return one page of `query` and the cursor of the next page (None on the last).
+
+    `query` is an ORM query or a Core `select()`, whose rows come back as `Row`s.
+    """
+    # One extra row tells us whether another page follows, without a COUNT
+    page = keyset_query(query, sort_column, id_column, limit + 1, after, descending)
+    rows = (db.session.execute(page) if isinstance(page, Select) else page).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    columns = (sort_column,) if id_column is None else (sort_column, id_column)
+    return rows, encode_cursor(*(getattr(last, column.key) for column in columns))
+
+
+def paginate_ranked(hits: list, limit: int, after: str | None = None) -> tuple[list, str | None]:
+    """`paginate` for ranked results already in memory, by descending `(rank, id)`.
+
+    Cursors are interchangeable with those of a ranked query paginated with
+    `descending=True`.
+    """
+    hits = sorted(hits, key=lambda hit: (hit.rank, hit.id), reverse=True)
+    if after:
+        key = tuple(decode_cursor(after, _RANK_KEY))
+        hits = [hit for hit in hits if (hit.rank, hit.id) < key]
+    if len(hits) <= limit:
+        return hits, None
+
+    hits = hits[:limit]
+    return hits, encode_cursor(hits[-1].rank, hits[-1].id)
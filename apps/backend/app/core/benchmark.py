@@ -0,0 +1,351 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+
+from config import CHROMA_PATH, DATA_DIRECTORY, EMBEDDINGS_PROVIDER, RETRIEVAL_MODE, TOP_K
+
+from ..services.logger import get_logger
+from .ingest import get_all_source_files
+from .rag.doc_index import DOC_INDEX_FILE, DocumentIndex
+from .rag.loader import DocumentLoader
+from .rag.providers import EMBEDDING_PROVIDERS
+from .rag.retriever import Retriever
+from .rag.splitter import DocumentSplitter
+from .rag.tokens import content_terms, estimate_tokens
+from .rag.vectorstore import VectorStore
+
+logger = get_logger(__name__)
+
+FAQ_FILES = ("cat03_admissions_faqs.json", "cat10_master_faqs.json")
+RETRIEVAL_MODES = ("similarity", "scored", "mmr")
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def find_data_files(names: tuple[str, ...] = FAQ_FILES) -> list[str]:
+    """Locate files by name anywhere under `DATA_DIRECTORY`."""
+    found = []
+    for root, _, filenames in os.walk(DATA_DIRECTORY):
+        found.extend(os.path.join(root, f) for f in filenames if f in names)
+    return sorted(found)
+
+
+def load_faq_questions(paths: list[str]) -> list[str]:
+    """Return the `question` field of every entry in the given FAQ JSON files."""
+    questions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            questions.extend(item["question"] for item in json.load(f) if item.get("question"))
+    return questions
+
+
+def _relative(source: str | None, root: str) -> str:
+    return os.path.relpath(source, root) if source else ""
+
+
+def build_golden_set(
+    faq_paths: list[str],
+    corpus_files: list[str],
+    root: str = DATA_DIRECTORY,
+    min_coverage: float = 0.5,
+    max_sources: int = 3,
+) -> list[dict]:
+    """Seed question -> expected-source pairs from FAQ entries.
+
+    An FAQ answer is located in the corpus by content-word overlap: every
+    file is scored by its best paragraph's share of the answer's terms, and
+    the files within 90% of the best score (at most `max_sources`) are the
+    expected sources. Entries whose answer isn't found (best coverage below
+    `min_coverage`) are dropped. Sources are stored relative to `root` so the
+    set can be written out, reviewed and pinned.
+    """
+    passages = {}
+    for path in corpus_files:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            paragraphs = [p for p in _PARAGRAPH_RE.split(f.read()) if p.strip()]
+        passages[path] = [content_terms(p) for p in paragraphs]
+
+    golden = []
+    for faq_path in faq_paths:
+        with open(faq_path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            terms = content_terms(entry.get("answer") or "")
+            if not entry.get("question") or not terms:
+                continue
+            coverage = {
+                path: max(len(terms & p) / len(terms) for p in paragraphs)
+                for path, paragraphs in passages.items()
+                if paragraphs
+            }
+            best = max(coverage.values(), default=0.0)
+            if best < min_coverage:
+                continue
+            sources = sorted((p for p, c in coverage.items() if c >= best * 0.9), key=coverage.get)
+            golden.append(
+                {
+                    "id": entry.get("id"),
+                    "question": entry["question"],
+                    "expected_sources": [
+                        _relative(p, root) for p in reversed(sources[-max_sources:])
+                    ],
+                }
+            )
+    return golden
+
+
+def benchmark_corpus_files() -> list[str]:
+    """Every ingestible file except the FAQ files the golden set is drawn from."""
+    return sorted(f for f in get_all_source_files() if os.path.basename(f) not in FAQ_FILES)
+
+
+def latency_summary(latencies_s: list[float], percentiles: tuple[int, ...] = (50, 95)) -> dict:
+    """Percentiles (p50/p95 by default) and mean of a list of latencies, in milliseconds."""
+    if not latencies_s:
+        return {**{f"p{p}_ms": 0.0 for p in percentiles}, "mean_ms": 0.0}
+    ms = np.asarray(latencies_s) * 1000
+    return {
+        **{f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in percentiles},
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def benchmark_hierarchical(
+    vector_store: VectorStore,
+    doc_index: DocumentIndex,
+    queries: list[str],
+    k: int = TOP_K,
+    top_files: tuple[int, ...] = (1, 3, 5, 10),
+) -> dict:
+    """Compare two-stage (file, then chunk) retrieval against flat chunk search.
+
+    Each query is embedded once and the same embedding is used for every
+    variant, so latencies cover search only. Recall is measured against the
+    flat top-k: the share of flat results that hierarchical search also
+    returns.
+    """
+    flat_latencies = []
+    variants = {m: {"latencies": [], "recall": []} for m in top_files}
+
+    for query in queries:
+        embedding = vector_store.embeddings.embed_query(query)
+
+        start = time.perf_counter()
+        flat = vector_store.search(query, K=k, embedding=embedding)
+        flat_latencies.append(time.perf_counter() - start)
+        flat_ids = {doc.id for doc in flat}
+
+        for m, stats in variants.items():
+            start = time.perf_counter()
+            sources = [s for s, _ in doc_index.top_sources(embedding, m)]
+            results = vector_store.search(query, K=k, sources=sources, embedding=embedding)
+            stats["latencies"].append(time.perf_counter() - start)
+            if flat_ids:
+                stats["recall"].append(len(flat_ids & {doc.id for doc in results}) / len(flat_ids))
+
+    return {
+        "queries": len(queries),
+        "k": k,
+        "files_indexed": len(doc_index),
+        "flat": latency_summary(flat_latencies),
+        "hierarchical": [
+            {
+                "top_files": m,
+                "recall_vs_flat": round(float(np.mean(stats["recall"])), 4)
+                if stats["recall"]
+                else None,
+                **latency_summary(stats["latencies"]),
+            }
+            for m, stats in variants.items()
+        ],
+    }
+
+
+def evaluate_retrieval(
+    retriever: Retriever, golden: list[dict], root: str = DATA_DIRECTORY
+) -> dict:
+    """Score `retriever` on a golden set.
+
+    recall@k is the share of a question's expected sources present in the
+    retrieved chunks, MRR uses the rank of the first chunk from an expected
+    source, and context tokens estimate what the chunks add to the prompt.
+    """
+    latencies, recalls, reciprocal_ranks, context_tokens = [], [], [], []
+    for item in golden:
+        expected = set(item["expected_sources"])
+        start = time.perf_counter()
+        docs = retriever.retrieve(item["question"])
+        latencies.append(time.perf_counter() - start)
+
+        sources = [_relative(doc.metadata.get("source"), root) for doc in docs]
+        recalls.append(len(expected & set(sources)) / len(expected))
+        rank = next((i for i, source in enumerate(sources, 1) if source in expected), None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        context_tokens.append(estimate_tokens("\n\n".join(doc.page_content for doc in docs)))
+
+    def mean(values):
+        return round(float(np.mean(values)), 4) if values else 0.0
+
+    return {
+        "recall_at_k": mean(recalls),
+        "mrr": mean(reciprocal_ranks),
+        "hit_rate": mean([rr > 0 for rr in reciprocal_ranks]),
+        "context_tokens_mean": round(float(np.mean(context_tokens)), 1) if context_tokens else 0.0,
+        "context_tokens_p95": round(float(np.percentile(context_tokens, 95)), 1)
+        if context_tokens
+        else 0.0,
+        **latency_summary(latencies),
+    }
+
+
+def sweep_retrieval(
+    golden: list[dict],
+    files: list[str],
+    model: str = "stub",
+    chunk_sizes: tuple[int, ...] = (500,),
+    overlaps: tuple[int, ...] = (100,),
+    top_ks: tuple[int, ...] = (TOP_K,),
+    modes: tuple[str, ...] = (RETRIEVAL_MODE,),
+    root: str = DATA_DIRECTORY,
+) -> dict:
+    """Evaluate every chunk size x overlap x top-k x mode combination.
+
+    Each chunking configuration is indexed into a throwaway Chroma
+    directory with the `model` embedding provider ("stub", "hash" or
+    "local" run offline); top-k and mode are then swept over that index.
+    """
+    documents = DocumentLoader(file_paths=files).load()
+    runs = []
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        if overlap >= chunk_size:
+            logger.warning(f"Skipping chunk_size={chunk_size}: overlap {overlap} is not smaller")
+            continue
+        splitter = DocumentSplitter(model, chunk_overlap=overlap, chunk_size=chunk_size)
+        chunks = splitter.split(documents)
+        with tempfile.TemporaryDirectory() as td:
+            store = VectorStore(persist_directory=td, use_model=model, quantized=False)
+            start = time.perf_counter()
+            store.add_documents([str(i) for i in range(len(chunks))], None, chunks)
+            index_s = time.perf_counter() - start
+            logger.info(f"Indexed {len(chunks)} chunks (size {chunk_size}, overlap {overlap})")
+
+            for top_k, mode in itertools.product(top_ks, modes):
+                retriever = Retriever(store, top_k=top_k, mode=mode, score_log_path=None)
+                runs.append(
+                    {
+                        "chunk_size": chunk_size,
+                        "chunk_overlap": overlap,
+                        "top_k": top_k,
+                        "mode": mode,
+                        "chunks": len(chunks),
+                        "index_s": round(index_s, 3),
+                        **evaluate_retrieval(retriever, golden, root),
+                    }
+                )
+    return {"model": model, "questions": len(golden), "files": len(files), "runs": runs}
+
+
+def compare_reports(baseline: dict, report: dict) -> list[dict]:
+    """Per-configuration change in recall, MRR and p95 latency against `baseline`."""
+
+    def key(run):
+        return run["chunk_size"], run["chunk_overlap"], run["top_k"], run["mode"]
+
+    previous = {key(run): run for run in baseline.get("runs", [])}
+    deltas = []
+    for run in report["runs"]:
+        before = previous.get(key(run))
+        if before is None:
+            continue
+        deltas.append(
+            {
+                "chunk_size": run["chunk_size"],
+                "chunk_overlap": run["chunk_overlap"],
+                "top_k": run["top_k"],
+                "mode": run["mode"],
+                "recall_at_k": round(run["recall_at_k"] - before["recall_at_k"], 4),
+                "mrr": round(run["mrr"] - before["mrr"], 4),
+                "p95_ms": round(run["p95_ms"] - before["p95_ms"], 3),
+            }
+        )
+    return deltas
+
+
+if __name__ == "__main__":
+    # Run using python -m app.core.benchmark retrieval --model stub --chunk-sizes 500 1000
+    # or python -m app.core.benchmark hierarchical --model hf
+    parser = argparse.ArgumentParser(description="UniPal Retrieval Benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    hierarchical = subparsers.add_parser(
+        "hierarchical", help="Two-stage vs flat retrieval recall and latency"
+    )
+    hierarchical.add_argument(
+        "--model", type=str, default=EMBEDDINGS_PROVIDER, choices=list(EMBEDDING_PROVIDERS)
+    )
+    hierarchical.add_argument("--k", type=int, default=TOP_K)
+    hierarchical.add_argument("--top-files", type=int, nargs="+", default=[1, 3, 5, 10])
+    hierarchical.add_argument("--limit", type=int, default=None, help="Max queries to run")
+    hierarchical.add_argument("--output", type=str, default=None, help="Write JSON here")
+
+    golden_cmd = subparsers.add_parser(
+        "golden", help="Seed the question -> expected-source set from the FAQ files"
+    )
+    golden_cmd.add_argument("--output", type=str, default=None, help="Write JSON here")
+
+    retrieval = subparsers.add_parser(
+        "retrieval", help="recall@k, MRR, context tokens and latency over a parameter sweep"
+    )
+    retrieval.add_argument("--model", type=str, default="stub", choices=list(EMBEDDING_PROVIDERS))
+    retrieval.add_argument("--golden", type=str, default=None, help="Golden set JSON to use")
+    retrieval.add_argument("--chunk-sizes", type=int, nargs="+", default=[500])
+    retrieval.add_argument("--overlaps", type=int, nargs="+", default=[100])
+    retrieval.add_argument("--top-k", type=int, nargs="+", default=[TOP_K])
+    retrieval.add_argument(
+        "--modes", type=str, nargs="+", default=[RETRIEVAL_MODE], choices=RETRIEVAL_MODES
+    )
+    retrieval.add_argument("--limit", type=int, default=None, help="Max questions to run")
+    retrieval.add_argument("--baseline", type=str, default=None, help="Report to compare with")
+    retrieval.add_argument("--output", type=str, default=None, help="Write JSON here")
+    args = parser.parse_args()
+
+    if args.command == "golden":
+        report = build_golden_set(find_data_files(), benchmark_corpus_files())
+    elif args.command == "retrieval":
+        if args.golden:
+            with open(args.golden, encoding="utf-8") as f:
+                golden_set = json.load(f)
+        else:
+            golden_set = build_golden_set(find_data_files(), benchmark_corpus_files())
+        report = sweep_retrieval(
+            golden_set[: args.limit],
+            benchmark_corpus_files(),
+            model=args.model,
+            chunk_sizes=tuple(args.chunk_sizes),
+            overlaps=tuple(args.overlaps),
+            top_ks=tuple(args.top_k),
+            modes=tuple(args.modes),
+        )
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                report["vs_baseline"] = compare_reports(json.load(f), report)
+    elif args.command == "hierarchical":
+        store = VectorStore(use_model=args.model)
+        index = DocumentIndex(os.path.join(CHROMA_PATH, args.model, DOC_INDEX_FILE))
+        if not len(index):
+            parser.error("Document index is empty; run ingestion with --document-index first")
+        questions = load_faq_questions(find_data_files())[: args.limit]
+        report = benchmark_hierarchical(store, index, questions, args.k, tuple(args.top_files))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        logger.info(f"Benchmark report written to {args.output}")
+    else:
+        print(output)
@@ -2,11 +2,26 @@ import argparse
 import hashlib
 import json
 import os
-
-from config import CHROMA_PATH, DATA_DIRECTORY
+import time
+
+from config import (
+    CHROMA_PATH,
+    DATA_DIRECTORY,
+    EMBEDDINGS_PROVIDER,
+    HIERARCHICAL_RETRIEVAL,
+    INDEX_DIMENSIONS,
+    INDEX_REDUCTION,
+    PARENT_DOCUMENTS,
+    TOP_K,
+    VECTOR_INDEX,
+)
 
 from ..services.logger import get_logger
+from .rag.doc_index import DOC_INDEX_FILE, DocumentIndex, summary_text, summary_vector
 from .rag.loader import DocumentLoader
+from .rag.parents import PARENT_STORE_FILE, ParentStore
+from .rag.providers import EMBEDDING_PROVIDERS
+from .rag.quantize import QUANTIZED_INDEX_FILE, REDUCTIONS, QuantizedIndex, recall_report
 from .rag.splitter import DocumentSplitter
 from .rag.vectorstore import VectorStore
 
@@ -74,12 +89,90 @@ def resolve_changes(all_files: list[str], hash_store: dict) -> tuple[list, list,
     return changed, deleted, current_hashes
 
 
-def ingest(model: str = "hf"):
+def update_document_index(
+    vector_store: VectorStore, doc_index: DocumentIndex, sources: list[str]
+) -> int:
+    """Recompute the file-level summary embedding of each source.
+
+    The summary combines an embedding of the file's title and headers with
+    the mean of its stored chunk embeddings, so only one extra embedding call
+    is made per file. Returns the number of files indexed.
+    """
+    indexed = 0
+    for source in sources:
+        try:
+            metadatas, embeddings = vector_store.get_source_chunks(source)
+            if not metadatas:
+                doc_index.remove(source)
+                continue
+            header_embedding = vector_store.embeddings.embed_query(summary_text(source, metadatas))
+            doc_index.upsert(source, summary_vector(header_embedding, embeddings))
+            indexed += 1
+        except Exception as e:
+            logger.error(f"Failed to build document summary for {source}: {e}")
+    doc_index.save()
+    logger.info(f"Document index updated for {indexed} file(s); {len(doc_index)} files indexed")
+    return indexed
+
+
+def build_quantized_index(
+    vector_store: VectorStore,
+    reduction: str = INDEX_REDUCTION,
+    dimensions: int | None = INDEX_DIMENSIONS,
+) -> dict:
+    """Rebuild the int8 index from every embedding in Chroma and measure its recall.
+
+    Returns the recall@k / size comparison against full precision, for the
+    ingest report.
+    """
+    ids, sources, vectors = vector_store.get_all_embeddings()
+    if not ids:
+        return {}
+    index = QuantizedIndex.build(ids, sources, vectors, reduction, dimensions)
+    index.save(os.path.join(vector_store.persist_directory, QUANTIZED_INDEX_FILE))
+    report = recall_report(
+        index,
+        vectors,
+        k=TOP_K,
+        rescore_factor=vector_store.rescore_factor,
+        metric=vector_store.distance_metric(),
+    )
+    logger.info(
+        f"Quantized index built: {report['dimensions']} dims, "
+        f"{report['float32_bytes']} -> {report['index_bytes']} bytes, "
+        f"recall@{report['k']} int8={report['recall_at_k_int8']} "
+        f"rescored={report['recall_at_k_rescored']}"
+    )
+    return report
+
+
+def write_ingest_report(model: str, report: dict):
+    path = os.path.join(CHROMA_PATH, model, "ingest_report.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Ingest report written to {path}")
+
+
+def ingest(
+    model: str = EMBEDDINGS_PROVIDER,
+    parent_documents: bool = PARENT_DOCUMENTS,
+    document_index: bool = HIERARCHICAL_RETRIEVAL,
+    quantize: bool = VECTOR_INDEX == "quantized",
+    reduction: str = INDEX_REDUCTION,
+    dimensions: int | None = INDEX_DIMENSIONS,
+):
     """Incremental ingestion pipeline.
 
     - Skips files that haven't changed since the last run (saves embedding API calls)
     - Upserts changed/new files using deterministic chunk IDs (no duplicates)
     - Cleans up chunks from deleted files
+    - With `parent_documents`, stores markdown sections in the parent store and
+      embeds only their child chunks
+    - With `document_index`, keeps a per-file summary embedding for two-stage
+      (hierarchical) retrieval up to date, backfilling files not yet indexed
+    - With `quantize`, rebuilds the int8 vector index and records its recall
+      against full precision in `ingest_report.json`
     """
     logger.info("Starting ingestion process...")
 
@@ -93,16 +186,46 @@ def ingest(model: str = "hf"):
 
     changed_files, deleted_files, current_hashes = resolve_changes(all_files, hash_store)
     vector_store = VectorStore(use_model=model)
+    parent_store = (
+        ParentStore.shared(os.path.join(CHROMA_PATH, model, PARENT_STORE_FILE))
+        if parent_documents
+        else None
+    )
+    doc_index = (
+        DocumentIndex(os.path.join(CHROMA_PATH, model, DOC_INDEX_FILE)) if document_index else None
+    )
 
     # Clean up chunks from deleted source files
     if deleted_files:
         logger.info(f"{len(deleted_files)} file(s) deleted — removing their chunks...")
         for filepath in deleted_files:
             vector_store.delete_by_source(filepath)
+            if parent_store is not None:
+                parent_store.delete_by_source(filepath)
+            if doc_index is not None:
+                doc_index.remove(filepath)
+
+    report = {
+        "ts": time.time(),
+        "model": model,
+        "files": {
+            "total": len(all_files),
+            "changed": len(changed_files),
+            "deleted": len(deleted_files),
+        },
+    }
+    quantized_path = os.path.join(vector_store.persist_directory, QUANTIZED_INDEX_FILE)
 
     if not changed_files:
         logger.info("All files are up to date. Nothing to ingest.")
         save_hash_store(hash_store, hash_store_path)
+        if doc_index is not None:
+            missing = [f for f in all_files if f not in doc_index]
+            if missing or deleted_files:
+                update_document_index(vector_store, doc_index, missing)
+        if quantize and (deleted_files or not os.path.exists(quantized_path)):
+            report["vector_index"] = build_quantized_index(vector_store, reduction, dimensions)
+            write_ingest_report(model, report)
         return
 
     logger.info(f"{len(changed_files)} file(s) changed or new: {changed_files}")
@@ -122,7 +245,11 @@ def ingest(model: str = "hf"):
             failed_files.append(filepath)
             continue
 
-        chunks = splitter.split(documents)
+        parents = {}
+        if parent_store is not None:
+            parents, chunks = splitter.split_with_parents(documents)
+        else:
+            chunks = splitter.split(documents)
         if not chunks:
             logger.warning(f"Splitter produced no chunks for: {filepath}. Skipping.")
             failed_files.append(filepath)
@@ -138,6 +265,9 @@ def ingest(model: str = "hf"):
         ]
 
         try:
+            if parent_store is not None:
+                parent_store.delete_by_source(filepath)
+                parent_store.put_many(parents)
             upserted = vector_store.add_documents(ids, None, chunks)
             total_upserted += upserted or 0
             # Only mark file as succeeded if all file chunks were upserted
@@ -156,6 +286,18 @@ def ingest(model: str = "hf"):
     # Persist updated hash store only for files that succeeded
     save_hash_store(hash_store, hash_store_path)
 
+    if doc_index is not None:
+        missing = [f for f in all_files if f not in doc_index and f not in failed_files]
+        update_document_index(
+            vector_store, doc_index, list(dict.fromkeys(succeeded_files + missing))
+        )
+
+    if quantize:
+        report["vector_index"] = build_quantized_index(vector_store, reduction, dimensions)
+    report["files"].update(succeeded=len(succeeded_files), failed=len(failed_files))
+    report["chunks_upserted"] = total_upserted
+    write_ingest_report(model, report)
+
     logger.info(
         f"Ingestion finished. {total_upserted} chunks upserted. "
         f"Succeeded: {len(succeeded_files)} files. Failed: {len(failed_files)} files."
@@ -165,6 +307,35 @@ def ingest(model: str = "hf"):
 if __name__ == "__main__":
     # Run using python -m app.core.ingest --model hf
     parser = argparse.ArgumentParser(description="UniPal Ingestion Script")
-    parser.add_argument("--model", type=str, default="hf", choices=["hf", "gemini"])
+    parser.add_argument(
+        "--model", type=str, default=EMBEDDINGS_PROVIDER, choices=list(EMBEDDING_PROVIDERS)
+    )
+    parser.add_argument(
+        "--parent-documents",
+        action=argparse.BooleanOptionalAction,
+        default=PARENT_DOCUMENTS,
+        help="Embed small child chunks and store whole markdown sections as parents",
+    )
+    parser.add_argument(
+        "--document-index",
+        action=argparse.BooleanOptionalAction,
+        default=HIERARCHICAL_RETRIEVAL,
+        help="Build the per-file summary index used by hierarchical retrieval",
+    )
+    parser.add_argument(
+        "--quantize",
+        action=argparse.BooleanOptionalAction,
+        default=VECTOR_INDEX == "quantized",
+        help="Build the int8 vector index and report its recall against full precision",
+    )
+    parser.add_argument("--reduction", type=str, default=INDEX_REDUCTION, choices=REDUCTIONS)
+    parser.add_argument("--dimensions", type=int, default=INDEX_DIMENSIONS)
     args = parser.parse_args()
-    ingest(model=args.model)
+    ingest(
+        model=args.model,
+        parent_documents=args.parent_documents,
+        document_index=args.document_index,
+        quantize=args.quantize,
+        reduction=args.reduction,
+        dimensions=args.dimensions,
+    )
@@ -0,0 +1,302 @@
+from datetime import datetime, timedelta
+import json
+import random
+import threading
+import time
+
+from langchain_core.documents import Document
+import numpy as np
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from .. import db
+from ..models import Chat, Message, User
+from ..services.logger import get_logger
+from .benchmark import find_data_files, latency_summary
+
+logger = get_logger(__name__)
+
+LOADTEST_PASSWORD = "LoadTest123"
+API_PREFIX = "/api/v1"
+
+# Relative weight of each endpoint in the request mix
+DEFAULT_MIX = {
+    "POST /chat/<id>/message": 3,
+    "GET /history/chat/<id>/messages": 3,
+    "GET /history/chats": 2,
+    "GET /history/search": 1,
+    "GET /auth/me": 1,
+    "POST /auth/login": 1,
+}
+SEARCH_TERMS = ("fee", "hostel", "admission", "library", "exam", "curfew", "scholarship")
+FALLBACK_TURNS = [
+    (
+        "What time does the library close?",
+        "The main library closes at 10pm on weekdays and 6pm on Sundays.",
+    ),
+    (
+        "How do I pay my school fees?",
+        "Fees are paid online through the student portal or at the bursary.",
+    ),
+]
+
+
+def load_conversation_turns() -> list[tuple[str, str]]:
+    """FAQ question/answer pairs, used as realistic chat turns."""
+    turns = []
+    for path in find_data_files():
+        with open(path, encoding="utf-8") as f:
+            turns.extend(
+                (item["question"], item["answer"])
+                for item in json.load(f)
+                if item.get("question") and item.get("answer")
+            )
+    return turns or FALLBACK_TURNS
+
+
+def seed_database(
+    users: int = 20,
+    chats_per_user: int = 5,
+    messages_per_chat: int = 20,
+    turns: list[tuple[str, str]] | None = None,
+    seed: int = 0,
+) -> list[dict]:
+    """Insert confirmed users with chats full of alternating user/assistant messages.
+
+    Must run inside an app context. Every user's password is
+    `LOADTEST_PASSWORD`; it is hashed once, since a hash per user would
+    dominate seeding time. Returns one account dict per user (email,
+    user_id, chat_ids) for the load test to drive.
+    """
+    turns = turns or load_conversation_turns()
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(LOADTEST_PASSWORD)
+    now = datetime.now()
+    accounts = []
+
+    for i in range(users):
+        user = User(
+            full_name=f"Load Test Student {i}",
+            username=f"loadtest{i}",
+            email=f"loadtest{i}@example.com",
+            password_hash=password_hash,
+            is_confirmed=True,
+            created_at=now - timedelta(days=90),
+        )
+        db.session.add(user)
+        chats = []
+        for c in range(chats_per_user):
+            started = now - timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 1440))
+            chat = Chat(user=user, title=f"Conversation {c + 1}", created_at=started)
+            db.session.add(chat)
+            chats.append(chat)
+            for m in range(0, messages_per_chat, 2):
+                question, answer = rng.choice(turns)
+                pair = (("user", question), ("assistant", answer))
+                for offset, (role, content) in enumerate(pair[: messages_per_chat - m]):
+                    db.session.add(
+                        Message(
+                            chat=chat,
+                            role=role,
+                            content=content,
+                            timestamp=started + timedelta(seconds=30 * (m + offset)),
+                        )
+                    )
+        db.session.commit()
+        accounts.append(
+            {"email": user.email, "user_id": user.id, "chat_ids": [chat.id for chat in chats]}
+        )
+
+    logger.info(
+        f"Seeded {users} users, {users * chats_per_user} chats and "
+        f"{users * chats_per_user * messages_per_chat} messages"
+    )
+    return accounts
+
+
+def seed_vector_store(vector_store, turns: list[tuple[str, str]] | None = None) -> int:
+    """Index the FAQ turns so chat requests retrieve context and reach the LLM."""
+    turns = turns or load_conversation_turns()
+    docs = [
+        Document(page_content=f"{question}\n{answer}", metadata={"source": "loadtest/faqs.json"})
+        for question, answer in turns
+    ]
+    return vector_store.add_documents([f"loadtest-{i}" for i in range(len(docs))], None, docs)
+
+
+class QueryCounter:
+    """Count SQL statements executed on `engine`, per thread.
+
+    The Flask test client serves a request on the calling thread, so a
+    worker's count between `reset()` and `count` is that request's queries.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._local = threading.local()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self) -> int:
+        return getattr(self._local, "count", 0)
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class LoadTest:
+    """Drive the API in-process with `concurrency` worker threads.
+
+    Each worker logs in as one of the seeded `accounts`, then issues
+    requests drawn from `mix` (endpoint -> weight) until `requests` have
+    been sent in total or `duration_s` has passed. Latency, status and SQL
+    query count are recorded per request and summarised per endpoint by
+    `run()`.
+    """
+
+    def __init__(
+        self,
+        app,
+        accounts: list[dict],
+        concurrency: int = 8,
+        requests: int = 500,
+        duration_s: float | None = None,
+        mix: dict[str, int] | None = None,
+        search_terms: tuple[str, ...] = SEARCH_TERMS,
+        seed: int = 0,
+    ):
+        self.app = app
+        self.accounts = accounts
+        self.concurrency = concurrency
+        self.requests = requests
+        self.duration_s = duration_s
+        self.mix = mix or DEFAULT_MIX
+        self.search_terms = search_terms
+        self.seed = seed
+        self.questions = [question for question, _ in load_conversation_turns()]
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+        self._results: dict[str, list[tuple[float, int, int]]] = {}
+
+    def _take_ticket(self) -> bool:
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return False
+        with self._lock:
+            if self.duration_s is None and self._issued >= self.requests:
+                return False
+            self._issued += 1
+            return True
+
+    def _record(self, endpoint: str, latency: float, status: int, queries: int):
+        with self._lock:
+            self._results.setdefault(endpoint, []).append((latency, status, queries))
+
+    def _send(self, client, endpoint: str, account: dict, auth: dict, rng: random.Random):
+        headers = {"Authorization": f"Bearer {auth.get('access_token')}"}
+        chat_id = rng.choice(account["chat_ids"]) if account["chat_ids"] else "missing"
+        if endpoint == "POST /auth/login":
+            return client.post(
+                f"{API_PREFIX}/auth/login",
+                json={"email": account["email"], "password": LOADTEST_PASSWORD},
+            )
+        if endpoint == "GET /auth/me":
+            return client.get(f"{API_PREFIX}/auth/me", headers=headers)
+        if endpoint == "GET /history/chats":
+            return client.get(f"{API_PREFIX}/history/chats", headers=headers)
+        if endpoint == "GET /history/chat/<id>/messages":
+            return client.get(f"{API_PREFIX}/history/chat/{chat_id}/messages", headers=headers)
+        if endpoint == "GET /history/search":
+            term = rng.choice(self.search_terms)
+            return client.get(f"{API_PREFIX}/history/search?q={term}", headers=headers)
+        if endpoint == "POST /chat/<id>/message":
+            return client.post(
+                f"{API_PREFIX}/chat/{chat_id}/message",
+                json={"content": rng.choice(self.questions)},
+                headers=headers,
+            )
+        raise ValueError(f"Unknown load-test endpoint {endpoint!r}")
+
+    def _call(self, client, endpoint, account, auth, rng, counter):
+        counter.reset()
+        start = time.perf_counter()
+        try:
+            response = self._send(client, endpoint, account, auth, rng)
+            status = response.status_code
+        except Exception as e:
+            logger.error(f"Load-test request {endpoint} raised: {e}")
+            response, status = None, 599
+        self._record(endpoint, time.perf_counter() - start, status, counter.count)
+        return response
+
+    def _worker(self, index: int, counter: QueryCounter):
+        rng = random.Random(self.seed + index)
+        account = self.accounts[index % len(self.accounts)]
+        client = self.app.test_client()
+        endpoints, weights = list(self.mix), list(self.mix.values())
+
+        auth = {}
+        if self._take_ticket():
+            response = self._call(client, "POST /auth/login", account, auth, rng, counter)
+            auth = (response.get_json(silent=True) or {}) if response is not None else {}
+        while self._take_ticket():
+            endpoint = rng.choices(endpoints, weights)[0]
+            response = self._call(client, endpoint, account, auth, rng, counter)
+            if (
+                endpoint == "POST /auth/login"
+                and response is not None
+                and response.status_code == 200
+            ):
+                auth = response.get_json(silent=True) or auth
+
+    def run(self) -> dict:
+        counter = QueryCounter(db.engine)
+        self._issued, self._results = 0, {}
+        start = time.perf_counter()
+        self._deadline = start + self.duration_s if self.duration_s else None
+        workers = [
+            threading.Thread(target=self._worker, args=(i, counter), name=f"loadtest-{i}")
+            for i in range(self.concurrency)
+        ]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            counter.close()
+        elapsed = time.perf_counter() - start
+        return self.report(elapsed)
+
+    def report(self, elapsed_s: float) -> dict:
+        endpoints = {}
+        for endpoint, results in sorted(self._results.items()):
+            latencies = [latency for latency, _, _ in results]
+            statuses = [status for _, status, _ in results]
+            queries = np.asarray([q for _, _, q in results])
+            endpoints[endpoint] = {
+                "requests": len(results),
+                "errors": sum(status >= 400 for status in statuses),
+                "status": {str(s): statuses.count(s) for s in sorted(set(statuses))},
+                "throughput_rps": round(len(results) / elapsed_s, 2) if elapsed_s else 0.0,
+                **latency_summary(latencies, percentiles=(50, 95, 99)),
+                "db_queries_mean": round(float(queries.mean()), 2),
+                "db_queries_p95": round(float(np.percentile(queries, 95)), 2),
+                "db_queries_max": int(queries.max()),
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "concurrency": self.concurrency,
+            "users": len(self.accounts),
+            "duration_s": round(elapsed_s, 3),
+            "requests": total,
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": round(total / elapsed_s, 2) if elapsed_s else 0.0,
+            "endpoints": endpoints,
+        }
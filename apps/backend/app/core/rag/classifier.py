@@ -0,0 +1,138 @@
+from collections import deque
+import json
+import os
+import re
+import threading
+import time
+
+from config import GENERATION_STATS_LOG
+
+from ...services.logger import get_logger
+
+logger = get_logger(__name__)
+
+FACTUAL = "factual"
+PROCEDURAL = "procedural"
+OPEN_ENDED = "open_ended"
+QUERY_CLASSES = (FACTUAL, PROCEDURAL, OPEN_ENDED)
+
+_PROCEDURAL_RE = re.compile(
+    r"\b(how (do|can|should|would) (i|we|one|students?)|how to|steps?|procedures?|process"
+    r"|apply|application|register|registration|enrol|enroll|request|obtain|renew|change my"
+    r"|what do i need|requirements? for)\b"
+)
+_OPEN_ENDED_RE = re.compile(
+    r"\b(explain|describe|tell me (about|more)|overview|compare|comparison|difference"
+    r"|why|advice|advise|recommend|pros and cons|opinion|history of|what is it like)\b"
+)
+_FACTUAL_RE = re.compile(
+    r"^(what time|when|where|who|whom|which|how (much|many|long|far|old)"
+    r"|what is the|what's the|what are the|is there|are there|is it|does|do they|can i)\b"
+)
+# Openings that ask for a single fact even when the question names a process
+# ("how much is the application fee?", "when does registration close?")
+_LOOKUP_RE = re.compile(r"^(what time|when|where|who|whom|which|how (much|many|long|far|old))\b")
+
+# Questions longer than this (in words) are treated as open-ended unless clearly procedural
+_LONG_QUERY_WORDS = 30
+
+
+class QueryClassifier:
+    """Rule-based classifier that buckets a question by expected answer length.
+
+    - factual: short lookups ("what time is curfew?", "how much is tuition?")
+    - procedural: how-to questions answered with a few steps
+    - open_ended: explanations, comparisons and advice
+
+    It runs locally in microseconds, so it can be applied to every request.
+    """
+
+    def classify(self, query: str) -> str:
+        text = " ".join(query.lower().split())
+        words = len(text.split())
+
+        if _LOOKUP_RE.search(text) and words <= _LONG_QUERY_WORDS:
+            return FACTUAL
+        if _PROCEDURAL_RE.search(text) and words <= _LONG_QUERY_WORDS:
+            return PROCEDURAL
+        if _OPEN_ENDED_RE.search(text) or words > _LONG_QUERY_WORDS:
+            return OPEN_ENDED
+        if _FACTUAL_RE.search(text) or words <= 12:
+            return FACTUAL
+        return OPEN_ENDED
+
+
+class GenerationStats:
+    """Thread-safe per-class record of generation output size and latency.
+
+    Keeps the most recent `window` samples per class for percentile
+    estimates, plus running counts, and optionally appends every sample to a
+    JSONL file for offline budget tuning.
+    """
+
+    def __init__(self, window: int = 500, log_path: str | None = GENERATION_STATS_LOG):
+        self.window = window
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque] = {}
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(
+        self,
+        query_class: str,
+        output_tokens: int,
+        latency_s: float,
+        max_output_tokens: int | None = None,
+        truncated: bool = False,
+    ):
+        with self._lock:
+            samples = self._samples.setdefault(query_class, deque(maxlen=self.window))
+            samples.append((output_tokens, latency_s))
+            counts = self._counts.setdefault(query_class, {"requests": 0, "truncated": 0})
+            counts["requests"] += 1
+            counts["truncated"] += int(truncated)
+
+        if self.log_path:
+            record = {
+                "ts": time.time(),
+                "class": query_class,
+                "output_tokens": output_tokens,
+                "latency_s": round(latency_s, 4),
+                "max_output_tokens": max_output_tokens,
+                "truncated": truncated,
+            }
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            except Exception as e:
+                logger.error(f"Failed to export generation stats to {self.log_path}: {e}")
+
+    @staticmethod
+    def _percentile(values: list[float], pct: float) -> float:
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> dict[str, dict]:
+        """Return per-class counts and output-token / latency percentiles."""
+        with self._lock:
+            samples = {k: list(v) for k, v in self._samples.items()}
+            counts = {k: dict(v) for k, v in self._counts.items()}
+
+        out = {}
+        for query_class, values in samples.items():
+            tokens = [t for t, _ in values]
+            latencies = [lat for _, lat in values]
+            out[query_class] = {
+                **counts[query_class],
+                "output_tokens_p50": self._percentile(tokens, 50),
+                "output_tokens_p95": self._percentile(tokens, 95),
+                "latency_p50_s": round(self._percentile(latencies, 50), 4),
+                "latency_p95_s": round(self._percentile(latencies, 95), 4),
+            }
+        return out
+
+
+# Process-wide stats shared by all LLM instances
+generation_stats = GenerationStats()
@@ -0,0 +1,165 @@
+import re
+import time
+
+from langchain_core.documents import Document
+
+from config import COMPRESSION_LEXICAL_WEIGHT, COMPRESSION_MAX_TOKENS
+
+from ...services.logger import get_logger
+from .tokens import content_terms, estimate_tokens
+
+logger = get_logger(__name__)
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_TABLE_SEPARATOR_RE = re.compile(r"^\s*\|?\s*:?-{3,}")
+
+
+class _Span:
+    __slots__ = ("doc_index", "position", "text", "tokens", "score", "table_header")
+
+    def __init__(self, doc_index: int, position: int, text: str, table_header=None):
+        self.doc_index = doc_index
+        self.position = position
+        self.text = text
+        self.tokens = estimate_tokens(text) + 1  # +1 for the joining newline
+        self.score = 0.0
+        # For table rows: the (header, separator) spans that must travel with the row
+        self.table_header = table_header
+
+
+class ContextCompressor:
+    """Extractive compression of retrieved chunks before they reach the prompt.
+
+    Each chunk is broken into spans (markdown table rows, list items and
+    sentences). Spans are scored by lexical overlap with the query, blended
+    with the chunk's embedding relevance (`metadata["score"]` from scored
+    retrieval, or a rank prior otherwise), and the best spans are kept up to
+    `max_tokens`. Kept spans stay in their original order, and table rows keep
+    their header row so the LLM can still read the columns.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = COMPRESSION_MAX_TOKENS,
+        lexical_weight: float = COMPRESSION_LEXICAL_WEIGHT,
+    ):
+        self.max_tokens = max_tokens
+        self.lexical_weight = lexical_weight
+        self.last_stats: dict = {}
+
+    def _split_spans(self, doc_index: int, text: str) -> list[_Span]:
+        spans: list[_Span] = []
+        table_header = None
+        table_lines: list[_Span] = []
+
+        for line in text.splitlines():
+            stripped = line.strip()
+            if not stripped:
+                table_header, table_lines = None, []
+                continue
+
+            if stripped.startswith("|"):
+                span = _Span(doc_index, len(spans), stripped)
+                if table_header is None:
+                    # First two lines of a table are the header and the |---| separator
+                    table_lines.append(span)
+                    spans.append(span)
+                    if _TABLE_SEPARATOR_RE.match(stripped) or len(table_lines) == 2:
+                        table_header = tuple(table_lines)
+                    continue
+                span.table_header = table_header
+                spans.append(span)
+                continue
+
+            table_header, table_lines = None, []
+            if stripped.startswith("#") or _LIST_ITEM_RE.match(stripped):
+                spans.append(_Span(doc_index, len(spans), stripped))
+                continue
+
+            for sentence in _SENTENCE_RE.split(stripped):
+                if sentence:
+                    spans.append(_Span(doc_index, len(spans), sentence))
+
+        return spans
+
+    def compress(self, query: str, docs: list[Document]) -> list[Document]:
+        """Return `docs` reduced to their most query-relevant spans.
+
+        Documents are returned unchanged when they already fit the budget.
+        Compression statistics for the call are kept on `last_stats`.
+        """
+        start = time.perf_counter()
+        input_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+
+        if not docs or input_tokens <= self.max_tokens:
+            self.last_stats = {
+                "input_tokens": input_tokens,
+                "output_tokens": input_tokens,
+                "ratio": 1.0,
+                "elapsed_ms": (time.perf_counter() - start) * 1000,
+            }
+            return docs
+
+        query_terms = content_terms(query)
+        spans_per_doc: list[list[_Span]] = []
+        candidates: list[_Span] = []
+
+        for i, doc in enumerate(docs):
+            relevance = doc.metadata.get("score")
+            relevance = 1.0 - i / len(docs) if relevance is None else float(relevance)
+
+            spans = self._split_spans(i, doc.page_content)
+            for span in spans:
+                lexical = (
+                    len(query_terms & content_terms(span.text)) / len(query_terms)
+                    if query_terms
+                    else 0.0
+                )
+                span.score = self.lexical_weight * lexical + (1 - self.lexical_weight) * relevance
+            spans_per_doc.append(spans)
+            candidates.extend(spans)
+
+        # Highest score first; ties go to earlier documents and earlier spans
+        candidates.sort(key=lambda s: (-s.score, s.doc_index, s.position))
+
+        kept: set[int] = set()
+        used = 0
+        for span in candidates:
+            if id(span) in kept:
+                continue
+            required = [span]
+            if span.table_header:
+                required.extend(h for h in span.table_header if id(h) not in kept)
+            cost = sum(s.tokens for s in required)
+            if used + cost > self.max_tokens:
+                continue
+            used += cost
+            kept.update(id(s) for s in required)
+
+        compressed = []
+        for doc, spans in zip(docs, spans_per_doc, strict=True):
+            selected = [s.text for s in spans if id(s) in kept]
+            if selected:
+                compressed.append(
+                    Document(
+                        page_content="\n".join(selected),
+                        metadata={**doc.metadata, "compressed": True},
+                    )
+                )
+
+        output_tokens = sum(estimate_tokens(doc.page_content) for doc in compressed)
+        self.last_stats = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "ratio": round(output_tokens / input_tokens, 3),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+        logger.info(
+            "Compressed context %d -> %d tokens (ratio %s, %.1f ms)",
+            input_tokens,
+            output_tokens,
+            self.last_stats["ratio"],
+            self.last_stats["elapsed_ms"],
+        )
+        return compressed
@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+
+from ...services.logger import get_logger
+from .filecache import FileCache
+from .mmr import normalize
+
+logger = get_logger(__name__)
+
+DOC_INDEX_FILE = "doc_index.npz"
+
+
+def summary_text(source: str, metadatas: list[dict]) -> str:
+    """Title and distinct section headers of a file, for its summary embedding."""
+    title = os.path.splitext(os.path.basename(source))[0].replace("_", " ")
+    headers = []
+    for meta in metadatas:
+        for key in ("Header_1", "Header_2", "Header_3"):
+            header = meta.get(key)
+            if header and header not in headers:
+                headers.append(header)
+    return "\n".join([title, *headers])
+
+
+def summary_vector(header_embedding, chunk_embeddings) -> np.ndarray:
+    """Combine the title/header embedding with the mean of the file's chunk embeddings.
+
+    Both parts are unit-normalised first so neither dominates, and the
+    result is normalised again for cosine search.
+    """
+    parts = [normalize(np.asarray(header_embedding, dtype=np.float32))]
+    chunks = np.asarray(chunk_embeddings, dtype=np.float32)
+    if chunks.ndim == 2 and len(chunks):
+        parts.append(normalize(chunks.mean(axis=0)))
+    return normalize(np.sum(parts, axis=0))
+
+
+class DocumentIndex:
+    """Small file-level index of one summary embedding per source file.
+
+    Stored as a single `.npz` next to the Chroma collection and searched by
+    brute-force cosine similarity, which stays in the microseconds for
+    thousands of files. Used to narrow chunk search to the top-M files.
+
+    Retrieval reads the process-wide copy from `shared()`; ingestion builds
+    its own instance to update and save.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: list[str] = []
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.load()
+
+    @classmethod
+    def shared(cls, path: str) -> "DocumentIndex":
+        """The index loaded from `path` once per process, reloaded when the file changes."""
+        return _shared_indexes.get(path)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def __contains__(self, source: str) -> bool:
+        return source in self.sources
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                self.sources = [str(s) for s in data["sources"]]
+                self.vectors = data["vectors"].astype(np.float32)
+            logger.info(f"Loaded document index with {len(self.sources)} files from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading document index from {self.path}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        np.savez(self.path, sources=np.array(self.sources, dtype=str), vectors=self.vectors)
+
+    def upsert(self, source: str, vector: np.ndarray):
+        vector = normalize(np.asarray(vector, dtype=np.float32).reshape(-1))
+        if source in self.sources:
+            self.vectors[self.sources.index(source)] = vector
+            return
+        self.vectors = (
+            vector[np.newaxis] if not len(self.sources) else np.vstack([self.vectors, vector])
+        )
+        self.sources.append(source)
+
+    def remove(self, source: str):
+        if source not in self.sources:
+            return
+        i = self.sources.index(source)
+        self.sources.pop(i)
+        self.vectors = np.delete(self.vectors, i, axis=0)
+
+    def top_sources(self, query_embedding, m: int) -> list[tuple[str, float]]:
+        """Return the `m` most similar files as `(source, cosine score)` pairs."""
+        if not self.sources or m <= 0:
+            return []
+        query = normalize(np.asarray(query_embedding, dtype=np.float32).reshape(-1))
+        scores = self.vectors @ query
+        m = min(m, len(scores))
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top])]
+        return [(self.sources[i], float(scores[i])) for i in top]
+
+
+_shared_indexes = FileCache(DocumentIndex)
@@ -0,0 +1,152 @@
+from collections import deque
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from config import EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH
+
+from ....services.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchingStats:
+    """Thread-safe counters for micro-batching: batch fill and added wait time."""
+
+    def __init__(self, max_batch: int, window: int = 1000):
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._fills: deque = deque(maxlen=window)
+        self._waits: deque = deque(maxlen=window)
+        self.batches = 0
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, batch_size: int, waits_s: list[float], failed: bool = False):
+        with self._lock:
+            self.batches += 1
+            self.requests += batch_size
+            self.errors += int(failed)
+            self._fills.append(batch_size / self.max_batch)
+            self._waits.extend(waits_s)
+
+    @staticmethod
+    def _percentile(values: list[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))]
+
+    def snapshot(self) -> dict:
+        """Totals plus mean batch fill and p50/p95 added wait over recent batches."""
+        with self._lock:
+            fills, waits = list(self._fills), list(self._waits)
+            out = {"batches": self.batches, "requests": self.requests, "errors": self.errors}
+        out.update(
+            {
+                "mean_batch_size": round(out["requests"] / out["batches"], 2)
+                if out["batches"]
+                else 0,
+                "mean_fill": round(sum(fills) / len(fills), 3) if fills else 0.0,
+                "wait_p50_ms": round(self._percentile(waits, 50) * 1000, 3),
+                "wait_p95_ms": round(self._percentile(waits, 95) * 1000, 3),
+            }
+        )
+        return out
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """Coalesce concurrent `embed_query` calls into batched `embed_documents` calls.
+
+    Each caller enqueues its text and blocks on a future. A single dispatcher
+    thread takes the first waiting query, keeps collecting for up to
+    `window_ms` or until `max_batch` queries are waiting, sends them in one
+    `embed_documents` call, and hands each vector back to its caller. Under
+    load this turns N round trips to a rate-limited endpoint into N /
+    `max_batch`; a lone request waits at most `window_ms` extra.
+
+    The wrapped model must embed queries and documents the same way (true for
+    the HF endpoint). `embed_documents` is passed straight through.
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        window_ms: float = EMBED_BATCH_WINDOW_MS,
+        max_batch: int = EMBED_MAX_BATCH,
+    ):
+        self.inner = inner
+        self.window_s = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.stats = BatchingStats(self.max_batch)
+        self._queue: queue.Queue = queue.Queue()
+        self._dispatcher: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is not None:
+            return
+        with self._start_lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(
+                    target=self._run, name="embed-batcher", daemon=True
+                )
+                self._dispatcher.start()
+
+    def _collect(self) -> list[tuple[str, Future, float]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            dispatched = time.perf_counter()
+            waits = [dispatched - enqueued for _, _, enqueued in batch]
+            try:
+                vectors = self.inner.embed_documents([text for text, _, _ in batch])
+                for (_, future, _), vector in zip(batch, vectors, strict=True):
+                    future.set_result(vector)
+                self.stats.record(len(batch), waits)
+            except Exception as e:
+                logger.error(f"Batched embedding of {len(batch)} queries failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self.stats.record(len(batch), waits, failed=True)
+
+    def embed_query(self, text: str) -> list[float]:
+        self._ensure_dispatcher()
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future.result()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.inner.embed_documents(texts)
+
+
+_shared: dict[str, MicroBatchingEmbeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_batcher(name: str, factory) -> MicroBatchingEmbeddings:
+    """Process-wide batcher per embedding model, so batches span all requests.
+
+    `factory` builds the wrapped `Embeddings` the first time `name` is seen.
+    """
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = MicroBatchingEmbeddings(factory())
+            logger.info(f"Micro-batching enabled for {name} query embeddings")
+        return _shared[name]
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import re
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+from config import (
+    LOCAL_EMBEDDINGS_BATCH_SIZE,
+    LOCAL_EMBEDDINGS_MAX_LENGTH,
+    LOCAL_EMBEDDINGS_PATH,
+    LOCAL_EMBEDDINGS_THREADS,
+)
+
+from ..mmr import normalize
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class LocalOnnxEmbedding(Embeddings):
+    """Sentence-embedding model run from a local directory with ONNX Runtime on CPU.
+
+    `model_dir` must contain `model.onnx` (a sentence-transformers model
+    exported to ONNX, e.g. all-MiniLM-L6-v2) and its `tokenizer.json`.
+    Texts are sorted by length and embedded in batches to keep padding low;
+    token embeddings are mean-pooled over the attention mask and
+    L2-normalised, matching sentence-transformers. No network access or
+    token is needed.
+    """
+
+    def __init__(
+        self,
+        model_dir: str | None = LOCAL_EMBEDDINGS_PATH,
+        batch_size: int = LOCAL_EMBEDDINGS_BATCH_SIZE,
+        threads: int = LOCAL_EMBEDDINGS_THREADS,
+        max_length: int = LOCAL_EMBEDDINGS_MAX_LENGTH,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if not model_dir:
+            raise ValueError("LOCAL_EMBEDDINGS_PATH must point to an exported ONNX model")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        outputs = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})
+
+        if "sentence_embedding" in self.output_names:
+            pooled = outputs[self.output_names.index("sentence_embedding")]
+        else:
+            tokens = outputs[0]
+            weights = mask[..., np.newaxis].astype(np.float32)
+            pooled = (tokens * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return normalize(pooled.astype(np.float32))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        # Batch similar lengths together so little compute is spent on padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            embedded = self._embed_batch([texts[i] for i in batch])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+class HashingEmbedding(Embeddings):
+    """Deterministic feature-hashing embedder for tests and offline development.
+
+    Words and word bigrams are hashed (blake2b, so results are stable across
+    processes) into `size` signed buckets and the vector is L2-normalised.
+    Texts sharing vocabulary end up close together, which is enough for
+    retrieval tests, without any model files.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def _bucket(self, feature: str) -> tuple[int, float]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        return value % self.size, 1.0 if value >> 63 else -1.0
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        words = _WORD_RE.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:], strict=False)]:
+            index, sign = self._bucket(feature)
+            vector[index] += sign
+        return normalize(vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
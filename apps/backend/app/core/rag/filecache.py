@@ -0,0 +1,42 @@
+import os
+import threading
+
+
+class FileCache:
+    """Objects loaded from files, shared across the process until a file changes.
+
+    `get(path)` calls `loader(path)` on first use and returns the same object
+    afterwards. Entries are keyed by path and stamped with the file's mtime
+    and size, so a file rewritten by a re-ingest is loaded again. A missing
+    file is cached too (with whatever the loader returns for it) until the
+    file appears. Cached objects are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self._entries: dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path: str) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path: str):
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+        # Loaded outside the lock; two threads racing on a change both load once
+        value = self.loader(path)
+        with self._lock:
+            self._entries[path] = (stamp, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,193 @@
+from collections import defaultdict
+import contextlib
+import os
+import queue
+import threading
+
+from langchain_core.embeddings import Embeddings
+import numpy as np
+
+from config import EMBEDDINGS_PROVIDER, HISTORY_INDEX_BATCH, HISTORY_INDEX_PATH
+
+from ...services.logger import get_logger
+from ...services.metrics import model_label, stage_timer
+from .mmr import normalize
+from .providers import get_embedding_provider
+
+logger = get_logger(__name__)
+
+# A partition starts with the vector size, stored like the record ids
+_HEADER = np.dtype("<i8")
+
+
+def _record_dtype(dimension: int) -> np.dtype:
+    return np.dtype([("id", "<i8"), ("vector", "<f2", (dimension,))])
+
+
+class HistoryIndex:
+    """Semantic index of chat messages, partitioned by user.
+
+    Each user's vectors live in their own file under
+    `directory/<provider>/`, so a search reads one small partition and never
+    touches other users' messages. A partition is a header holding the
+    vector size followed by fixed-size records: the message id (int64) and
+    its unit-length embedding as float16, half the size of float32. Adding
+    messages is a single append, and a user's history is small enough for an
+    exact dot-product scan.
+
+    Partitions are append-only. Vectors of deleted messages stay until the
+    partition is dropped; callers resolve the ids against the database and
+    skip those that are gone.
+    """
+
+    def __init__(
+        self,
+        directory: str = HISTORY_INDEX_PATH,
+        use_model: str = EMBEDDINGS_PROVIDER,
+        embeddings: Embeddings | None = None,
+    ):
+        self.model = use_model
+        self.directory = os.path.join(directory, use_model)
+        if embeddings is None:
+            embeddings = get_embedding_provider(use_model).create()
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+
+    def partition_path(self, user_id: str) -> str:
+        return os.path.join(self.directory, f"{user_id}.vec")
+
+    def add(self, user_id: str, message_ids: list[int], vectors) -> None:
+        """Append the embeddings of `message_ids` to the user's partition."""
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        records = np.empty(len(message_ids), dtype=_record_dtype(vectors.shape[1]))
+        records["id"] = message_ids
+        records["vector"] = vectors
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self.partition_path(user_id), "ab+") as f:
+            f.seek(0)
+            header = f.read(_HEADER.itemsize)
+            if not header:
+                f.write(np.array(vectors.shape[1], dtype=_HEADER).tobytes())
+            elif int(np.frombuffer(header, dtype=_HEADER)[0]) != vectors.shape[1]:
+                raise ValueError(
+                    f"Partition of user {user_id} holds vectors of another size; drop it first"
+                )
+            f.write(records.tobytes())
+
+    def load(self, user_id: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the message ids and float16 vectors in the user's partition."""
+        try:
+            with open(self.partition_path(user_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        if len(data) < _HEADER.itemsize:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float16)
+
+        dimension = int(np.frombuffer(data, dtype=_HEADER, count=1)[0])
+        dtype = _record_dtype(dimension)
+        # Ignore a trailing partial record left by an interrupted append
+        count = (len(data) - _HEADER.itemsize) // dtype.itemsize
+        records = np.frombuffer(data, dtype=dtype, count=count, offset=_HEADER.itemsize)
+        return records["id"], records["vector"]
+
+    def drop(self, user_id: str) -> None:
+        """Delete the user's partition, e.g. once all of their chats are gone."""
+        with self._lock, contextlib.suppress(FileNotFoundError):
+            os.remove(self.partition_path(user_id))
+
+    def search(self, user_id: str, query: str, K: int) -> list[tuple[int, float]]:
+        """Return `(message id, cosine similarity)` of the user's `K` closest messages."""
+        ids, vectors = self.load(user_id)
+        if not len(ids):
+            return []
+        with stage_timer("embed", self.model, model_label(self.embeddings)):
+            embedding = normalize(np.asarray(self.embeddings.embed_query(query), dtype=np.float32))
+
+        with stage_timer("history_search", self.model, "partition"):
+            scores = vectors.astype(np.float32) @ embedding
+            order = np.argsort(-scores, kind="stable")
+
+        hits, seen = [], set()
+        for i in order:
+            # A message indexed twice (e.g. a retried batch) is reported once
+            message_id = int(ids[i])
+            if message_id not in seen:
+                seen.add(message_id)
+                hits.append((message_id, float(scores[i])))
+                if len(hits) == K:
+                    break
+        return hits
+
+
+class HistoryIndexer:
+    """Embeds stored messages on a background thread and adds them to a `HistoryIndex`.
+
+    `submit` only queues the messages, so the request that stored them is
+    not delayed. The worker embeds up to `max_batch` queued messages per
+    `embed_documents` call and appends them to their users' partitions.
+    """
+
+    def __init__(self, index: HistoryIndex, max_batch: int = HISTORY_INDEX_BATCH):
+        self.index = index
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, user_id: str, messages: list[tuple[int, str]]) -> None:
+        """Queue `(message id, content)` pairs of one user for indexing."""
+        for message_id, content in messages:
+            self._queue.put((user_id, message_id, content))
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="history-indexer", daemon=True
+                )
+                self._thread.start()
+
+    def wait(self) -> None:
+        """Block until every submitted message has been indexed (or has failed)."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.index_batch(batch)
+            except Exception as e:
+                logger.error("Failed to index %d messages for history search: %s", len(batch), e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def index_batch(self, batch: list[tuple[str, int, str]]) -> None:
+        """Embed `(user id, message id, content)` items and append them per user."""
+        vectors = self.index.embeddings.embed_documents([content for _, _, content in batch])
+        by_user = defaultdict(lambda: ([], []))
+        for (user_id, message_id, _), vector in zip(batch, vectors, strict=True):
+            ids, user_vectors = by_user[user_id]
+            ids.append(message_id)
+            user_vectors.append(vector)
+        for user_id, (ids, user_vectors) in by_user.items():
+            self.index.add(user_id, ids, user_vectors)
+        logger.debug("Indexed %d messages for %d users", len(batch), len(by_user))
+
+
+_shared: HistoryIndexer | None = None
+_shared_lock = threading.Lock()
+
+
+def shared_indexer() -> HistoryIndexer:
+    """The process-wide indexer over the default `HistoryIndex`, created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = HistoryIndexer(HistoryIndex())
+    return _shared
@@ -1,13 +1,36 @@
+from functools import lru_cache
+import threading
+import time
+
 from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
-from config import GEMINI_API_KEY, GEMINI_LLM_MODEL, GROQ_API_KEY, GROQ_LLM_MODEL, PROMPT_PATH
+from config import (
+    CONTEXT_COMPRESSION,
+    GENERATION_BUDGETS,
+    LLM_FALLBACK_PROVIDER,
+    LLM_PROVIDER,
+    PROMPT_PATH,
+    SKIP_LLM_ON_EMPTY_CONTEXT,
+)
 
 from ...services.logger import get_logger
+from ...services.metrics import (
+    CACHE_REQUESTS,
+    LLM_ERRORS,
+    LLM_FALLBACKS,
+    RETRIEVAL_ERRORS,
+    STAGE_DURATION,
+    model_label,
+    stage_timer,
+)
+from ...services.tracing import trace_callbacks
+from .classifier import QueryClassifier, generation_stats
+from .compressor import ContextCompressor
+from .providers import get_llm_provider
+from .tokens import estimate_message_tokens, estimate_tokens
 
 logger = get_logger(__name__)
 
@@ -16,85 +39,334 @@ logger = get_logger(__name__)
 # os.environ["GOOGLE_MODEL_NAME"] = GEMINI_LLM_MODEL
 # os.environ["GROQ_LLM_MODEL"] = GROQ_LLM_MODEL
 
+# Canned reply used when retrieval finds nothing relevant, so we don't pay for an LLM call
+NO_CONTEXT_RESPONSE = (
+    "I don't have information about that in my Babcock University knowledge base. "
+    "Try rephrasing your question, or ask me about admissions, fees, academics, "
+    "campus life or university rules."
+)
+
+# Reply when retrieval or every LLM path fails
+ERROR_RESPONSE = "I'm sorry, an error occurred. Please try again later."
+
+# Per-request user message. Everything static lives in the system prompt (PROMPT_PATH)
+# so the prompt prefix is byte-identical across requests and provider-side caching applies.
+USER_PROMPT_TEMPLATE = "{summary}## CONTEXT\n{context}\n\n## STUDENT'S QUESTION\n{query}"
+SUMMARY_BLOCK_TEMPLATE = "## EARLIER CONVERSATION (SUMMARY)\n{summary}\n\n"
+FALLBACK_SYSTEM_PROMPT = (
+    "You are UniPal, a campus assistant for Babcock University students. "
+    "Answer the student's question using only the context provided in their message."
+)
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a Babcock University "
+    "student and UniPal, the campus assistant. Merge the new messages into the current "
+    "summary. Keep the student's details, programmes, fees, dates, decisions and open "
+    "questions; drop greetings and repetition. Reply with the updated summary only, in "
+    "at most 120 words."
+)
+
+
+@lru_cache(maxsize=4)
+def _load_system_prompt(path: str) -> str:
+    """Read the static system prompt once per process."""
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
 
 class FallbackLoggingHandler(BaseCallbackHandler):
-    """Custom handler to log when the primary LLM fails and fallback triggers."""
+    """Custom handler to log when the primary LLM fails and fallback triggers.
+
+    Also times every LLM attempt as the "llm" stage and counts errors and
+    fallbacks. `providers` maps a model's `_llm_type` to its provider name
+    for metric labels. Fallbacks run synchronously on the thread whose
+    primary call just failed, so a chat model started on a thread with a
+    pending error is counted as a fallback, and `served()` names the
+    provider and model whose attempt last succeeded on the thread.
+    """
+
+    def __init__(self, providers: dict[str, str] | None = None):
+        self.providers = providers or {}
+        self._attempts: dict = {}
+        self._local = threading.local()
+
+    def on_chain_start(self, serialized, inputs, **kwargs):
+        self._local.failed = False
+        self._local.served = None
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        llm_type = params.get("_type", "")
+        provider = self.providers.get(llm_type, llm_type)
+        model = str(params.get("model") or params.get("model_name") or llm_type)
+        self._attempts[run_id] = (time.perf_counter(), provider, model)
+        self._local.served = None
+        if getattr(self._local, "failed", False):
+            self._local.failed = False
+            LLM_FALLBACKS.inc(provider=provider)
 
-    def on_llm_error(self, error, **kwargs):
-        logger.error(f"Primary LLM error: {error}. Triggering fallback to Groq LLM.")
+    def _finish(self, run_id) -> tuple[str, str]:
+        start, provider, model = self._attempts.pop(run_id, (None, "", ""))
+        if start is not None:
+            STAGE_DURATION.observe(
+                time.perf_counter() - start, stage="llm", provider=provider, model=model
+            )
+        return provider, model
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._local.served = self._finish(run_id)
+
+    def served(self) -> tuple[str, str] | None:
+        """`(provider, model)` of the attempt that answered last on this thread."""
+        return getattr(self._local, "served", None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        provider, model = self._finish(run_id)
+        LLM_ERRORS.inc(provider=provider, model=model)
+        self._local.failed = True
+        logger.error(f"Primary LLM error: {error}. Triggering fallback LLM.")
 
 
 class LLM:
     """Wrapper around the project's chat LLM(s) with a simple fallback.
 
-    This class exposes `get_response(query, retriever)` which composes an LCEL
-    pipeline: (retriever -> format docs -> prompt -> llm_chain -> parser).
+    The primary and fallback models come from the provider registry
+    (`LLM_PROVIDER` / `LLM_FALLBACK_PROVIDER`, Gemini then Groq by default);
+    with no fallback provider the primary is used alone.
+
+    This class exposes `get_response(query, retriever)` which runs the
+    retriever and then an LCEL pipeline: (format docs -> prompt -> llm_chain
+    -> parser). When the retriever returns no chunks the LLM is skipped and
+    `NO_CONTEXT_RESPONSE` is returned instead; when retrieval fails,
+    `ERROR_RESPONSE` is. If a `ContextCompressor` is
+    configured, retrieved chunks are compressed before prompting.
+
+    Each question is classified locally (factual / procedural / open-ended)
+    and answered with that class's output-token limit and temperature from
+    `GENERATION_BUDGETS`.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        skip_on_empty_context: bool = SKIP_LLM_ON_EMPTY_CONTEXT,
+        compressor: ContextCompressor | None = None,
+        provider: str = LLM_PROVIDER,
+        fallback_provider: str | None = LLM_FALLBACK_PROVIDER,
+    ):
         self.prompt_path = PROMPT_PATH
+        self.skip_on_empty_context = skip_on_empty_context
+        self.compressor = compressor or (ContextCompressor() if CONTEXT_COMPRESSION else None)
+        self.last_prompt_tokens: dict[str, int] = {}
 
-        # Primary LLM (Gemini)
-        self.primary_llm = ChatGoogleGenerativeAI(
-            model=GEMINI_LLM_MODEL,
-            api_key=GEMINI_API_KEY,
-            temperature=0.2,
-            max_retries=1,
-        )
-
-        # Fallback LLM (Groq)
-        self.fallback_llm = ChatGroq(
-            model_name=GROQ_LLM_MODEL, api_key=GROQ_API_KEY, temperature=0.2
-        )
+        # Primary and (optional) fallback providers
+        self.primary_provider = get_llm_provider(provider)
+        self.fallback_provider = get_llm_provider(fallback_provider) if fallback_provider else None
+        self.primary_llm = self.primary_provider.model()
+        self.fallback_llm = self.fallback_provider.model() if self.fallback_provider else None
 
         # Chain
-        self.llm_chain = self.primary_llm.with_fallbacks([self.fallback_llm]).with_config(
-            callbacks=[FallbackLoggingHandler()]
+        self.providers = {self.primary_llm._llm_type: self.primary_provider.name}
+        if self.fallback_llm is not None:
+            self.providers.setdefault(self.fallback_llm._llm_type, self.fallback_provider.name)
+        self.callback_handler = FallbackLoggingHandler(self.providers)
+        self.llm_chain = self._with_fallback(self.primary_llm, self.fallback_llm)
+
+        # The chat models are shared per process; only the wrappers are per instance
+        self.classifier = QueryClassifier()
+        self.budget_chains = {
+            query_class: self._build_budget_chain(**budget)
+            for query_class, budget in GENERATION_BUDGETS.items()
+        }
+
+    def _with_fallback(self, primary, fallback):
+        """Chain `primary` with `fallback` (if any) and the fallback logging handler."""
+        chain = primary.with_fallbacks([fallback]) if fallback is not None else primary
+        return chain.with_config(callbacks=[self.callback_handler])
+
+    def _build_budget_chain(self, max_output_tokens: int, temperature: float):
+        """Return a primary+fallback chain with the given output limit and temperature."""
+        primary = self.primary_provider.model(temperature, max_output_tokens)
+        fallback = (
+            self.fallback_provider.model(temperature, max_output_tokens)
+            if self.fallback_provider
+            else None
         )
+        return self._with_fallback(primary, fallback)
 
-    def _get_prompt_template(self) -> PromptTemplate:
-        """Load the prompt template from the configured `PROMPT_PATH`.
+    def _get_prompt_template(self) -> ChatPromptTemplate:
+        """Build the chat prompt from the configured `PROMPT_PATH`.
 
-        Falls back to a minimal template when file loading fails.
+        The file is used verbatim as a static system message (it is not a
+        template), followed by the recent conversation `history` and a small
+        user message carrying `{summary}`, `{context}` and `{query}`. Falls
+        back to a minimal system prompt when file loading fails.
         """
         try:
-            with open(self.prompt_path, encoding="utf-8") as f:
-                template = f.read()
-            return PromptTemplate.from_template(template)
+            system_text = _load_system_prompt(self.prompt_path)
         except Exception as e:
-            logger.error(f"Error loading prompt template from {self.prompt_path}: {str(e)}")
+            logger.error(f"Error loading system prompt from {self.prompt_path}: {str(e)}")
             # Fallback hardcoded prompt if file loading fails
-            return PromptTemplate.from_template("Context: {context}\n\nQuery: {query}\n\n")
+            system_text = FALLBACK_SYSTEM_PROMPT
+
+        return ChatPromptTemplate.from_messages(
+            [
+                SystemMessage(content=system_text),
+                MessagesPlaceholder("history", optional=True),
+                ("human", USER_PROMPT_TEMPLATE),
+            ]
+        ).partial(summary="")
 
     def _format_docs(self, docs: list[str]) -> str:
         """Merge retrieved Document chunks into a single string for the prompt."""
         return "\n\n".join(doc.page_content for doc in docs)
 
-    def get_response(self, query: str, retriever) -> str:
+    def get_response(
+        self,
+        query: str,
+        retriever,
+        history: list[BaseMessage] | None = None,
+        summary: str | None = None,
+        retrieval_query: str | None = None,
+    ) -> str:
         """Execute the RAG chain and return a text response from the LLM.
 
         Args:
             query: The user question.
             retriever: A runnable or callable that accepts the query and returns
                        a list of `Document` objects.
+            history: Recent conversation turns to include before the question.
+            summary: Rolling summary of older turns in the conversation.
+            retrieval_query: Text to retrieve with, if different from `query`
+                             (e.g. a follow-up expanded with the previous turn).
 
         Returns:
             A string response from the LLM. On failure, a friendly error
             message is returned and the exception is logged.
         """
 
-        prompt = self._get_prompt_template()
+        search_text = retrieval_query or query
+        # Spans for this turn, when serving a traced request
+        callbacks = trace_callbacks(self.providers)
+        try:
+            docs = (
+                retriever.invoke(search_text, {"run_name": "retriever", "callbacks": callbacks})
+                if hasattr(retriever, "invoke")
+                else retriever(search_text)
+            )
+        except Exception as e:
+            # An outage is not an empty search, so it must not get the no-context reply
+            RETRIEVAL_ERRORS.inc()
+            logger.critical(f"Retrieval failed: {e}")
+            return ERROR_RESPONSE
+
+        # Fast path: nothing relevant was retrieved, so don't call the LLM at all
+        if not docs and self.skip_on_empty_context:
+            logger.info("No context retrieved; returning canned response without calling LLM")
+            return NO_CONTEXT_RESPONSE
 
-        # Define the LCEL Chain
-        rag_chain = (
-            {"context": retriever | self._format_docs, "query": RunnablePassthrough()}
-            | prompt
-            | self.llm_chain
-            | StrOutputParser()
-        )
+        if self.compressor:
+            with stage_timer("compress"):
+                docs = self.compressor.compress(query, docs)
+
+        with stage_timer("prompt_build"):
+            prompt = self._get_prompt_template()
+            prompt_value = prompt.invoke(
+                {
+                    "history": history or [],
+                    "summary": SUMMARY_BLOCK_TEMPLATE.format(summary=summary) if summary else "",
+                    "context": self._format_docs(docs),
+                    "query": query,
+                },
+                {"run_name": "prompt", "callbacks": callbacks},
+            )
+
+        self.last_prompt_tokens = estimate_message_tokens(prompt_value.to_messages())
+        logger.info("Prompt size (estimated tokens): %s", self.last_prompt_tokens)
+
+        query_class = self.classifier.classify(query)
+        llm_chain = self.budget_chains.get(query_class, self.llm_chain)
 
         try:
-            return rag_chain.invoke(query)
+            start = time.perf_counter()
+            message = llm_chain.invoke(
+                prompt_value,
+                {
+                    "run_name": "llm",
+                    "callbacks": callbacks,
+                    "metadata": {
+                        "query_class": query_class,
+                        "prompt_tokens": self.last_prompt_tokens["total"],
+                    },
+                },
+            )
+            latency = time.perf_counter() - start
+            # Labelled with the model that answered, which is the fallback if the primary failed
+            provider, model = self.callback_handler.served() or (
+                self.primary_provider.name,
+                model_label(self.primary_llm),
+            )
+            STAGE_DURATION.observe(latency, stage="generate", provider=provider, model=model)
+            with stage_timer("parse"):
+                text = StrOutputParser().invoke(
+                    message, {"run_name": "parser", "callbacks": callbacks}
+                )
         except Exception as e:
             logger.critical(f"All LLM paths failed: {e}")
-            return "I'm sorry, an error occurred. Please try again later."
+            return ERROR_RESPONSE
+
+        self._record_generation(query_class, message, text, latency)
+        return text
+
+    def _record_generation(self, query_class: str, message, text: str, latency: float):
+        """Record output length, latency and truncation for the query class."""
+        usage = getattr(message, "usage_metadata", None) or {}
+        cache_details = usage.get("input_token_details") or {}
+        if "cache_read" in cache_details:
+            hit = "hit" if cache_details["cache_read"] else "miss"
+            CACHE_REQUESTS.inc(cache="llm_prompt", result=hit)
+        output_tokens = usage.get("output_tokens") or estimate_tokens(text)
+        finish_reason = str(
+            (getattr(message, "response_metadata", None) or {}).get("finish_reason", "")
+        )
+        truncated = finish_reason.upper() in ("MAX_TOKENS", "LENGTH")
+        max_output_tokens = GENERATION_BUDGETS.get(query_class, {}).get("max_output_tokens")
+
+        generation_stats.record(
+            query_class,
+            output_tokens,
+            latency,
+            max_output_tokens=max_output_tokens,
+            truncated=truncated,
+        )
+        logger.info(
+            "Generated %s tokens for %s query in %.2fs%s",
+            output_tokens,
+            query_class,
+            latency,
+            " (hit output limit)" if truncated else "",
+        )
+
+    def summarize(self, previous_summary: str | None, messages: list[BaseMessage]) -> str | None:
+        """Merge `messages` into `previous_summary` and return the new summary.
+
+        Returns None when every LLM path fails, so callers can retry later
+        without losing the unsummarized messages.
+        """
+        transcript = "\n".join(
+            f"{'Student' if m.type == 'human' else 'UniPal'}: {m.content}" for m in messages
+        )
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessage(content=SUMMARY_SYSTEM_PROMPT),
+                ("human", "Current summary:\n{summary}\n\nNew messages:\n{transcript}"),
+            ]
+        )
+        chain = prompt | self.llm_chain | StrOutputParser()
+
+        try:
+            with stage_timer("summarize", self.primary_provider.name):
+                return chain.invoke(
+                    {"summary": previous_summary or "(none)", "transcript": transcript}
+                ).strip()
+        except Exception as e:
+            logger.error(f"Conversation summary failed: {e}")
+            return None
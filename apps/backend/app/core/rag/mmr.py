@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors (last axis) to unit length, leaving zero vectors unchanged."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """Select `k` candidate indices by maximal marginal relevance.
+
+    Each step picks the candidate maximising
+    `lambda_mult * sim(query, c) - (1 - lambda_mult) * max(sim(c, selected))`,
+    so `lambda_mult=1` is plain similarity ranking and lower values favour
+    diversity. Similarities are cosine. The candidate-to-candidate matrix is
+    computed once and the redundancy term is updated incrementally, so the
+    whole selection is O(n^2 + k*n) in vectorised NumPy.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if candidates.ndim != 2 or len(candidates) == 0 or k <= 0:
+        return []
+
+    candidates = normalize(candidates)
+    query = normalize(np.asarray(query_embedding, dtype=np.float32).reshape(-1))
+
+    query_sim = candidates @ query
+    pairwise_sim = candidates @ candidates.T
+
+    first = int(np.argmax(query_sim))
+    selected = [first]
+    redundancy = pairwise_sim[first].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[first] = False
+
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * query_sim - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise_sim[best], out=redundancy)
+
+    return selected
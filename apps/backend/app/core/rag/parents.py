@@ -0,0 +1,134 @@
+from contextlib import closing
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+from langchain_core.documents import Document
+
+from ...services.logger import get_logger
+from ...services.metrics import CACHE_REQUESTS
+
+logger = get_logger(__name__)
+
+PARENT_STORE_FILE = "parents.sqlite3"
+
+
+class ParentStore:
+    """Compact key-value store for parent sections in parent-child retrieval.
+
+    Parents (whole markdown header sections) are never embedded; they live in
+    a single SQLite file next to the Chroma collection, keyed by `parent_id`,
+    with zlib-compressed text. Children in Chroma point at them through
+    `metadata["parent_id"]`.
+
+    Every call opens its own connection, so one store can serve all
+    threads; `shared()` returns that per-path instance, and the schema is
+    created once when it is first built.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parents ("
+                "id TEXT PRIMARY KEY, source TEXT NOT NULL, content BLOB NOT NULL, "
+                "metadata TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_parents_source ON parents (source)")
+
+    @classmethod
+    def shared(cls, path: str) -> "ParentStore":
+        """The process-wide store for `path`, created on first use."""
+        with _shared_lock:
+            if path not in _shared_stores:
+                _shared_stores[path] = cls(path)
+            return _shared_stores[path]
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps the store safe to share across threads
+        return sqlite3.connect(self.path)
+
+    def put_many(self, parents: dict[str, Document]) -> int:
+        """Insert or replace parents keyed by id. Returns the number stored."""
+        rows = [
+            (
+                parent_id,
+                doc.metadata.get("source", ""),
+                zlib.compress(doc.page_content.encode("utf-8")),
+                json.dumps(doc.metadata),
+            )
+            for parent_id, doc in parents.items()
+        ]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO parents VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def get_many(self, parent_ids: list[str]) -> dict[str, Document]:
+        """Return the stored parents for `parent_ids`; unknown ids are omitted."""
+        if not parent_ids:
+            return {}
+        placeholders = ",".join("?" * len(parent_ids))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT id, content, metadata FROM parents WHERE id IN ({placeholders})",
+                list(parent_ids),
+            ).fetchall()
+        return {
+            parent_id: Document(
+                page_content=zlib.decompress(content).decode("utf-8"),
+                metadata=json.loads(metadata),
+            )
+            for parent_id, content, metadata in rows
+        }
+
+    def delete_by_source(self, source: str) -> int:
+        """Delete all parents of a source file. Returns the number deleted."""
+        with closing(self._connect()) as conn, conn:
+            deleted = conn.execute("DELETE FROM parents WHERE source = ?", (source,)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} parent sections for source: {source}")
+        return deleted
+
+    def __len__(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+
+_shared_stores: dict[str, ParentStore] = {}
+_shared_lock = threading.Lock()
+
+
+def expand_to_parents(docs: list[Document], store: ParentStore) -> list[Document]:
+    """Replace matched child chunks by their parent sections, de-duplicated.
+
+    Order follows the best-ranked child of each parent. Chunks without a
+    `parent_id` (non-markdown sources) or whose parent is missing are kept
+    as they are. Parents inherit the child's score metadata.
+    """
+    parent_ids = [doc.metadata["parent_id"] for doc in docs if doc.metadata.get("parent_id")]
+    unique_ids = list(dict.fromkeys(parent_ids))
+    parents = store.get_many(unique_ids)
+    CACHE_REQUESTS.inc(len(parents), cache="parent_store", result="hit")
+    CACHE_REQUESTS.inc(len(unique_ids) - len(parents), cache="parent_store", result="miss")
+
+    expanded: list[Document] = []
+    seen: set[str] = set()
+    for doc in docs:
+        parent_id = doc.metadata.get("parent_id")
+        parent = parents.get(parent_id) if parent_id else None
+        if parent is None:
+            expanded.append(doc)
+            continue
+        if parent_id in seen:
+            continue
+        seen.add(parent_id)
+        scores = {k: doc.metadata[k] for k in ("score", "rerank_score") if k in doc.metadata}
+        expanded.append(
+            Document(page_content=parent.page_content, metadata={**parent.metadata, **scores})
+        )
+
+    logger.info("Expanded %d child chunks to %d context sections", len(docs), len(expanded))
+    return expanded
@@ -0,0 +1,182 @@
+import threading
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+from config import (
+    EMBEDDING_PROVIDER_LIMITS,
+    EMBEDDINGS_PROVIDER,
+    GEMINI_API_KEY,
+    GEMINI_LLM_MODEL,
+    GROQ_API_KEY,
+    GROQ_LLM_MODEL,
+    LLM_PROVIDER_LIMITS,
+    STUB_LATENCY_MS,
+)
+
+from .embeddings.gemini import GeminiEmbedding
+from .embeddings.hf import HFEmbedding
+from .embeddings.local import HashingEmbedding, LocalOnnxEmbedding
+from .stub import StubChatModel, StubEmbedding
+
+
+class EmbeddingProvider:
+    """An embedding backend and the limits it has to be driven within.
+
+    `factory(provider)` builds the `Embeddings` instance. `batch_size` is the
+    most chunks sent per upsert call, `requests_per_minute` paces ingestion
+    batches (0 means unlimited), `chunk_size` is the splitter's target in
+    characters and `dimension` the vector size (None if the model decides).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory,
+        batch_size: int = 100,
+        requests_per_minute: int = 0,
+        chunk_size: int = 500,
+        dimension: int | None = None,
+    ):
+        self.name = name
+        self.factory = factory
+        self.batch_size = batch_size
+        self.requests_per_minute = requests_per_minute
+        self.chunk_size = chunk_size
+        self.dimension = dimension
+
+    @property
+    def batch_interval_s(self) -> float:
+        """Minimum seconds between batched calls to respect the rate limit."""
+        return 60 / self.requests_per_minute if self.requests_per_minute else 0.0
+
+    def create(self) -> Embeddings:
+        return self.factory(self)
+
+
+class LLMProvider:
+    """A chat model backend with its rate limit.
+
+    `factory(temperature=..., max_output_tokens=..., rate_limiter=...)`
+    builds the chat model. All models created by one provider share a
+    single rate limiter, so per-query-class variants can't exceed it
+    together. `model()` returns a process-wide instance per output limit
+    and temperature, so building an `LLM` per request creates no clients.
+    """
+
+    def __init__(self, name: str, factory, requests_per_minute: int = 0):
+        self.name = name
+        self.factory = factory
+        self.requests_per_minute = requests_per_minute
+        self.rate_limiter = (
+            InMemoryRateLimiter(requests_per_second=requests_per_minute / 60, max_bucket_size=1)
+            if requests_per_minute
+            else None
+        )
+        self._models: dict[tuple, BaseChatModel] = {}
+        self._models_lock = threading.Lock()
+
+    def create(
+        self, temperature: float = 0.2, max_output_tokens: int | None = None
+    ) -> BaseChatModel:
+        return self.factory(
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            rate_limiter=self.rate_limiter,
+        )
+
+    def model(
+        self, temperature: float = 0.2, max_output_tokens: int | None = None
+    ) -> BaseChatModel:
+        """The shared chat model for these settings, created on first use."""
+        key = (temperature, max_output_tokens)
+        with self._models_lock:
+            if key not in self._models:
+                self._models[key] = self.create(temperature, max_output_tokens)
+            return self._models[key]
+
+
+EMBEDDING_PROVIDERS: dict[str, EmbeddingProvider] = {}
+LLM_PROVIDERS: dict[str, LLMProvider] = {}
+
+
+def register_embedding_provider(provider: EmbeddingProvider) -> EmbeddingProvider:
+    EMBEDDING_PROVIDERS[provider.name] = provider
+    return provider
+
+
+def register_llm_provider(provider: LLMProvider) -> LLMProvider:
+    LLM_PROVIDERS[provider.name] = provider
+    return provider
+
+
+def get_embedding_provider(name: str = EMBEDDINGS_PROVIDER) -> EmbeddingProvider:
+    try:
+        return EMBEDDING_PROVIDERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embeddings provider {name!r}; expected one of {list(EMBEDDING_PROVIDERS)}"
+        ) from None
+
+
+def get_llm_provider(name: str) -> LLMProvider:
+    try:
+        return LLM_PROVIDERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown LLM provider {name!r}; expected one of {list(LLM_PROVIDERS)}"
+        ) from None
+
+
+def _gemini_llm(temperature, max_output_tokens, rate_limiter):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_LLM_MODEL,
+        api_key=GEMINI_API_KEY,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+        max_retries=1,
+        rate_limiter=rate_limiter,
+    )
+
+
+def _groq_llm(temperature, max_output_tokens, rate_limiter):
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        model_name=GROQ_LLM_MODEL,
+        api_key=GROQ_API_KEY,
+        temperature=temperature,
+        max_tokens=max_output_tokens,
+        rate_limiter=rate_limiter,
+    )
+
+
+def _stub_llm(temperature, max_output_tokens, rate_limiter):
+    return StubChatModel(
+        latency_ms=STUB_LATENCY_MS,
+        temperature=temperature,
+        max_output_tokens=max_output_tokens,
+        rate_limiter=rate_limiter,
+    )
+
+
+_EMBEDDING_FACTORIES = {
+    "hf": lambda provider: HFEmbedding(),
+    "gemini": lambda provider: GeminiEmbedding(),
+    "local": lambda provider: LocalOnnxEmbedding(),
+    "hash": lambda provider: HashingEmbedding(size=provider.dimension or 256),
+    "stub": lambda provider: StubEmbedding(
+        size=provider.dimension or 384, latency_ms=STUB_LATENCY_MS
+    ),
+}
+_LLM_FACTORIES = {"gemini": _gemini_llm, "groq": _groq_llm, "stub": _stub_llm}
+
+for _name, _factory in _EMBEDDING_FACTORIES.items():
+    register_embedding_provider(
+        EmbeddingProvider(_name, _factory, **EMBEDDING_PROVIDER_LIMITS.get(_name, {}))
+    )
+for _name, _factory in _LLM_FACTORIES.items():
+    register_llm_provider(LLMProvider(_name, _factory, **LLM_PROVIDER_LIMITS.get(_name, {})))
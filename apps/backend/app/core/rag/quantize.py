@@ -0,0 +1,245 @@
+import os
+
+import numpy as np
+
+from ...services.logger import get_logger
+from .filecache import FileCache
+from .mmr import normalize
+
+logger = get_logger(__name__)
+
+QUANTIZED_INDEX_FILE = "quantized_index.npz"
+REDUCTIONS = ("none", "pca", "truncate")
+
+
+def exact_distances(query: np.ndarray, vectors: np.ndarray, metric: str = "l2") -> np.ndarray:
+    """Full-precision distances in the same convention as Chroma (`l2` is squared)."""
+    query = np.asarray(query, dtype=np.float32).reshape(-1)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if metric == "cosine":
+        return 1.0 - normalize(vectors) @ normalize(query)
+    if metric == "ip":
+        return 1.0 - vectors @ query
+    diff = vectors - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+class QuantizedIndex:
+    """Compact in-memory copy of the chunk embeddings for fast first-stage search.
+
+    Vectors are optionally reduced to `dimensions` (PCA fitted on the corpus,
+    or prefix truncation plus re-normalisation for Matryoshka-style models)
+    and then scalar-quantised to int8 per dimension, which is 4x smaller
+    than float32 before any reduction. A query scans the int8 codes for a
+    shortlist of `k * rescore_factor` candidates, and the caller rescores the
+    shortlist with the full-precision vectors kept in Chroma.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        sources: np.ndarray,
+        codes: np.ndarray,
+        scale: np.ndarray,
+        offset: np.ndarray,
+        sq_norms: np.ndarray,
+        reduction: str = "none",
+        mean: np.ndarray | None = None,
+        components: np.ndarray | None = None,
+        dimensions: int | None = None,
+    ):
+        self.ids = ids
+        self.sources = sources
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+        self.sq_norms = sq_norms
+        self.reduction = reduction
+        self.mean = mean
+        self.components = components
+        self.dimensions = dimensions
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        ids: list[str],
+        sources: list[str],
+        vectors: np.ndarray,
+        reduction: str = "none",
+        dimensions: int | None = None,
+    ) -> "QuantizedIndex":
+        """Fit the reduction (if any) and quantise `vectors` to int8."""
+        if reduction not in REDUCTIONS:
+            raise ValueError(f"Unknown reduction {reduction!r}; expected one of {REDUCTIONS}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        mean = components = None
+        if reduction == "pca":
+            dimensions = min(dimensions or vectors.shape[1], *vectors.shape)
+            mean = vectors.mean(axis=0)
+            # Rows of vt are the principal axes, sorted by explained variance
+            _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+            components = vt[:dimensions].astype(np.float32)
+        elif reduction == "truncate":
+            dimensions = min(dimensions or vectors.shape[1], vectors.shape[1])
+        else:
+            dimensions = vectors.shape[1]
+
+        index = cls(
+            ids=np.array(ids, dtype=str),
+            sources=np.array(sources, dtype=str),
+            codes=np.empty((0, dimensions), dtype=np.int8),
+            scale=np.ones(dimensions, dtype=np.float32),
+            offset=np.zeros(dimensions, dtype=np.float32),
+            sq_norms=np.empty(0, dtype=np.float32),
+            reduction=reduction,
+            mean=mean,
+            components=components,
+            dimensions=dimensions,
+        )
+        reduced = index.reduce(vectors)
+
+        low, high = reduced.min(axis=0), reduced.max(axis=0)
+        index.scale = np.where(high > low, (high - low) / 255, 1.0).astype(np.float32)
+        index.codes = (np.rint((reduced - low) / index.scale) - 128).astype(np.int8)
+        # x ~= (code + 128) * scale + low, so x . q = code . (scale * q) + offset . q
+        index.offset = (128 * index.scale + low).astype(np.float32)
+        reconstructed = index.codes.astype(np.float32) * index.scale + index.offset
+        index.sq_norms = np.einsum("ij,ij->i", reconstructed, reconstructed)
+        return index
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """Project float vectors (one or many) into the index's reduced space."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.reduction == "pca":
+            return (vectors - self.mean) @ self.components.T
+        if self.reduction == "truncate":
+            return normalize(vectors[..., : self.dimensions])
+        return vectors
+
+    def approximate_distances(self, query: np.ndarray) -> np.ndarray:
+        """Squared L2 distances between the reduced query and every int8 code."""
+        q = self.reduce(np.asarray(query, dtype=np.float32).reshape(-1))
+        dots = self.codes @ (self.scale * q) + self.offset @ q
+        return self.sq_norms - 2 * dots + q @ q
+
+    def shortlist(
+        self, query: np.ndarray, k: int, rescore_factor: int = 4, sources: list[str] | None = None
+    ) -> list[str]:
+        """Ids of the `k * rescore_factor` nearest chunks by approximate distance."""
+        if not len(self):
+            return []
+        distances = self.approximate_distances(query)
+        if sources:
+            distances = np.where(np.isin(self.sources, sources), distances, np.inf)
+        n = min(k * rescore_factor, int(np.isfinite(distances).sum()))
+        if n <= 0:
+            return []
+        top = np.argpartition(distances, n - 1)[:n]
+        return [str(i) for i in self.ids[top[np.argsort(distances[top])]]]
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self.components is None else self.components.nbytes + self.mean.nbytes
+        return self.codes.nbytes + self.sq_norms.nbytes + self.scale.nbytes * 2 + extra
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {
+            "ids": self.ids,
+            "sources": self.sources,
+            "codes": self.codes,
+            "scale": self.scale,
+            "offset": self.offset,
+            "sq_norms": self.sq_norms,
+            "reduction": np.array(self.reduction),
+            "dimensions": np.array(self.dimensions),
+        }
+        if self.components is not None:
+            arrays.update(mean=self.mean, components=self.components)
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "QuantizedIndex | None":
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return cls(
+                    ids=data["ids"],
+                    sources=data["sources"],
+                    codes=data["codes"],
+                    scale=data["scale"],
+                    offset=data["offset"],
+                    sq_norms=data["sq_norms"],
+                    reduction=str(data["reduction"]),
+                    mean=data.get("mean"),
+                    components=data.get("components"),
+                    dimensions=int(data["dimensions"]),
+                )
+        except Exception as e:
+            logger.error(f"Error loading quantized index from {path}: {e}")
+            return None
+
+    @classmethod
+    def shared(cls, path: str) -> "QuantizedIndex | None":
+        """The process-wide index loaded from `path`, reloaded when the file changes."""
+        return _shared_indexes.get(path)
+
+
+_shared_indexes = FileCache(QuantizedIndex.load)
+
+
+def recall_report(
+    index: QuantizedIndex,
+    vectors: np.ndarray,
+    k: int = 5,
+    rescore_factor: int = 4,
+    metric: str = "l2",
+    sample: int = 200,
+    seed: int = 0,
+) -> dict:
+    """Recall@k of the quantised index against full-precision brute force.
+
+    A sample of stored chunk embeddings is used as queries (each query's own
+    chunk is excluded from both result lists), so no embedding calls are
+    needed. Reports recall of the int8 scan alone and after rescoring the
+    shortlist with full-precision vectors, plus index sizes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(n, size=min(sample, n), replace=False) if n else []
+    k = min(k, n - 1) if n > 1 else 0
+
+    int8_hits = rescored_hits = total = 0
+    for qi in queries:
+        exact = exact_distances(vectors[qi], vectors, metric)
+        exact[qi] = np.inf
+        truth = set(np.argsort(exact)[:k].tolist())
+
+        approx = index.approximate_distances(vectors[qi])
+        approx[qi] = np.inf
+        shortlist = np.argsort(approx)[: k * rescore_factor]
+        int8_hits += len(truth & set(shortlist[:k].tolist()))
+
+        rescored = shortlist[np.argsort(exact[shortlist])][:k]
+        rescored_hits += len(truth & set(rescored.tolist()))
+        total += k
+
+    return {
+        "chunks": n,
+        "reduction": index.reduction,
+        "dimensions": index.dimensions,
+        "original_dimensions": int(vectors.shape[1]) if n else 0,
+        "float32_bytes": int(vectors.nbytes),
+        "index_bytes": int(index.nbytes),
+        "k": k,
+        "rescore_factor": rescore_factor,
+        "queries": len(queries),
+        "recall_at_k_int8": round(int8_hits / total, 4) if total else None,
+        "recall_at_k_rescored": round(rescored_hits / total, 4) if total else None,
+    }
@@ -0,0 +1,251 @@
+from functools import lru_cache
+import os
+import re
+import threading
+import time
+
+from langchain_core.documents import Document
+import numpy as np
+
+from config import RERANK_BUDGET_MS, RERANK_MODEL_PATH, RERANK_THREADS
+
+from ...services.logger import get_logger
+from .mmr import normalize
+from .tokens import content_terms
+
+logger = get_logger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class RerankBudgetExceeded(Exception):
+    """Raised by scorers that notice the request's rerank deadline has passed."""
+
+
+def _bigrams(text: str) -> set[tuple[str, str]]:
+    words = _WORD_RE.findall(text.lower())
+    return set(zip(words, words[1:], strict=False))
+
+
+def _cosine(query_embedding: np.ndarray, doc_embeddings: np.ndarray) -> np.ndarray:
+    query = normalize(np.asarray(query_embedding, dtype=np.float32).reshape(-1))
+    return normalize(np.asarray(doc_embeddings, dtype=np.float32)) @ query
+
+
+class OnnxCrossEncoder:
+    """Small cross-encoder (e.g. ms-marco-MiniLM) exported to ONNX and run on CPU.
+
+    `model_dir` must contain `model.onnx` and a Hugging Face `tokenizer.json`.
+    `onnxruntime` and `tokenizers` are imported lazily, so the rest of the
+    retrieval pipeline works without them.
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_length: int = 256,
+        batch_size: int = 16,
+        threads: int = RERANK_THREADS,
+    ):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+
+    def score(self, query: str, texts: list[str], deadline: float | None = None) -> np.ndarray:
+        """Return one relevance logit per text, checking `deadline` between batches."""
+        logits = []
+        for start in range(0, len(texts), self.batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                raise RerankBudgetExceeded()
+            batch = texts[start : start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([(query, text) for text in batch])
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            output = self.session.run(
+                None, {k: v for k, v in feeds.items() if k in self.input_names}
+            )[0]
+            # Single-logit models score relevance directly; two-class models put it last
+            logits.append(output[:, -1] if output.ndim == 2 else output)
+        return np.concatenate(logits).astype(np.float32)
+
+
+class LocalReranker:
+    """CPU re-scoring of over-fetched candidates under a hard time budget.
+
+    Each candidate's score blends:
+      - dense: cosine similarity of the query and chunk embeddings (or the
+        chunk's `metadata["score"]` when embeddings aren't available),
+      - lexical: share of query content words found in the chunk,
+      - phrase: share of query bigrams found verbatim in the chunk,
+      - source: share of query content words in the chunk's file name,
+    and, when a cross-encoder is configured, its sigmoid-squashed logit.
+
+    Scoring runs on the request's own thread and checks the deadline between
+    candidates (and between cross-encoder batches). Once `budget_ms` has
+    passed, the candidates are returned in their original (dense) order, so
+    reranking costs at most the budget plus one batch, however many
+    requests run at once.
+    """
+
+    def __init__(
+        self,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cross_encoder: OnnxCrossEncoder | None = None,
+        dense_weight: float = 0.5,
+        lexical_weight: float = 0.3,
+        phrase_weight: float = 0.15,
+        source_weight: float = 0.05,
+        cross_encoder_weight: float = 0.7,
+    ):
+        self.budget_ms = budget_ms
+        self.cross_encoder = cross_encoder
+        self.weights = np.array(
+            [dense_weight, lexical_weight, phrase_weight, source_weight], dtype=np.float32
+        )
+        self.cross_encoder_weight = cross_encoder_weight
+        self._local = threading.local()
+
+    @property
+    def last_stats(self) -> dict:
+        """Timing and fallback use of the last `rerank` call on this thread."""
+        return getattr(self._local, "stats", {})
+
+    @last_stats.setter
+    def last_stats(self, stats: dict):
+        self._local.stats = stats
+
+    @classmethod
+    def from_config(cls) -> "LocalReranker":
+        """Build a reranker, adding the ONNX cross-encoder if `RERANK_MODEL_PATH` is set."""
+        cross_encoder = None
+        if RERANK_MODEL_PATH:
+            try:
+                cross_encoder = OnnxCrossEncoder(RERANK_MODEL_PATH)
+                logger.info(f"Loaded rerank cross-encoder from {RERANK_MODEL_PATH}")
+            except Exception as e:
+                logger.error(f"Failed to load rerank cross-encoder, using local features: {e}")
+        return cls(cross_encoder=cross_encoder)
+
+    def _features(
+        self,
+        query: str,
+        docs: list[Document],
+        query_embedding: np.ndarray | None,
+        doc_embeddings: np.ndarray | None,
+        deadline: float,
+    ) -> np.ndarray:
+        if query_embedding is not None and doc_embeddings is not None and len(doc_embeddings):
+            dense = _cosine(query_embedding, doc_embeddings)
+        else:
+            dense = np.array(
+                [doc.metadata.get("score", 1.0 - i / len(docs)) for i, doc in enumerate(docs)],
+                dtype=np.float32,
+            )
+
+        query_terms = content_terms(query)
+        query_bigrams = _bigrams(query)
+        features = np.zeros((len(docs), 4), dtype=np.float32)
+        features[:, 0] = dense
+        for i, doc in enumerate(docs):
+            if time.perf_counter() > deadline:
+                raise RerankBudgetExceeded()
+            if query_terms:
+                source = os.path.basename(str(doc.metadata.get("source", ""))).replace("_", " ")
+                features[i, 1] = len(query_terms & content_terms(doc.page_content))
+                features[i, 3] = len(query_terms & content_terms(source))
+            if query_bigrams:
+                features[i, 2] = len(query_bigrams & _bigrams(doc.page_content))
+
+        features[:, [1, 3]] /= max(len(query_terms), 1)
+        features[:, 2] /= max(len(query_bigrams), 1)
+        return features
+
+    def _score(self, query, docs, query_embedding, doc_embeddings, deadline) -> np.ndarray:
+        features = self._features(query, docs, query_embedding, doc_embeddings, deadline)
+        scores = features @ self.weights
+        if self.cross_encoder is not None:
+            logits = self.cross_encoder.score(query, [d.page_content for d in docs], deadline)
+            cross = 1.0 / (1.0 + np.exp(-logits))
+            scores = self.cross_encoder_weight * cross + (1 - self.cross_encoder_weight) * scores
+        return scores
+
+    def rerank(
+        self,
+        query: str,
+        docs: list[Document],
+        top_k: int,
+        query_embedding: np.ndarray | None = None,
+        doc_embeddings: np.ndarray | None = None,
+    ) -> list[Document]:
+        """Return the `top_k` best candidates, or the first `top_k` if over budget.
+
+        Reranked chunks carry their new score as `metadata["rerank_score"]`.
+        Timing and whether the fallback was used are kept on `last_stats`,
+        per thread, since one reranker serves concurrent requests.
+        """
+        if len(docs) <= 1:
+            return docs[:top_k]
+
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        try:
+            scores = self._score(query, docs, query_embedding, doc_embeddings, deadline)
+        except RerankBudgetExceeded:
+            self.last_stats = {
+                "candidates": len(docs),
+                "elapsed_ms": (time.perf_counter() - start) * 1000,
+                "fallback": True,
+            }
+            logger.warning(
+                f"Rerank exceeded {self.budget_ms} ms budget; keeping dense order "
+                f"for {len(docs)} candidates"
+            )
+            return docs[:top_k]
+        except Exception as e:
+            logger.error(f"Rerank failed, keeping dense order: {e}")
+            self.last_stats = {"candidates": len(docs), "fallback": True}
+            return docs[:top_k]
+
+        # Stable sort keeps the dense order among equal scores
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        reranked = []
+        for i in order:
+            doc = docs[int(i)]
+            doc.metadata["rerank_score"] = round(float(scores[i]), 4)
+            reranked.append(doc)
+
+        self.last_stats = {
+            "candidates": len(docs),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+            "fallback": False,
+        }
+        logger.info(
+            "Reranked %d -> %d chunks in %.1f ms",
+            len(docs),
+            len(reranked),
+            self.last_stats["elapsed_ms"],
+        )
+        return reranked
+
+
+@lru_cache(maxsize=1)
+def get_default_reranker() -> LocalReranker:
+    """Process-wide reranker so the cross-encoder is loaded only once."""
+    return LocalReranker.from_config()
@@ -1,20 +1,207 @@
+import json
+import os
+import threading
+import time
+
 from langchain_core.documents import Document
 from langchain_core.runnables import RunnableLambda
 
-from config import TOP_K
+from config import (
+    HIERARCHICAL_RETRIEVAL,
+    HIERARCHICAL_TOP_FILES,
+    MMR_FETCH_K,
+    MMR_LAMBDA,
+    PARENT_DOCUMENTS,
+    RERANK,
+    RERANK_FETCH_K,
+    RERANK_TOP_K,
+    RETRIEVAL_MAX_K,
+    RETRIEVAL_MIN_SCORE,
+    RETRIEVAL_MODE,
+    RETRIEVAL_SCORE_LOG,
+    TOP_K,
+)
 
 from ...services.logger import get_logger
+from ...services.metrics import stage_timer
+from .doc_index import DOC_INDEX_FILE, DocumentIndex
+from .mmr import maximal_marginal_relevance
+from .parents import PARENT_STORE_FILE, ParentStore, expand_to_parents
+from .reranker import LocalReranker, get_default_reranker
 from .vectorstore import VectorStore
 
 logger = get_logger(__name__)
 
+_score_log_lock = threading.Lock()
+
+
+def export_scores(path: str, record: dict):
+    """Append a single score record as a JSON line to `path`.
+
+    Used to collect relevance score distributions for tuning
+    `RETRIEVAL_MIN_SCORE`. Failures are logged and never raised.
+    """
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with _score_log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except Exception as e:
+        logger.error(f"Failed to export retrieval scores to {path}: {e}")
+
 
 class Retriever:
-    """Simple retriever wrapper around the project's VectorStore."""
+    """Simple retriever wrapper around the project's VectorStore.
+
+    Three modes are supported:
+      - "similarity": always return `top_k` chunks.
+      - "scored": fetch up to `max_k` chunks and keep only those whose
+        relevance score is at least `min_score`. Off-topic queries can
+        therefore return no chunks at all.
+      - "mmr": fetch `fetch_k` candidates and pick `top_k` of them by maximal
+        marginal relevance, so near-duplicate chunks (the same FAQ answer
+        ingested from several files) don't crowd out other sources.
 
-    def __init__(self, vector_store: VectorStore | None = None, top_k: int = TOP_K):
+    With a `reranker`, "similarity" and "scored" retrieval over-fetch
+    `rerank_fetch_k` candidates (scored mode still applies `min_score`) and
+    the reranker keeps the best `rerank_top_k` of them.
+
+    With a `doc_index`, retrieval is two-stage: the query is matched against
+    per-file summary embeddings first and chunk search (in any mode) is then
+    restricted to the `top_files` best files.
+
+    With a `parent_store`, the selected child chunks are finally expanded to
+    their de-duplicated parent sections.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore | None = None,
+        top_k: int = TOP_K,
+        mode: str = RETRIEVAL_MODE,
+        min_score: float = RETRIEVAL_MIN_SCORE,
+        max_k: int = RETRIEVAL_MAX_K,
+        score_log_path: str | None = RETRIEVAL_SCORE_LOG,
+        lambda_mult: float = MMR_LAMBDA,
+        fetch_k: int = MMR_FETCH_K,
+        reranker: LocalReranker | None = None,
+        rerank_fetch_k: int = RERANK_FETCH_K,
+        rerank_top_k: int = RERANK_TOP_K,
+        parent_store: ParentStore | None = None,
+        doc_index: DocumentIndex | None = None,
+        top_files: int = HIERARCHICAL_TOP_FILES,
+    ):
         self.vector_store = vector_store or VectorStore()
         self.top_k = top_k
+        self.mode = mode
+        self.min_score = min_score
+        self.max_k = max_k
+        self.score_log_path = score_log_path
+        self.lambda_mult = lambda_mult
+        self.fetch_k = fetch_k
+        self.reranker = reranker or (get_default_reranker() if RERANK else None)
+        self.rerank_fetch_k = rerank_fetch_k
+        self.rerank_top_k = rerank_top_k
+        if parent_store is None and PARENT_DOCUMENTS:
+            parent_store = ParentStore.shared(
+                os.path.join(self.vector_store.persist_directory, PARENT_STORE_FILE)
+            )
+        self.parent_store = parent_store
+        if doc_index is None and HIERARCHICAL_RETRIEVAL:
+            doc_index = DocumentIndex.shared(
+                os.path.join(self.vector_store.persist_directory, DOC_INDEX_FILE)
+            )
+        self.doc_index = doc_index
+        self.top_files = top_files
+        self.last_sources: list[str] = []
+        self.last_scores: list[float] = []
+
+    def _scope(self, query: str) -> dict:
+        """First stage of hierarchical retrieval: pick the top files for `query`.
+
+        Returns keyword arguments restricting the vector store search to those
+        files (and reusing the query embedding), or `{}` for flat search.
+        """
+        self.last_sources = []
+        if self.doc_index is None or not len(self.doc_index):
+            return {}
+        embedding = self.vector_store.embed_query(query)
+        with stage_timer("file_select"):
+            top = self.doc_index.top_sources(embedding, self.top_files)
+        self.last_sources = [s for s, _ in top]
+        logger.info("Hierarchical retrieval narrowed search to %s", self.last_sources)
+        return {"sources": self.last_sources, "embedding": embedding}
+
+    def _scored_search(self, query: str, **scope) -> list[Document]:
+        """Relevance-thresholded search with a maximum result budget."""
+        scored = self.vector_store.search_with_scores(query, K=self.max_k, **scope)
+        self.last_scores = [score for _, score in scored]
+        kept = [doc for doc, score in scored if score >= self.min_score]
+
+        logger.info(
+            "Scored retrieval kept %d/%d chunks (min_score=%s, max_k=%s)",
+            len(kept),
+            len(scored),
+            self.min_score,
+            self.max_k,
+        )
+
+        if self.score_log_path:
+            export_scores(
+                self.score_log_path,
+                {
+                    "ts": time.time(),
+                    "scores": [round(s, 4) for s in self.last_scores],
+                    "min_score": self.min_score,
+                    "kept": len(kept),
+                },
+            )
+        return kept
+
+    def _mmr_search(self, query: str, **scope) -> list[Document]:
+        """Diversified search: MMR re-selection over a larger candidate pool."""
+        query_embedding, candidates, vectors = self.vector_store.search_candidates(
+            query, K=max(self.fetch_k, self.top_k), **scope
+        )
+        if not candidates:
+            return []
+
+        with stage_timer("mmr"):
+            selected = maximal_marginal_relevance(
+                query_embedding, vectors, k=self.top_k, lambda_mult=self.lambda_mult
+            )
+        self.last_scores = [candidates[i].metadata.get("score") for i in selected]
+        logger.info(
+            "MMR retrieval selected %d/%d candidates (lambda=%s, fetch_k=%s)",
+            len(selected),
+            len(candidates),
+            self.lambda_mult,
+            self.fetch_k,
+        )
+        return [candidates[i] for i in selected]
+
+    def _reranked_search(self, query: str, **scope) -> list[Document]:
+        """Over-fetch dense candidates and let the reranker pick the final chunks."""
+        query_embedding, candidates, vectors = self.vector_store.search_candidates(
+            query, K=max(self.rerank_fetch_k, self.rerank_top_k), **scope
+        )
+        if self.mode == "scored":
+            keep = [
+                i for i, doc in enumerate(candidates) if doc.metadata["score"] >= self.min_score
+            ]
+            candidates = [candidates[i] for i in keep]
+            vectors = vectors[keep] if len(vectors) else vectors
+        if not candidates:
+            return []
+
+        self.last_scores = [doc.metadata.get("score") for doc in candidates]
+        with stage_timer("rerank"):
+            return self.reranker.rerank(
+                query,
+                candidates,
+                self.rerank_top_k,
+                query_embedding=query_embedding,
+                doc_embeddings=vectors if len(vectors) else None,
+            )
 
     def retrieve(self, query: str) -> list[Document]:
         """Return a list of Documents most relevant to `query`."""
@@ -22,11 +209,30 @@ class Retriever:
             logger.debug("Empty query passed to retriever; returning empty list")
             return []
 
+        with stage_timer("retrieve", getattr(self.vector_store, "model", "")):
+            docs = self._search(query)
+            if self.parent_store is not None and docs:
+                try:
+                    with stage_timer("parent_expand"):
+                        return expand_to_parents(docs, self.parent_store)
+                except Exception as e:
+                    logger.error(f"Parent expansion failed, returning child chunks: {e}")
+            return docs
+
+    def _search(self, query: str) -> list[Document]:
         try:
-            return self.vector_store.search(query, K=self.top_k)
+            scope = self._scope(query)
+            if self.reranker is not None and self.mode != "mmr":
+                return self._reranked_search(query, **scope)
+            if self.mode == "scored":
+                return self._scored_search(query, **scope)
+            if self.mode == "mmr":
+                return self._mmr_search(query, **scope)
+            return self.vector_store.search(query, K=self.top_k, **scope)
         except Exception as e:
+            # Raised, so callers can tell an outage from a search with no results
             logger.error(f"Retriever search error: {e}")
-            return []
+            raise
 
     def __call__(self, query: str) -> list[Document]:
         return self.retrieve(query)
@@ -1,23 +1,41 @@
+import hashlib
+
 from langchain_core.documents import Document
 from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
 
+from config import EMBEDDINGS_PROVIDER, PARENT_MAX_CHARS
+
 from ...services.logger import get_logger
+from .providers import get_embedding_provider
 
 logger = get_logger(__name__)
 
 
+def _has_text(chunk: Document) -> bool:
+    """False for chunks with no letters or digits (e.g. a lone `---` rule)."""
+    return any(ch.isalnum() for ch in chunk.page_content)
+
+
 class DocumentSplitter:
     """Split `Document` objects into smaller chunks suitable for embedding.
 
     The splitter uses a header-aware strategy for Markdown files and a
     recursive character splitter for other content types. Chunk sizes are
-    adjusted based on the selected embedding model to accommodate different
-    model context/embedding limits.
+    taken from the selected embedding provider's declared `chunk_size`
+    unless `chunk_size` is given (the retrieval benchmark sweeps it).
     """
 
-    def __init__(self, model: str = "hf", chunk_overlap: int = 100):
-        self.chunk_size = 500 if model == "hf" else 1500
+    def __init__(
+        self,
+        model: str = EMBEDDINGS_PROVIDER,
+        chunk_overlap: int = 100,
+        parent_max_chars: int = PARENT_MAX_CHARS,
+        chunk_size: int | None = None,
+    ):
+        # Each embedding provider declares the chunk size its model handles well
+        self.chunk_size = chunk_size or get_embedding_provider(model).chunk_size
         self.chunk_overlap = chunk_overlap
+        self.parent_max_chars = parent_max_chars
 
         self.headers_to_split_on = [("#", "Header_1"), ("##", "Header_2"), ("###", "Header_3")]
 
@@ -61,5 +79,60 @@ class DocumentSplitter:
             except Exception as e:
                 logger.error(f"Error splitting document from {source_path}: {e}")
 
+        # Content-free chunks embed to (near-)zero vectors and match every query
+        chunks = [chunk for chunk in chunks if _has_text(chunk)]
         logger.info(f"Split {len(documents)} documents into {len(chunks)} chunks")
         return chunks
+
+    def split_with_parents(
+        self, documents: list[Document]
+    ) -> tuple[dict[str, Document], list[Document]]:
+        """Split documents into parent sections and the child chunks to embed.
+
+        Each markdown header section becomes a parent (sections longer than
+        `parent_max_chars` are cut into several parents), and its child
+        chunks carry the parent's id as `metadata["parent_id"]`. Other file
+        types have no parents and are chunked exactly as in `split`.
+
+        Returns:
+            A `(parents, children)` tuple where `parents` maps id to `Document`.
+        """
+        parents: dict[str, Document] = {}
+        children: list[Document] = []
+
+        child_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            length_function=len,
+            add_start_index=True,
+        )
+        parent_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.parent_max_chars, chunk_overlap=0, length_function=len
+        )
+        md_splitter = MarkdownHeaderTextSplitter(headers_to_split_on=self.headers_to_split_on)
+
+        for doc in documents:
+            source_path = doc.metadata.get("source", "")
+            if not source_path.lower().endswith(".md"):
+                children.extend(self.split([doc]))
+                continue
+
+            try:
+                for section in md_splitter.split_text(doc.page_content):
+                    section.metadata = {**doc.metadata, **section.metadata}
+                    for parent in parent_splitter.split_documents([section]):
+                        content_hash = hashlib.md5(parent.page_content.encode()).hexdigest()
+                        parent_id = f"{source_path}::parent::{content_hash}"
+                        parents[parent_id] = parent
+
+                        for child in filter(_has_text, child_splitter.split_documents([parent])):
+                            child.metadata["parent_id"] = parent_id
+                            children.append(child)
+            except Exception as e:
+                logger.error(f"Error splitting document from {source_path} into parents: {e}")
+
+        logger.info(
+            f"Split {len(documents)} documents into {len(parents)} parents "
+            f"and {len(children)} child chunks"
+        )
+        return parents, children
@@ -0,0 +1,69 @@
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from .embeddings.local import HashingEmbedding
+from .tokens import CHARS_PER_TOKEN, estimate_tokens
+
+STUB_RESPONSE = (
+    "This is a stub answer from UniPal. In production this reply is generated by the "
+    "configured LLM from the retrieved Babcock University context."
+)
+
+
+class StubEmbedding(HashingEmbedding):
+    """Hashing embedder that also sleeps for `latency_ms` per call.
+
+    Stands in for a hosted endpoint when load-testing the chat path offline.
+    """
+
+    def __init__(self, size: int = 384, latency_ms: float = 0.0):
+        super().__init__(size=size)
+        self.latency_ms = latency_ms
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency_ms / 1000)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency_ms / 1000)
+        return super().embed_query(text)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that waits `latency_ms` and returns a canned answer.
+
+    Reports token usage like a real provider (input estimated from the
+    prompt) and honours `max_output_tokens`, so budgets and metrics behave
+    as in production.
+    """
+
+    latency_ms: float = 0.0
+    response: str = STUB_RESPONSE
+    temperature: float = 0.2
+    max_output_tokens: int | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency_ms / 1000)
+        text, finish_reason = self.response, "STOP"
+        if self.max_output_tokens and estimate_tokens(text) > self.max_output_tokens:
+            text, finish_reason = text[: self.max_output_tokens * CHARS_PER_TOKEN], "MAX_TOKENS"
+
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(text)
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+            response_metadata={"finish_reason": finish_reason},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
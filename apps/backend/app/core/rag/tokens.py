@@ -0,0 +1,47 @@
+import math
+import re
+
+from langchain_core.messages import BaseMessage
+
+# Rough average for English prose across the tokenizers we use (Gemini, Llama on Groq).
+# Good enough for budgeting and monitoring; not for billing.
+CHARS_PER_TOKEN = 4
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORD_TEXT = (
+    "a an and are as at be by can do does for from how i in is it me my of on or "
+    "the their there this to was what when where which who why will with you your"
+)
+_STOPWORDS = frozenset(_STOPWORD_TEXT.split())
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of LLM tokens in `text` without calling a tokenizer."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(messages: list[BaseMessage]) -> dict[str, int]:
+    """Estimate token counts of a chat prompt, grouped by message type.
+
+    Returns a dict such as `{"system": 830, "human": 412, "total": 1242}`.
+    """
+    counts: dict[str, int] = {}
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        counts[message.type] = counts.get(message.type, 0) + estimate_tokens(content)
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+def content_terms(text: str) -> set[str]:
+    """Lowercased content words with a naive plural strip ("fees" -> "fee")."""
+    terms = set()
+    for word in _WORD_RE.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.add(word)
+    return terms
@@ -1,32 +1,82 @@
+import math
 import os
 import time
 
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
+import numpy as np
 
-from config import CHROMA_PATH, TOP_K
+from config import (
+    CHROMA_PATH,
+    EMBED_BATCHING,
+    EMBEDDINGS_PROVIDER,
+    INDEX_RESCORE_FACTOR,
+    TOP_K,
+    VECTOR_INDEX,
+)
 
 from ...services.logger import get_logger
-from .embeddings.gemini import GeminiEmbedding
-from .embeddings.hf import HFEmbedding
+from ...services.metrics import model_label, stage_timer
+from .embeddings.batching import shared_batcher
+from .providers import EMBEDDING_PROVIDERS, get_embedding_provider
+from .quantize import QUANTIZED_INDEX_FILE, QuantizedIndex, exact_distances
 
 logger = get_logger(__name__)
 
 
+def relevance_score(distance: float, metric: str) -> float:
+    """Turn a Chroma distance into a relevance score, higher is better.
+
+    Same scale as LangChain's relevance functions, so thresholds such as
+    `RETRIEVAL_MIN_SCORE` keep their meaning.
+    """
+    if metric == "cosine":
+        return 1.0 - distance
+    if metric == "ip":
+        return 1.0 - distance if distance > 0 else -distance
+    return 1.0 - distance / math.sqrt(2)
+
+
 class VectorStore:
-    """Wrapper around a Chroma persistence layer."""
+    """Wrapper around a Chroma persistence layer.
+
+    `use_model` names an embedding provider from the registry in
+    `providers.py`; its batch size and rate limit drive `add_documents`.
+    Passing `embeddings` directly skips the registry (the provider name
+    then only picks the persistence subdirectory).
+
+    With `quantized=True`, vector queries scan the int8 `QuantizedIndex`
+    built at ingest time for a shortlist and rescore it with the float
+    embeddings stored in Chroma. Without an index file, Chroma's own search
+    is used.
+    """
 
     def __init__(
         self,
         persist_directory: str = CHROMA_PATH,
-        use_model: str = "hf",
+        use_model: str = EMBEDDINGS_PROVIDER,
         embeddings: Embeddings | None = None,
+        quantized: bool = VECTOR_INDEX == "quantized",
+        rescore_factor: int = INDEX_RESCORE_FACTOR,
     ):
         self.model = use_model
         self.persist_directory = os.path.join(persist_directory, use_model)
-        self.embeddings = embeddings or (HFEmbedding() if self.model == "hf" else GeminiEmbedding())
+        self.provider = EMBEDDING_PROVIDERS.get(use_model)
+        if embeddings is None:
+            self.provider = get_embedding_provider(use_model)
+            embeddings = (
+                shared_batcher(self.model, self.provider.create)
+                if EMBED_BATCHING
+                else self.provider.create()
+            )
+        self.embeddings = embeddings
         self.vector_store = None
+        self.quantized = quantized
+        self.rescore_factor = rescore_factor
+        self.quantized_index: QuantizedIndex | None = None
+        # Chroma's default space; `hnsw:space` here would pick "cosine" or "ip"
+        self.collection_metadata = {"hnsw:space": "l2"}
 
     def initialize_db(self):
         """Create the persistence directory (if needed) and initialize Chroma."""
@@ -38,11 +88,32 @@ class VectorStore:
                 persist_directory=self.persist_directory,
                 embedding_function=self.embeddings,
                 collection_name="unipal_knowledge_base",
+                collection_metadata=self.collection_metadata,
             )
             logger.info("Initialized Chroma vector store successfully")
         except Exception as e:
             logger.error(f"Error initializing Chroma vector store: {e}")
 
+        if self.quantized:
+            self.load_quantized_index()
+
+    def load_quantized_index(self):
+        """Use the int8 index written by ingestion, if there is one.
+
+        The index is loaded once per process and shared by every store; it is
+        reloaded only after ingestion rewrites the file.
+        """
+        path = os.path.join(self.persist_directory, QUANTIZED_INDEX_FILE)
+        self.quantized_index = QuantizedIndex.shared(path)
+        if self.quantized_index is None:
+            logger.warning(f"No quantized index at {path}; using Chroma search")
+        else:
+            logger.debug("Using quantized index with %d chunks", len(self.quantized_index))
+
+    def distance_metric(self) -> str:
+        """The collection's distance metric: "l2" (Chroma's default), "cosine" or "ip"."""
+        return self.collection_metadata.get("hnsw:space", "l2")
+
     def _ensure_initialized(self):
         """Initialize the DB if not already done."""
         if not self.vector_store:
@@ -61,7 +132,8 @@ class VectorStore:
             for doc, meta in zip(documents, metadata, strict=False):
                 doc.metadata.update(meta)
 
-        batch_size = 100
+        batch_size = self.provider.batch_size if self.provider else 100
+        interval = self.provider.batch_interval_s if self.provider else 0.0
         upserted = 0
         for i in range(0, len(documents), batch_size):
             batch_docs = documents[i : i + batch_size]
@@ -78,13 +150,13 @@ class VectorStore:
 
             upserted += len(batch_docs)
 
-            # Rate-limit buffer for Gemini
-            if self.model == "gemini" and i + batch_size < len(documents):
+            # Rate-limit buffer for providers with a requests-per-minute limit
+            if interval and i + batch_size < len(documents):
                 logger.info(
                     f"Upserted batch {i // batch_size + 1} of {(len(documents) + batch_size - 1) // batch_size}"
                 )
-                logger.info("Sleeping for 10 seconds to respect Gemini rate limits...")
-                time.sleep(10)  # Sleep for 10 seconds after each batch when using Gemini
+                logger.info(f"Sleeping for {interval:.1f}s to respect {self.model} rate limits...")
+                time.sleep(interval)
 
         logger.info(f"Upserted {upserted} chunks into vector store")
         return upserted
@@ -103,17 +175,177 @@ class VectorStore:
         except Exception as e:
             logger.error(f"Error deleting chunks for source {source}: {e}")
 
-    def search(self, query: str, K: int = TOP_K) -> list[Document]:
-        """Search the vector store for the most relevant chunks."""
+    def embed_query(self, query: str) -> list[float]:
+        """Embed `query` with this store's embeddings, timed as the "embed" stage."""
+        with stage_timer("embed", self.model, model_label(self.embeddings)):
+            return self.embeddings.embed_query(query)
+
+    def search(
+        self,
+        query: str,
+        K: int = TOP_K,
+        sources: list[str] | None = None,
+        embedding: list[float] | None = None,
+    ) -> list[Document]:
+        """Search the vector store for the most relevant chunks.
+
+        `sources` restricts the search to those files; `embedding` skips
+        re-embedding a query that was already embedded.
+        """
         self._ensure_initialized()
         try:
-            retriever = self.vector_store.as_retriever(search_kwargs={"k": K})
-            results = retriever.invoke(query)
-            logger.info(f"Found {len(results)} results for query: '{query}'")
+            if embedding is None:
+                embedding = self.embed_query(query)
+            if sources or self.quantized_index is not None:
+                results, _, _ = self._query_by_vector(embedding, K, sources=sources)
+                logger.info("Found %d results for a %d-char query", len(results), len(query))
+                return results
+            with stage_timer("vector_search", self.model, "chroma"):
+                results = self.vector_store.similarity_search_by_vector(embedding, k=K)
+            logger.info("Found %d results for a %d-char query", len(results), len(query))
             return results
         except Exception as e:
             logger.error(f"Error searching vector store: {e}")
-            return []
+            raise
+
+    @staticmethod
+    def _source_filter(sources: list[str] | None) -> dict | None:
+        if not sources:
+            return None
+        return {"source": {"$in": list(sources)}}
+
+    def _query_by_vector(
+        self,
+        embedding: list[float],
+        K: int,
+        include_embeddings: bool = False,
+        sources: list[str] | None = None,
+    ) -> tuple[list[Document], list[float], np.ndarray | None]:
+        """Search by vector, returning chunks, relevance scores and optionally embeddings.
+
+        Chroma reports raw distances; these are converted to relevance scores
+        with the collection's distance metric and stored on each chunk as
+        `metadata["score"]`. `sources` restricts the search to those files.
+        """
+        if self.quantized_index is not None:
+            with stage_timer("vector_search", self.model, "quantized"):
+                docs, distances, vectors = self._query_quantized(embedding, K, sources)
+        else:
+            with stage_timer("vector_search", self.model, "chroma"):
+                found = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+                    embedding, k=K, filter=self._source_filter(sources)
+                )
+            docs = [doc for doc, _ in found]
+            distances = [distance for _, distance in found]
+            vectors = self._embeddings_of([doc.id for doc in docs]) if include_embeddings else None
+
+        metric = self.distance_metric()
+        scores = [relevance_score(distance, metric) for distance in distances]
+        for doc, score in zip(docs, scores, strict=True):
+            doc.metadata["score"] = score
+        return docs, scores, vectors if include_embeddings else None
+
+    def _embeddings_of(self, ids: list[str]) -> np.ndarray:
+        """Stored float embeddings of the chunks `ids`, in that order."""
+        if not ids:
+            return np.empty((0, 0), dtype=np.float32)
+        found = self.vector_store.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(found["ids"], found["embeddings"], strict=True))
+        return np.asarray([by_id[i] for i in ids], dtype=np.float32)
+
+    def _query_quantized(
+        self, embedding: list[float], K: int, sources: list[str] | None
+    ) -> tuple[list[Document], list[float], np.ndarray]:
+        """Int8 shortlist, then exact rescoring with the float vectors from Chroma.
+
+        Returns the best `K` chunks with their distances and stored embeddings.
+        """
+        shortlist = self.quantized_index.shortlist(
+            embedding, K, rescore_factor=self.rescore_factor, sources=sources
+        )
+        if not shortlist:
+            return [], [], np.empty((0, 0), dtype=np.float32)
+
+        found = self.vector_store.get(
+            ids=shortlist, include=["documents", "metadatas", "embeddings"]
+        )
+        vectors = np.asarray(found["embeddings"], dtype=np.float32)
+        distances = exact_distances(embedding, vectors, self.distance_metric())
+        order = [i for i in np.argsort(distances) if found["documents"][i] is not None][:K]
+        docs = [
+            Document(
+                page_content=found["documents"][i],
+                metadata=dict(found["metadatas"][i] or {}),
+                id=found["ids"][i],
+            )
+            for i in order
+        ]
+        return docs, [float(distances[i]) for i in order], vectors[order]
+
+    def get_all_embeddings(self) -> tuple[list[str], list[str], np.ndarray]:
+        """Return ids, sources and float embeddings of every chunk in the collection."""
+        self._ensure_initialized()
+        results = self.vector_store.get(include=["metadatas", "embeddings"])
+        sources = [(m or {}).get("source", "") for m in results["metadatas"]]
+        return results["ids"], sources, np.asarray(results["embeddings"], dtype=np.float32)
+
+    def search_with_scores(
+        self,
+        query: str,
+        K: int = TOP_K,
+        sources: list[str] | None = None,
+        embedding: list[float] | None = None,
+    ) -> list[tuple[Document, float]]:
+        """Search the vector store and return `(chunk, relevance score)` pairs.
+
+        Scores are normalised by the collection's distance metric so that
+        higher is more relevant (roughly 0..1). The score is also stored on
+        each chunk as `metadata["score"]` for later pipeline stages.
+        """
+        self._ensure_initialized()
+        try:
+            if embedding is None:
+                embedding = self.embed_query(query)
+            docs, scores, _ = self._query_by_vector(embedding, K, sources=sources)
+            logger.info("Found %d scored results for a %d-char query", len(docs), len(query))
+            return list(zip(docs, scores, strict=True))
+        except Exception as e:
+            logger.error(f"Error searching vector store with scores: {e}")
+            raise
+
+    def search_candidates(
+        self,
+        query: str,
+        K: int = TOP_K,
+        sources: list[str] | None = None,
+        embedding: list[float] | None = None,
+    ) -> tuple[np.ndarray, list[Document], np.ndarray]:
+        """Return the query embedding, the top `K` chunks and their stored embeddings.
+
+        Used by re-ranking stages such as MMR that need the candidate vectors
+        without re-embedding the chunks.
+        """
+        self._ensure_initialized()
+        try:
+            if embedding is None:
+                embedding = self.embed_query(query)
+            docs, _, vectors = self._query_by_vector(
+                embedding, K, include_embeddings=True, sources=sources
+            )
+            logger.info("Found %d candidates for a %d-char query", len(docs), len(query))
+            return np.asarray(embedding, dtype=np.float32), docs, vectors
+        except Exception as e:
+            logger.error(f"Error fetching candidates from vector store: {e}")
+            raise
+
+    def get_source_chunks(self, source: str) -> tuple[list[dict], np.ndarray]:
+        """Return the metadata and stored embeddings of every chunk of a source file."""
+        self._ensure_initialized()
+        results = self.vector_store.get(
+            where={"source": source}, include=["metadatas", "embeddings"]
+        )
+        metadatas = [m or {} for m in results["metadatas"]]
+        return metadatas, np.asarray(results["embeddings"], dtype=np.float32)
 
     def get_retriever(self):
         """Return an LCEL-compatible retriever for use in RAG chains."""
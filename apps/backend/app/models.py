@@ -1,8 +1,10 @@
-from datetime import datetime
 import uuid
 
 from flask import current_app
 from itsdangerous import URLSafeTimedSerializer as Serializer
+from sqlalchemy import DDL, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
@@ -13,6 +15,25 @@ from . import db
 # flask db upgrade
 
 
+class server_now(FunctionElement):
+    """The database's current time, used as the server default of timestamp columns."""
+
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(server_now)
+def _server_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(server_now, "sqlite")
+def _server_now_sqlite(element, compiler, **kw):
+    # SQLite keeps datetimes as text and compares them as strings, so write
+    # the same "YYYY-MM-DD HH:MM:SS.ffffff" form SQLAlchemy binds parameters in
+    return "(strftime('%Y-%m-%d %H:%M:%f000', 'now'))"
+
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -32,10 +53,13 @@ class User(db.Model):
     google_id = db.Column(db.String(100), unique=True, nullable=True)
     avatar_url = db.Column(db.String(255), nullable=True)
 
-    created_at = db.Column(db.DateTime, default=datetime.now())
+    created_at = db.Column(db.DateTime, server_default=server_now())
 
-    # Relationships
-    chats = db.relationship("Chat", backref="user", lazy="dynamic", cascade="all, delete-orphan")
+    # Relationships. Chats (and their messages) are removed by ON DELETE CASCADE
+    # rather than loaded and deleted one by one; see services/deletion.py
+    chats = db.relationship(
+        "Chat", backref="user", lazy="dynamic", cascade="all, delete-orphan", passive_deletes=True
+    )
     complaints = db.relationship(
         "Complaint", backref="user", lazy="dynamic", cascade="all, delete-orphan"
     )
@@ -123,27 +147,56 @@ class TokenBlocklist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     jti = db.Column(db.String(36), nullable=False, index=True)
-    created_at = db.Column(db.DateTime, default=datetime.now())
+    created_at = db.Column(db.DateTime, server_default=server_now())
 
 
 class Chat(db.Model):
     __tablename__ = "chats"
+    # Composite indexes match the hot access paths (filter column, then sort key, then id
+    # as the tie-breaker), so listing and paging never scan or sort the whole table
+    __table_args__ = (
+        db.Index("ix_chats_user_id_created_at", "user_id", "created_at", "id"),
+        # Finds soft-deleted chats awaiting purge
+        db.Index("ix_chats_deleted_at", "deleted_at"),
+    )
 
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(
+        db.String(36), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
     title = db.Column(db.String(100), default="New Conversation")
-    created_at = db.Column(db.DateTime, default=datetime.now())
+    created_at = db.Column(db.DateTime, server_default=server_now())
+
+    # Rolling summary of older turns, and the last Message.seq folded into it
+    summary = db.Column(db.Text, nullable=True)
+    summary_seq = db.Column(db.Integer, nullable=True)
+
+    # Highest Message.seq handed out in this chat (see _assign_message_seq)
+    last_message_seq = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # Set when the chat is soft-deleted; hidden from then on and purged in the background
+    deleted_at = db.Column(db.DateTime, nullable=True)
 
     messages = db.relationship(
-        "Message", backref="chat", lazy="dynamic", cascade="all, delete-orphan"
+        "Message",
+        backref="chat",
+        lazy="dynamic",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
     )
 
 
 class Message(db.Model):
     __tablename__ = "messages"
+    # Messages are ordered by their per-chat sequence number, never by timestamp
+    __table_args__ = (db.Index("ix_messages_chat_id_seq", "chat_id", "seq", unique=True),)
 
     id = db.Column(db.Integer, primary_key=True)
-    chat_id = db.Column(db.String(36), db.ForeignKey("chats.id"), nullable=False)
+    chat_id = db.Column(
+        db.String(36), db.ForeignKey("chats.id", ondelete="CASCADE"), nullable=False
+    )
+    # 1, 2, 3, ... within the chat, in insertion order; assigned on insert
+    seq = db.Column(db.Integer, nullable=False)
     role = db.Column(db.String(20), nullable=False)  # 'user' or 'AI'
     content = db.Column(db.Text, nullable=False)
 
@@ -151,15 +204,82 @@ class Message(db.Model):
     is_liked = db.Column(db.Boolean, default=None, nullable=True)
     is_shared = db.Column(db.Boolean, default=True)
 
-    timestamp = db.Column(db.DateTime, default=datetime.now())
+    timestamp = db.Column(db.DateTime, server_default=server_now())
+
+
+@event.listens_for(Message, "before_insert")
+def _assign_message_seq(mapper, connection, target):
+    """Give a new message the next sequence number of its chat.
+
+    The chat's counter is bumped with a single UPDATE ... RETURNING, so
+    concurrent writers to one chat serialize on its row and can never be
+    handed the same number.
+    """
+    if target.seq is not None:
+        return
+    chats = Chat.__table__
+    target.seq = connection.execute(
+        chats.update()
+        .where(chats.c.id == target.chat_id)
+        .values(last_message_seq=chats.c.last_message_seq + 1)
+        .returning(chats.c.last_message_seq)
+    ).scalar_one()
+
+
+# Full-text index over Message.content, kept in step with the table by the
+# database itself so bulk statements are covered too (see services/search.py).
+# SQLite: an external-content FTS5 table fed by triggers. PostgreSQL: a GIN
+# index on the message's tsvector. Autogenerate ignores both (migrations/env.py).
+MESSAGES_FTS_TABLE = "messages_fts"
+MESSAGES_FTS_INDEX = "ix_messages_content_fts"
+FTS_LANGUAGE = "english"
+
+_MESSAGES_FTS_SQLITE = (
+    f"""CREATE VIRTUAL TABLE {MESSAGES_FTS_TABLE} USING fts5(
+        content, content='messages', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE}({MESSAGES_FTS_TABLE}, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END""",
+    f"""CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {MESSAGES_FTS_TABLE}({MESSAGES_FTS_TABLE}, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO {MESSAGES_FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+)
+for _statement in _MESSAGES_FTS_SQLITE:
+    event.listen(Message.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(
+    Message.__table__,
+    "after_create",
+    DDL(
+        f"CREATE INDEX {MESSAGES_FTS_INDEX} ON messages "
+        f"USING gin (to_tsvector('{FTS_LANGUAGE}', content))"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Message.__table__,
+    "after_drop",
+    DDL(f"DROP TABLE IF EXISTS {MESSAGES_FTS_TABLE}").execute_if(dialect="sqlite"),
+)
 
 
 class Complaint(db.Model):
     __tablename__ = "complaints"
+    __table_args__ = (
+        db.Index("ix_complaints_user_id_created_at", "user_id", "created_at", "id"),
+        # Members list every complaint, newest first
+        db.Index("ix_complaints_created_at", "created_at", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(36), db.ForeignKey("users.id"), nullable=False)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default="pending")  # pending, resolved, dismissed
-    created_at = db.Column(db.DateTime, default=datetime.now())
+    created_at = db.Column(db.DateTime, server_default=server_now())
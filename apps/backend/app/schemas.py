@@ -1,7 +1,10 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
+from config import PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX
+
 # Run this script to update types
 
 
@@ -82,6 +85,13 @@ class ChatHistoryResponse(BaseModel):
     chat_id: str
     title: str
     messages: list[ChatMessageResponse]
+    next_cursor: str | None = None
+
+
+# Keyset pagination (query string): pass a page's `next_cursor` as `after`
+class PageQuery(BaseModel):
+    limit: int = Field(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX)
+    after: str | None = None
 
 
 # History / UI schemas
@@ -93,6 +103,7 @@ class ChatSummary(BaseModel):
 
 class ChatsListResponse(BaseModel):
     chats: list[ChatSummary]
+    next_cursor: str | None = None
 
 
 class DeleteResponse(BaseModel):
@@ -103,8 +114,26 @@ class LikeMessageRequest(BaseModel):
     like: bool
 
 
+# Message search (query string); best matches first
+class SearchQuery(PageQuery):
+    q: str = ""
+    mode: Literal["fulltext", "semantic", "hybrid"] = "fulltext"
+
+
+class SearchResult(BaseModel):
+    id: int
+    chat_id: str
+    role: str
+    # Snippet of the message; full-text matches are wrapped in <mark>...</mark>
+    content: str
+    timestamp: datetime | str | None = None
+    is_liked: bool | None = None
+    rank: float
+
+
 class SearchResponse(BaseModel):
-    results: list[ChatMessageResponse]
+    results: list[SearchResult]
+    next_cursor: str | None = None
 
 
 # User profile update schemas
@@ -138,3 +167,4 @@ class ComplaintResponse(BaseModel):
 
 class ComplaintListResponse(BaseModel):
     complaints: list[ComplaintResponse]
+    next_cursor: str | None = None
@@ -0,0 +1,105 @@
+"""Set-based deletion of chats and their messages.
+
+Deleting through the ORM loads every message of a chat and deletes it with
+its own statement. These helpers issue one `DELETE ... WHERE chat_id IN
+(SELECT ...)` per table instead. The schema also cascades the deletes
+(ON DELETE CASCADE), but the messages are deleted explicitly, so SQLite
+connections without foreign key enforcement stay consistent too.
+
+Clearing a very large history uses soft deletion instead: the chats are
+stamped with `deleted_at` in one UPDATE, which hides them at once, and
+`purge_deleted_chats` removes them later in short transactions.
+"""
+
+import threading
+
+from sqlalchemy import delete, func, select, update
+
+from config import PURGE_BATCH_SIZE
+
+from .. import db
+from ..models import Chat, Message, server_now
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def count_messages(*criteria, cap: int) -> int:
+    """Count the messages of chats matching `criteria`, stopping at `cap`."""
+    capped = (
+        select(Message.id)
+        .join(Chat, Message.chat_id == Chat.id)
+        .where(*criteria)
+        .limit(cap)
+        .subquery()
+    )
+    return db.session.scalar(select(func.count()).select_from(capped))
+
+
+def delete_chats(*criteria) -> int:
+    """Delete the chats matching `criteria` and all their messages.
+
+    Two statements whatever the number of messages; the caller commits.
+    Returns the number of chats deleted.
+    """
+    chat_ids = select(Chat.id).where(*criteria)
+    db.session.execute(
+        delete(Message).where(Message.chat_id.in_(chat_ids)),
+        execution_options={"synchronize_session": False},
+    )
+    return db.session.execute(
+        delete(Chat).where(*criteria), execution_options={"synchronize_session": False}
+    ).rowcount
+
+
+def soft_delete_chats(*criteria) -> int:
+    """Hide the chats matching `criteria` until they are purged; the caller commits."""
+    return db.session.execute(
+        update(Chat).where(*criteria, Chat.deleted_at.is_(None)).values(deleted_at=server_now()),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+
+def purge_deleted_chats(batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """Delete soft-deleted chats, committing every `batch_size` messages.
+
+    Short transactions keep locks brief while a large history is removed.
+    Returns the number of chats purged.
+    """
+    deleted = Chat.deleted_at.is_not(None)
+    while True:
+        batch = (
+            select(Message.id)
+            .where(Message.chat_id.in_(select(Chat.id).where(deleted)))
+            .limit(batch_size)
+        )
+        removed = db.session.execute(
+            delete(Message).where(Message.id.in_(batch)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.session.commit()
+        if removed < batch_size:
+            break
+
+    purged = delete_chats(deleted)
+    db.session.commit()
+    if purged:
+        logger.info("Purged %d soft-deleted chats", purged)
+    return purged
+
+
+def purge_deleted_chats_async(app) -> threading.Thread:
+    """Run `purge_deleted_chats` in a background thread so the request isn't delayed."""
+
+    def run():
+        with app.app_context():
+            try:
+                purge_deleted_chats()
+            except Exception as e:
+                logger.error(f"Failed to purge deleted chats: {e}")
+            finally:
+                db.session.remove()
+
+    thr = threading.Thread(target=run, daemon=True)
+    thr.start()
+    return thr
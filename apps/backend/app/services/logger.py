@@ -1,16 +1,111 @@
+import atexit
+import copy
+from datetime import UTC, datetime
+import json
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import random
 import sys
+import threading
+
+from flask import g, has_request_context
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_SAMPLING
+
+TEXT_FORMAT = "[%(asctime)s] %(levelname)s in %(module)s: %(message)s"
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_queue_handler: QueueHandler | None = None
+_setup_lock = threading.Lock()
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the id of the Flask request being served, if any."""
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a `rate` fraction of a logger's records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and request id."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, UTC).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records as-is, leaving message formatting to the listener thread.
+
+    The stock `QueueHandler` formats every message on the calling thread;
+    here only a traceback is rendered up front, because its frames may be
+    gone by the time the listener gets to it.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(
+                record.exc_info
+            )
+            record.exc_info = None
+        return record
+
+
+def _shared_queue_handler() -> QueueHandler:
+    """Start the background listener writing to stdout on first use."""
+    global _queue_handler
+    with _setup_lock:
+        if _queue_handler is None:
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(
+                JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+            )
+            listener = QueueListener(_queue, stream, respect_handler_level=True)
+            listener.start()
+            # Flush whatever is still queued when the process exits
+            atexit.register(listener.stop)
+
+            _queue_handler = LazyQueueHandler(_queue)
+            _queue_handler.addFilter(RequestIdFilter())
+    return _queue_handler
+
 
 def get_logger(name):
     logger = logging.getLogger(name)
     if not logger.handlers:
-        formatter = logging.Formatter(
-            '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
-        )
-        
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(formatter)
-        
-        logger.addHandler(handler)
-        logger.setLevel(logging.INFO)
-    return logger
\ No newline at end of file
+        logger.addHandler(_shared_queue_handler())
+        # The queue handler writes the record; propagating would print it again via root
+        logger.propagate = False
+        logger.setLevel(LOG_LEVEL)
+        rate = LOG_SAMPLING.get(name)
+        if rate is not None and rate < 1:
+            logger.addFilter(SamplingFilter(rate))
+    return logger
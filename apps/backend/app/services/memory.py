@@ -0,0 +1,148 @@
+import threading
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from config import (
+    MEMORY_MAX_MESSAGES,
+    MEMORY_MAX_TOKENS,
+    MEMORY_SUMMARY_BATCH,
+    MEMORY_SUMMARY_MAX_TOKENS,
+)
+
+from .. import db
+from ..core.rag.tokens import CHARS_PER_TOKEN, estimate_tokens
+from ..models import Chat, Message
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Follow-ups shorter than this (in words) are expanded with the previous user turn for retrieval
+FOLLOW_UP_MAX_WORDS = 12
+
+
+def to_chat_messages(messages: list[Message]) -> list[BaseMessage]:
+    """Convert stored `Message` rows into LangChain chat messages."""
+    return [
+        HumanMessage(content=m.content) if m.role == "user" else AIMessage(content=m.content)
+        for m in messages
+    ]
+
+
+def contextualize_query(query: str, history: list[BaseMessage]) -> str:
+    """Build the retrieval query for a (possibly elliptical) follow-up question.
+
+    Short follow-ups such as "what about for postgraduates?" retrieve poorly on
+    their own, so the previous user turn is prepended. Standalone questions
+    are returned unchanged.
+    """
+    if not history or len(query.split()) > FOLLOW_UP_MAX_WORDS:
+        return query
+    previous = next((m.content for m in reversed(history) if m.type == "human"), None)
+    return f"{previous}\n{query}" if previous else query
+
+
+class ConversationMemory:
+    """Bounded, per-chat conversation memory.
+
+    The prompt receives the chat's rolling summary plus the most recent
+    messages that fit in `max_messages` / `max_tokens`. Older messages are
+    folded into `Chat.summary` in batches of `summary_batch`, so prompt size
+    stays constant however long the chat grows.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = MEMORY_MAX_MESSAGES,
+        max_tokens: int = MEMORY_MAX_TOKENS,
+        summary_batch: int = MEMORY_SUMMARY_BATCH,
+        summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS,
+    ):
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.summary_batch = summary_batch
+        self.summary_max_tokens = summary_max_tokens
+
+    def _unsummarized(self, chat: Chat):
+        query = Message.query.filter(Message.chat_id == chat.id)
+        if chat.summary_seq is not None:
+            query = query.filter(Message.seq > chat.summary_seq)
+        return query
+
+    def recent_messages(self, chat: Chat, before_seq: int | None = None) -> list[Message]:
+        """Return the newest unsummarized messages that fit the window, oldest first."""
+        if self.max_messages <= 0:
+            return []
+
+        query = self._unsummarized(chat)
+        if before_seq is not None:
+            query = query.filter(Message.seq < before_seq)
+        candidates = query.order_by(Message.seq.desc()).limit(self.max_messages).all()
+
+        window: list[Message] = []
+        used = 0
+        for message in candidates:
+            cost = estimate_tokens(message.content)
+            if window and used + cost > self.max_tokens:
+                break
+            window.append(message)
+            used += cost
+
+        window.reverse()
+        return window
+
+    def _pending_summary(self, chat: Chat, window: list[Message]) -> list[Message]:
+        """Messages older than the window that are not yet in the summary."""
+        if not window:
+            return []
+        return (
+            self._unsummarized(chat)
+            .filter(Message.seq < window[0].seq)
+            .order_by(Message.seq.asc())
+            .all()
+        )
+
+    def needs_summary(self, chat: Chat, window: list[Message]) -> bool:
+        """True when enough messages have fallen out of the window to summarize."""
+        if not window:
+            return False
+        pending = self._unsummarized(chat).filter(Message.seq < window[0].seq).count()
+        return pending >= self.summary_batch
+
+    def update_summary(self, chat: Chat, llm) -> bool:
+        """Fold messages that dropped out of the window into `chat.summary`.
+
+        Returns True if the summary was updated and committed.
+        """
+        window = self.recent_messages(chat)
+        pending = self._pending_summary(chat, window)
+        if len(pending) < self.summary_batch:
+            return False
+
+        summary = llm.summarize(chat.summary, to_chat_messages(pending))
+        if summary is None:
+            return False
+
+        chat.summary = summary[: self.summary_max_tokens * CHARS_PER_TOKEN]
+        chat.summary_seq = pending[-1].seq
+        db.session.add(chat)
+        db.session.commit()
+        logger.info(f"Updated rolling summary for chat {chat.id} with {len(pending)} messages")
+        return True
+
+    def update_summary_async(self, app, chat_id: str, llm) -> threading.Thread:
+        """Run `update_summary` in a background thread so the request isn't delayed."""
+
+        def run():
+            with app.app_context():
+                try:
+                    chat = db.session.get(Chat, chat_id)
+                    if chat is not None:
+                        self.update_summary(chat, llm)
+                except Exception as e:
+                    logger.error(f"Failed to update summary for chat {chat_id}: {e}")
+                finally:
+                    db.session.remove()
+
+        thr = threading.Thread(target=run, daemon=True)
+        thr.start()
+        return thr
@@ -0,0 +1,226 @@
+import bisect
+from contextlib import contextmanager
+import hmac
+import threading
+import time
+
+from flask import Response, g, request
+
+from config import METRICS_ENABLED, METRICS_TOKEN
+
+# Seconds; covers a sub-millisecond cache lookup up to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values, strict=True)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(values.items())]
+
+
+class Histogram:
+    """Bucketed histogram with labels (cumulative `le` buckets, `_sum`, `_count`)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            counts = {k: list(v) for k, v in self._counts.items()}
+            sums = dict(self._sums)
+        lines = []
+        for key in sorted(counts):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts[key], strict=True):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {sums[key]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics exposed on `/metrics`."""
+
+    def __init__(self):
+        self._metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "unipal_stage_duration_seconds",
+    "Time spent in each stage of a chat turn.",
+    ("stage", "provider", "model"),
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "unipal_http_request_duration_seconds",
+    "Total time to serve an API request.",
+    ("method", "endpoint", "status"),
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "unipal_http_requests_total", "API requests served.", ("method", "endpoint", "status")
+)
+LLM_ERRORS = REGISTRY.counter(
+    "unipal_llm_errors_total", "Failed LLM calls, per provider.", ("provider", "model")
+)
+RETRIEVAL_ERRORS = REGISTRY.counter(
+    "unipal_retrieval_errors_total", "Chat turns that failed while retrieving context."
+)
+LLM_FALLBACKS = REGISTRY.counter(
+    "unipal_llm_fallbacks_total", "Calls answered by trying the fallback LLM.", ("provider",)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "unipal_cache_requests_total", "Cache lookups by cache and hit/miss.", ("cache", "result")
+)
+
+
+def stage_timer(stage: str, provider: str = "", model: str = ""):
+    """Context manager recording the duration of a pipeline stage."""
+    return STAGE_DURATION.time(stage=stage, provider=provider, model=model)
+
+
+def model_label(model) -> str:
+    """Best-effort model name of an LLM or embeddings object, for metric labels."""
+    for attr in ("model", "model_name", "repo_id"):
+        value = getattr(model, attr, None)
+        if isinstance(value, str) and value:
+            return value
+    return getattr(model, "_llm_type", None) or type(model).__name__
+
+
+def init_app(app):
+    """Time every request and serve the registry on `/metrics`.
+
+    With `METRICS_TOKEN` set, `/metrics` answers 401 unless the request
+    carries it as a bearer token.
+    """
+    if not METRICS_ENABLED:
+        return
+    token = METRICS_TOKEN
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None and request.endpoint != "metrics":
+            labels = {
+                "method": request.method,
+                # The route template, not the path, so chat ids don't explode cardinality
+                "endpoint": request.url_rule.rule if request.url_rule else "unmatched",
+                "status": str(response.status_code),
+            }
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+            HTTP_REQUESTS.inc(**labels)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        if token:
+            supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+            if not hmac.compare_digest(supplied.encode(), token.encode()):
+                return Response("Unauthorized\n", status=401, content_type=CONTENT_TYPE)
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
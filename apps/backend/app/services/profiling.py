@@ -0,0 +1,174 @@
+from collections import Counter
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from config import (
+    PROFILE_DIR,
+    PROFILE_INTERVAL_MS,
+    PROFILE_MAX_DIR_MB,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_TOKEN,
+    basedir,
+)
+
+from .logger import get_logger
+from .tracing import REQUEST_ID_HEADER, new_request_id
+
+logger = get_logger(__name__)
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_EXTENSION = ".folded"
+_REQUEST_ID_ENVIRON = "HTTP_" + REQUEST_ID_HEADER.upper().replace("-", "_")
+_PROFILE_ENVIRON = "HTTP_" + PROFILE_HEADER.upper().replace("-", "_")
+
+
+def _frame_label(frame) -> str:
+    """`function (file:line)`, with paths shortened to the backend or package root."""
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(basedir):
+        path = os.path.relpath(path, basedir)
+    elif "site-packages" in path:
+        path = path.split("site-packages" + os.sep, 1)[-1]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Sample one thread's call stack every `interval_s` from a background thread.
+
+    Stacks are counted in the folded format (`root;caller;callee count`)
+    read by flamegraph.pl, speedscope and most flamegraph viewers. Sampling
+    only reads `sys._current_frames()`, so the profiled thread is never
+    instrumented and pays no per-call cost.
+    """
+
+    def __init__(self, thread_id: int, interval_s: float = PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles selected requests.
+
+    A request is profiled when it carries `X-Profile-Token` equal to
+    `token` (only admins are given it) or, otherwise, with probability
+    `sample_rate`. Its folded stacks are written to
+    `<directory>/<request id>.folded`; the request id is the incoming
+    `X-Request-ID` or a fresh one, passed on so the response and any trace
+    carry the same id. The oldest profiles are deleted once the directory
+    exceeds `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        wsgi_app,
+        directory: str = PROFILE_DIR,
+        token: str | None = PROFILE_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        max_bytes: int = PROFILE_MAX_DIR_MB * 1024 * 1024,
+    ):
+        self.wsgi_app = wsgi_app
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval_s = interval_ms / 1000
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _should_profile(self, environ) -> bool:
+        supplied = environ.get(_PROFILE_ENVIRON)
+        if supplied and self.token:
+            return hmac.compare_digest(supplied.encode(), self.token.encode())
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, environ, start_response):
+        if not self._should_profile(environ):
+            return self.wsgi_app(environ, start_response)
+
+        request_id = new_request_id(environ.get(_REQUEST_ID_ENVIRON))
+        environ[_REQUEST_ID_ENVIRON] = request_id
+        profiler = SamplingProfiler(threading.get_ident(), self.interval_s)
+        start = time.perf_counter()
+        profiler.start()
+
+        def finish():
+            profiler.stop()
+            self.save(request_id, profiler, environ, time.perf_counter() - start)
+
+        try:
+            # The response body may still be generated lazily; stop once it is closed
+            return ClosingIterator(self.wsgi_app(environ, start_response), finish)
+        except BaseException:
+            finish()
+            raise
+
+    def save(self, request_id: str, profiler: SamplingProfiler, environ, elapsed_s: float):
+        path = os.path.join(self.directory, f"{request_id}{PROFILE_EXTENSION}")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.folded())
+            self.enforce_size_cap()
+        except Exception as e:
+            logger.error(f"Failed to save profile for request {request_id}: {e}")
+            return
+        logger.info(
+            f"Profiled {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
+            f"({elapsed_s * 1000:.0f}ms, {profiler.samples} samples) to {path}"
+        )
+
+    def enforce_size_cap(self):
+        """Delete the oldest profiles until the directory fits in `max_bytes`."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.endswith(PROFILE_EXTENSION):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+
+
+def init_app(app):
+    """Wrap the WSGI app so profiling covers every blueprint and error handler."""
+    if not PROFILE_TOKEN and PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.wsgi_app = ProfilingMiddleware(app.wsgi_app)
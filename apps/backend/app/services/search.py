@@ -0,0 +1,205 @@
+"""Search over a user's own messages.
+
+Full-text queries go through the index declared next to `Message` in
+`models.py`: FTS5 on SQLite (development and tests) and a `tsvector` GIN
+index on PostgreSQL. Other databases fall back to an unranked substring
+scan, newest first. Semantic queries go through the user's partition of
+the `HistoryIndex`, and hybrid search fuses the two rankings. Each hit
+carries a relevance `rank` (higher is better) and a raw `snippet` of the
+message; `render_snippet` turns it into safe HTML with the matched terms of
+full-text hits highlighted.
+"""
+
+import html
+import re
+
+from sqlalchemy import Float, column, false, func, literal, literal_column, select, table
+
+from config import HISTORY_SEARCH_CANDIDATES
+
+from .. import db
+from ..core.rag.history_index import shared_indexer
+from ..models import FTS_LANGUAGE, MESSAGES_FTS_TABLE, Chat, Message
+
+# The database wraps matched terms in these control characters, which never
+# survive HTML escaping; `render_snippet` swaps them for the HTML markers
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_ELLIPSIS = "…"
+# Approximate snippet length, in words
+SNIPPET_WORDS = 16
+# Reciprocal rank fusion constant: larger values flatten the head of each ranking
+RRF_K = 60
+
+
+def _sqlite_matches(text: str):
+    fts = table(MESSAGES_FTS_TABLE, column("rowid"))
+    fts_ref = literal_column(MESSAGES_FTS_TABLE)
+    # Quote every word so user input is never parsed as FTS5 query syntax
+    terms = re.findall(r"\w+", text)
+    query = " ".join(f'"{term}"' for term in terms)
+
+    snippet = func.snippet(fts_ref, 0, MATCH_START, MATCH_END, SNIPPET_ELLIPSIS, SNIPPET_WORDS)
+    # bm25() is lower for better matches
+    rank = -func.bm25(fts_ref, type_=Float)
+    matched = fts_ref.op("MATCH")(query) if terms else false()
+    return (
+        select(snippet.label("snippet"), rank.label("rank"))
+        .select_from(fts)
+        .join(Message, Message.id == fts.c.rowid)
+        .where(matched)
+    )
+
+
+def _postgres_matches(text: str):
+    # Spelled exactly as in the index expression so the planner can use it
+    language = literal_column(f"'{FTS_LANGUAGE}'")
+    tsquery = func.websearch_to_tsquery(language, text)
+    vector = func.to_tsvector(language, Message.content)
+
+    snippet = func.ts_headline(
+        language,
+        Message.content,
+        tsquery,
+        f'StartSel="{MATCH_START}", StopSel="{MATCH_END}", '
+        f'FragmentDelimiter="{SNIPPET_ELLIPSIS}", MaxFragments=2, '
+        f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 3}",
+    )
+    rank = func.ts_rank_cd(vector, tsquery, type_=Float)
+    return (
+        select(snippet.label("snippet"), rank.label("rank"))
+        .select_from(Message)
+        .where(vector.op("@@")(tsquery))
+    )
+
+
+def _substring_matches(text: str):
+    # No full-text index to rank with, so every match ties and the newest comes first
+    return select(Message.content.label("snippet"), literal(0.0, Float).label("rank")).where(
+        Message.content.icontains(text, autoescape=True)
+    )
+
+
+_MATCHERS = {"sqlite": _sqlite_matches, "postgresql": _postgres_matches}
+
+
+def matching_messages(user_id: str, text: str):
+    """Select the messages in `user_id`'s chats that match the search `text`.
+
+    Returns the query plus its `rank` and `id` columns, ready for keyset
+    pagination by best match first.
+    """
+    dialect = db.session.get_bind().dialect.name
+    matches = _MATCHERS.get(dialect, _substring_matches)(text)
+
+    ranked = (
+        matches.add_columns(
+            Message.id,
+            Message.chat_id,
+            Message.role,
+            Message.timestamp,
+            Message.is_liked,
+        )
+        .join(Chat, Message.chat_id == Chat.id)
+        .where(Chat.user_id == user_id, Chat.deleted_at.is_(None))
+        .subquery()
+    )
+    return select(ranked), ranked.c.rank, ranked.c.id
+
+
+class SearchHit:
+    """A message found by semantic or hybrid search, shaped like a full-text row.
+
+    `message` is a `Message` or a full-text row, which has the same fields.
+    """
+
+    def __init__(self, message, rank: float, snippet: str):
+        self.id = message.id
+        self.chat_id = message.chat_id
+        self.role = message.role
+        self.timestamp = message.timestamp
+        self.is_liked = message.is_liked
+        self.rank = rank
+        self.snippet = snippet
+
+
+def render_snippet(snippet: str) -> str:
+    """HTML for a hit's snippet: the message text escaped, matched terms in `<mark>`.
+
+    Stray marker characters typed into a message can't unbalance the tags.
+    """
+    parts, highlighted = [], False
+    for piece in re.split(f"([{MATCH_START}{MATCH_END}])", snippet):
+        if piece in (MATCH_START, MATCH_END):
+            if highlighted != (piece == MATCH_START):
+                parts.append(HIGHLIGHT_START if piece == MATCH_START else HIGHLIGHT_END)
+                highlighted = not highlighted
+        else:
+            parts.append(html.escape(piece))
+    if highlighted:
+        parts.append(HIGHLIGHT_END)
+    return "".join(parts)
+
+
+def excerpt(content: str) -> str:
+    """The opening words of a message, as the snippet of a hit without term matches."""
+    words = content.split()
+    if len(words) <= SNIPPET_WORDS * 2:
+        return content
+    return " ".join(words[: SNIPPET_WORDS * 2]) + SNIPPET_ELLIPSIS
+
+
+def _owned_messages(user_id: str, message_ids) -> dict[int, Message]:
+    """The messages among `message_ids` that still exist in `user_id`'s chats."""
+    if not message_ids:
+        return {}
+    messages = (
+        Message.query.join(Chat, Message.chat_id == Chat.id)
+        .filter(Chat.user_id == user_id, Chat.deleted_at.is_(None), Message.id.in_(message_ids))
+        .all()
+    )
+    return {m.id: m for m in messages}
+
+
+def semantic_hits(
+    user_id: str, text: str, candidates: int = HISTORY_SEARCH_CANDIDATES
+) -> list[SearchHit]:
+    """The user's messages closest in meaning to `text`, ranked by cosine similarity."""
+    scored = shared_indexer().index.search(user_id, text, candidates)
+    messages = _owned_messages(user_id, [message_id for message_id, _ in scored])
+    return [
+        SearchHit(messages[message_id], score, excerpt(messages[message_id].content))
+        for message_id, score in scored
+        if message_id in messages
+    ]
+
+
+def hybrid_hits(
+    user_id: str, text: str, candidates: int = HISTORY_SEARCH_CANDIDATES
+) -> list[SearchHit]:
+    """Full-text and semantic hits merged by reciprocal rank fusion.
+
+    A message scores `1 / (RRF_K + position)` in each ranking it appears in,
+    so one found both ways beats one that only ranks well in one of them.
+    Highlighted full-text snippets are kept where there is one.
+    """
+    query, rank, message_id = matching_messages(user_id, text)
+    fulltext = db.session.execute(
+        query.order_by(rank.desc(), message_id.desc()).limit(candidates)
+    ).all()
+    semantic = semantic_hits(user_id, text, candidates)
+
+    fused: dict[int, float] = {}
+    for ranking in (fulltext, semantic):
+        for position, hit in enumerate(ranking, start=1):
+            fused[hit.id] = fused.get(hit.id, 0.0) + 1.0 / (RRF_K + position)
+
+    # Both rankings are already limited to the user's messages
+    found = {hit.id: hit for hit in semantic}
+    found.update((row.id, row) for row in fulltext)
+    return [
+        SearchHit(found[message_id], score, found[message_id].snippet)
+        for message_id, score in fused.items()
+    ]
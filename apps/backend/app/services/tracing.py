@@ -0,0 +1,408 @@
+from contextvars import ContextVar
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+
+from flask import g, has_request_context, request
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import (
+    TRACE_EXPORT_PATH,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SAMPLE_RATE,
+    TRACE_SLOW_MS,
+    TRACING_ENABLED,
+)
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+SERVICE_NAME = "unipal-backend"
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+_current_trace: ContextVar["Trace | None"] = ContextVar("unipal_trace", default=None)
+_export_lock = threading.Lock()
+
+
+def current_request_id() -> str | None:
+    """The id of the Flask request being served, if any."""
+    return g.get("request_id") if has_request_context() else None
+
+
+def new_request_id(incoming: str | None = None) -> str:
+    """`incoming` if it looks like a request id, else a fresh 32-hex-char id."""
+    return incoming if incoming and _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+
+def current_trace() -> "Trace | None":
+    return _current_trace.get()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list[dict]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class Span:
+    """One timed operation within a trace."""
+
+    def __init__(
+        self,
+        trace_id: str,
+        name: str,
+        parent_id: str | None = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: dict | None = None,
+    ):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.error: str | None = None
+
+    def end(self, error: BaseException | str | None = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": (
+                {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """All spans recorded while serving one request.
+
+    The trace id is the request id when that is already 32 hex characters
+    (the ids this app generates), otherwise a hash of it, so a trace can
+    always be found from the `X-Request-ID` a client saw.
+    """
+
+    def __init__(self, request_id: str, root_name: str, attributes: dict | None = None):
+        self.request_id = request_id
+        self.trace_id = (
+            request_id.lower()
+            if re.fullmatch(r"[0-9a-fA-F]{32}", request_id)
+            else hashlib.sha256(request_id.encode()).hexdigest()[:32]
+        )
+        self._lock = threading.Lock()
+        self.root = Span(
+            self.trace_id,
+            root_name,
+            kind=SPAN_KIND_SERVER,
+            attributes={"unipal.request_id": request_id, **(attributes or {})},
+        )
+        self.spans = [self.root]
+
+    def start_span(self, name: str, parent: Span | None = None, **attributes) -> Span:
+        span = Span(self.trace_id, name, (parent or self.root).span_id, attributes=attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @property
+    def has_error(self) -> bool:
+        return any(span.error for span in self.spans)
+
+    def to_otlp(self) -> dict:
+        """The trace as an OTLP/JSON `ExportTraceServiceRequest`."""
+        with self._lock:
+            spans = [span.to_otlp() for span in self.spans]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+
+
+class SlowRequestSampler:
+    """Keep a finished trace if it was slow or failed.
+
+    Traces of requests that took at least `slow_ms` (or recorded an error)
+    are always kept; faster ones are kept with probability `sample_rate`,
+    which gives a baseline to compare slow turns against.
+    """
+
+    def __init__(self, slow_ms: float = TRACE_SLOW_MS, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+
+    def should_keep(self, trace: Trace) -> bool:
+        if trace.has_error or trace.root.duration_ms >= self.slow_ms:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+
+class FileSpanExporter:
+    """Append each kept trace as one OTLP/JSON line to `path`."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, trace: Trace):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            line = json.dumps(trace.to_otlp())
+            with _export_lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            logger.error(f"Failed to export trace {trace.trace_id} to {self.path}: {e}")
+
+
+class OtlpHttpExporter:
+    """POST each kept trace to an OTLP/HTTP collector (JSON encoding).
+
+    Sends happen on a background thread so a slow collector never adds
+    to request latency.
+    """
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _send(self, trace_id: str, body: bytes):
+        try:
+            req = urllib.request.Request(
+                self.endpoint, data=body, headers={"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(req, timeout=self.timeout):
+                pass
+        except Exception as e:
+            logger.error(f"Failed to send trace {trace_id} to {self.endpoint}: {e}")
+
+    def export(self, trace: Trace):
+        body = json.dumps(trace.to_otlp()).encode()
+        threading.Thread(target=self._send, args=(trace.trace_id, body), daemon=True).start()
+
+
+def default_exporters() -> list:
+    exporters = []
+    if TRACE_EXPORT_PATH:
+        exporters.append(FileSpanExporter(TRACE_EXPORT_PATH))
+    if TRACE_OTLP_ENDPOINT:
+        exporters.append(OtlpHttpExporter(TRACE_OTLP_ENDPOINT))
+    return exporters
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record LangChain runs as spans of the current request's trace.
+
+    Chains invoked with a `run_name` (retriever, prompt, llm, parser) become
+    spans of that name; every chat model call under them becomes an
+    "llm.attempt" span carrying provider, model, attempt number and token
+    counts. `providers` maps a model's `_llm_type` to its provider name.
+
+    Runs are nested under their parent run when LangChain reports one, and
+    otherwise under the innermost open span; fallback attempts are not
+    always reported with a parent.
+    """
+
+    def __init__(self, trace: Trace, providers: dict[str, str] | None = None):
+        self.trace = trace
+        self.providers = providers or {}
+        self._spans: dict = {}
+        self._open: list = []
+        self._attempts: dict[str, int] = {}
+
+    def _parent(self, parent_run_id) -> Span:
+        if parent_run_id in self._spans:
+            return self._spans[parent_run_id]
+        return self._spans[self._open[-1]] if self._open else self.trace.root
+
+    def _start(self, run_id, parent_run_id, name: str, attributes: dict) -> Span:
+        span = self.trace.start_span(name, self._parent(parent_run_id), **attributes)
+        self._spans[run_id] = span
+        self._open.append(run_id)
+        return span
+
+    def _end(self, run_id, error=None, **attributes):
+        span = self._spans.pop(run_id, None)
+        if run_id in self._open:
+            self._open.remove(run_id)
+        if span is not None:
+            span.attributes.update(attributes)
+            span.end(error)
+
+    @staticmethod
+    def _metadata_attributes(metadata: dict | None) -> dict:
+        return {
+            f"unipal.{key}": value
+            for key, value in (metadata or {}).items()
+            if not key.startswith(("ls_", "lc_")) and isinstance(value, (str, int, float, bool))
+        }
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+        self._start(run_id, parent_run_id, name, self._metadata_attributes(kwargs.get("metadata")))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        attributes = {}
+        if isinstance(outputs, list):
+            attributes["unipal.documents"] = len(outputs)
+        self._end(run_id, **attributes)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, kwargs.get("name") or "retriever", {})
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, **{"unipal.documents": len(documents)})
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        metadata = kwargs.get("metadata") or {}
+        llm_type = params.get("_type", "")
+        parent = self._parent(parent_run_id)
+        attempt = self._attempts.get(parent.span_id, 0) + 1
+        self._attempts[parent.span_id] = attempt
+        span = self.trace.start_span(
+            "llm.attempt",
+            parent,
+            **{
+                "gen_ai.system": self.providers.get(llm_type, llm_type),
+                "gen_ai.request.model": str(
+                    params.get("model") or params.get("model_name") or llm_type
+                ),
+                "gen_ai.request.temperature": metadata.get("ls_temperature"),
+                "gen_ai.request.max_tokens": metadata.get("ls_max_tokens"),
+                "unipal.llm.attempt": attempt,
+            },
+        )
+        self._spans[run_id] = span
+        self._open.append(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        attributes = {}
+        generations = response.generations[0] if response.generations else []
+        message = getattr(generations[0], "message", None) if generations else None
+        usage = getattr(message, "usage_metadata", None) or {}
+        if usage:
+            attributes["gen_ai.usage.input_tokens"] = usage.get("input_tokens")
+            attributes["gen_ai.usage.output_tokens"] = usage.get("output_tokens")
+        finish_reason = (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+        if finish_reason:
+            attributes["gen_ai.response.finish_reasons"] = str(finish_reason)
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def trace_callbacks(providers: dict[str, str] | None = None) -> list:
+    """Callbacks that record spans into the current request's trace, if any."""
+    trace = current_trace()
+    return [TracingCallbackHandler(trace, providers)] if trace is not None else []
+
+
+class Tracer:
+    """Per-app tracing settings: which finished traces to keep and where to send them."""
+
+    def __init__(self, sampler: SlowRequestSampler | None = None, exporters: list | None = None):
+        self.sampler = sampler or SlowRequestSampler()
+        self.exporters = default_exporters() if exporters is None else exporters
+
+    def finish(self, trace: Trace):
+        if self.exporters and self.sampler.should_keep(trace):
+            for exporter in self.exporters:
+                exporter.export(trace)
+
+
+def init_app(app, tracer: Tracer | None = None):
+    """Give every request an id (echoed in `X-Request-ID`) and trace it.
+
+    The incoming `X-Request-ID` is reused when it looks like an id, so
+    traces can be joined with a proxy's or client's logs. When tracing is
+    enabled, finished traces go to `app.extensions["tracing"]`, a `Tracer`;
+    with no exporter configured, requests aren't traced at all.
+    """
+    tracer = app.extensions["tracing"] = tracer or Tracer()
+
+    @app.before_request
+    def _start_trace():
+        g.request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+        if TRACING_ENABLED and tracer.exporters:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            trace = Trace(
+                g.request_id,
+                f"{request.method} {route}",
+                {"http.request.method": request.method, "http.route": route},
+            )
+            g.trace_token = _current_trace.set(trace)
+
+    @app.after_request
+    def _tag_response(response):
+        if "request_id" in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        trace = current_trace()
+        if trace is not None:
+            trace.root.attributes["http.response.status_code"] = response.status_code
+            trace.root.end("server error" if response.status_code >= 500 else None)
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        token = g.pop("trace_token", None)
+        if token is None:
+            return
+        trace = current_trace()
+        _current_trace.reset(token)
+        trace.root.end(exc)
+        tracer.finish(trace)
@@ -20,6 +20,184 @@ CHROMA_PATH = os.path.join(basedir, os.environ.get("CHROMA_PATH") or "chroma_db"
 PROMPT_PATH = os.path.join(basedir, os.environ.get("PROMPT_PATH") or "prompt.txt")
 TOP_K = int(os.environ.get("TOP_K") or 5)
 
+# Retrieval mode: "similarity" (fixed top-k), "scored" (relevance cutoff + budget)
+# or "mmr" (maximal marginal relevance over MMR_FETCH_K candidates)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "similarity")
+RETRIEVAL_MIN_SCORE = float(os.environ.get("RETRIEVAL_MIN_SCORE") or 0.35)
+RETRIEVAL_MAX_K = int(os.environ.get("RETRIEVAL_MAX_K") or TOP_K)
+RETRIEVAL_SCORE_LOG = (
+    os.path.join(basedir, os.environ["RETRIEVAL_SCORE_LOG"])
+    if os.environ.get("RETRIEVAL_SCORE_LOG")
+    else None
+)
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA") or 0.5)
+MMR_FETCH_K = int(os.environ.get("MMR_FETCH_K") or 20)
+
+# Local rerank stage: over-fetch RERANK_FETCH_K chunks, rescore on CPU, keep RERANK_TOP_K
+RERANK = os.getenv("RERANK", "false").lower() == "true"
+RERANK_FETCH_K = int(os.environ.get("RERANK_FETCH_K") or 20)
+RERANK_TOP_K = int(os.environ.get("RERANK_TOP_K") or 3)
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS") or 150)
+RERANK_MODEL_PATH = (
+    os.path.join(basedir, os.environ["RERANK_MODEL_PATH"])
+    if os.environ.get("RERANK_MODEL_PATH")
+    else None
+)
+RERANK_THREADS = int(os.environ.get("RERANK_THREADS") or 2)
+
+# Parent-child retrieval: embed small chunks, return their whole markdown sections
+PARENT_DOCUMENTS = os.getenv("PARENT_DOCUMENTS", "false").lower() == "true"
+PARENT_MAX_CHARS = int(os.environ.get("PARENT_MAX_CHARS") or 4000)
+
+# Two-stage retrieval: match per-file summary embeddings, then search chunks in the top files
+HIERARCHICAL_RETRIEVAL = os.getenv("HIERARCHICAL_RETRIEVAL", "false").lower() == "true"
+HIERARCHICAL_TOP_FILES = int(os.environ.get("HIERARCHICAL_TOP_FILES") or 5)
+
+# Compact vector index: "chroma" (float search in Chroma) or "quantized" (int8 scan + float rescoring)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "chroma")
+INDEX_REDUCTION = os.getenv("INDEX_REDUCTION", "none")  # none | pca | truncate
+INDEX_DIMENSIONS = int(os.environ.get("INDEX_DIMENSIONS") or 0) or None
+INDEX_RESCORE_FACTOR = int(os.environ.get("INDEX_RESCORE_FACTOR") or 4)
+
+# Micro-batching of concurrent query embeddings into one embed_documents call
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "false").lower() == "true"
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS") or 5)
+EMBED_MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH") or 16)
+
+# Offline embeddings (use_model="local"): sentence-embedding model exported to ONNX, run on CPU
+LOCAL_EMBEDDINGS_PATH = (
+    os.path.join(basedir, os.environ["LOCAL_EMBEDDINGS_PATH"])
+    if os.environ.get("LOCAL_EMBEDDINGS_PATH")
+    else None
+)
+LOCAL_EMBEDDINGS_THREADS = int(os.environ.get("LOCAL_EMBEDDINGS_THREADS") or os.cpu_count() or 1)
+LOCAL_EMBEDDINGS_BATCH_SIZE = int(os.environ.get("LOCAL_EMBEDDINGS_BATCH_SIZE") or 32)
+LOCAL_EMBEDDINGS_MAX_LENGTH = int(os.environ.get("LOCAL_EMBEDDINGS_MAX_LENGTH") or 256)
+
+# Logging (app/services/logger.py): records are queued and written to stdout by a
+# background thread, as JSON lines ("json") or the classic one-line format ("text")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Per-logger sampling of records below WARNING, e.g. "app.core.rag.vectorstore=0.1"
+LOG_SAMPLING = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=", 1) for item in os.environ.get("LOG_SAMPLING", "").split(",") if "=" in item
+    )
+}
+
+# Prometheus-format stage timers and request metrics on GET /metrics. Off by default; when
+# METRICS_TOKEN is set, scrapers must send it as "Authorization: Bearer <token>"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN") or None
+
+# Request tracing (app/services/tracing.py): spans for retrieval, prompt, LLM attempts and
+# parsing, exported as OTLP/JSON for requests slower than TRACE_SLOW_MS. Off by default, and
+# requests aren't traced at all without an exporter (TRACE_EXPORT_PATH / TRACE_OTLP_ENDPOINT)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS") or 2000)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE") or 0.0)
+TRACE_EXPORT_PATH = (
+    os.path.join(basedir, os.environ["TRACE_EXPORT_PATH"])
+    if os.environ.get("TRACE_EXPORT_PATH")
+    else None
+)
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT") or None
+
+# Per-request profiling (app/services/profiling.py): requests sending X-Profile-Token equal to
+# PROFILE_TOKEN, or a PROFILE_SAMPLE_RATE fraction of all requests, are stack-sampled
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE") or 0.0)
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS") or 5)
+PROFILE_DIR = os.path.join(basedir, os.environ.get("PROFILE_DIR") or "profiles")
+PROFILE_MAX_DIR_MB = int(os.environ.get("PROFILE_MAX_DIR_MB") or 100)
+
+# Provider registry (app/core/rag/providers.py): which backends serve embeddings and chat
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "hf")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_FALLBACK_PROVIDER = os.getenv("LLM_FALLBACK_PROVIDER", "groq")  # empty: no fallback
+# Simulated latency of the "stub" providers, for offline load tests
+STUB_LATENCY_MS = float(os.environ.get("STUB_LATENCY_MS") or 0)
+
+# Per-provider limits: (batch size, requests per minute, chunk size, dimension).
+# Each can be overridden with EMBEDDINGS_<NAME>_BATCH_SIZE / _REQUESTS_PER_MINUTE /
+# _CHUNK_SIZE / _DIMENSION. 0 requests per minute means unlimited.
+_EMBEDDING_PROVIDER_DEFAULTS = {
+    "hf": (100, 0, 500, None),
+    # The Gemini free tier throttles bulk upserts; 6 batches a minute ~ 10s apart
+    "gemini": (100, 6, 1500, 3072),
+    "local": (100, 0, 500, None),
+    "hash": (100, 0, 500, 256),
+    "stub": (100, 0, 500, 384),
+}
+EMBEDDING_PROVIDER_LIMITS = {
+    name: {
+        "batch_size": int(os.environ.get(f"EMBEDDINGS_{name.upper()}_BATCH_SIZE") or batch_size),
+        "requests_per_minute": int(
+            os.environ.get(f"EMBEDDINGS_{name.upper()}_REQUESTS_PER_MINUTE") or rpm
+        ),
+        "chunk_size": int(os.environ.get(f"EMBEDDINGS_{name.upper()}_CHUNK_SIZE") or chunk_size),
+        "dimension": int(os.environ.get(f"EMBEDDINGS_{name.upper()}_DIMENSION") or dimension or 0)
+        or None,
+    }
+    for name, (batch_size, rpm, chunk_size, dimension) in _EMBEDDING_PROVIDER_DEFAULTS.items()
+}
+# Client-side rate limit per chat provider (LLM_<NAME>_REQUESTS_PER_MINUTE), 0 = unlimited
+LLM_PROVIDER_LIMITS = {
+    name: {
+        "requests_per_minute": int(os.environ.get(f"LLM_{name.upper()}_REQUESTS_PER_MINUTE") or 0)
+    }
+    for name in ("gemini", "groq", "stub")
+}
+
+SKIP_LLM_ON_EMPTY_CONTEXT = os.getenv("SKIP_LLM_ON_EMPTY_CONTEXT", "true").lower() == "true"
+
+# Extractive context compression between retrieval and the prompt
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "false").lower() == "true"
+COMPRESSION_MAX_TOKENS = int(os.environ.get("COMPRESSION_MAX_TOKENS") or 600)
+COMPRESSION_LEXICAL_WEIGHT = float(os.environ.get("COMPRESSION_LEXICAL_WEIGHT") or 0.7)
+
+# Conversation memory: recent-message window plus a rolling summary per chat
+MEMORY_MAX_MESSAGES = int(os.environ.get("MEMORY_MAX_MESSAGES") or 6)
+MEMORY_MAX_TOKENS = int(os.environ.get("MEMORY_MAX_TOKENS") or 800)
+MEMORY_SUMMARY_BATCH = int(os.environ.get("MEMORY_SUMMARY_BATCH") or 6)
+MEMORY_SUMMARY_MAX_TOKENS = int(os.environ.get("MEMORY_SUMMARY_MAX_TOKENS") or 200)
+
+# Keyset pagination of chat, message and complaint listings (app/api/pagination.py)
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT") or 50)
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX") or 200)
+
+# Clearing chats (app/services/deletion.py): larger clears are soft-deleted and purged in batches
+CLEAR_CHATS_SYNC_MAX_MESSAGES = int(os.environ.get("CLEAR_CHATS_SYNC_MAX_MESSAGES") or 1000)
+PURGE_BATCH_SIZE = int(os.environ.get("PURGE_BATCH_SIZE") or 1000)
+
+# Semantic search over each user's own chat history (app/core/rag/history_index.py)
+HISTORY_SEMANTIC_SEARCH = os.getenv("HISTORY_SEMANTIC_SEARCH", "false").lower() == "true"
+HISTORY_INDEX_PATH = os.path.join(basedir, os.environ.get("HISTORY_INDEX_PATH") or "history_index")
+HISTORY_INDEX_BATCH = int(os.environ.get("HISTORY_INDEX_BATCH") or 32)
+HISTORY_SEARCH_CANDIDATES = int(os.environ.get("HISTORY_SEARCH_CANDIDATES") or 100)
+
+# Per-query-class generation budgets (see app/core/rag/classifier.py)
+GENERATION_BUDGETS = {
+    "factual": {
+        "max_output_tokens": int(os.environ.get("MAX_OUTPUT_TOKENS_FACTUAL") or 512),
+        "temperature": float(os.environ.get("TEMPERATURE_FACTUAL") or 0.1),
+    },
+    "procedural": {
+        "max_output_tokens": int(os.environ.get("MAX_OUTPUT_TOKENS_PROCEDURAL") or 1024),
+        "temperature": float(os.environ.get("TEMPERATURE_PROCEDURAL") or 0.2),
+    },
+    "open_ended": {
+        "max_output_tokens": int(os.environ.get("MAX_OUTPUT_TOKENS_OPEN_ENDED") or 1536),
+        "temperature": float(os.environ.get("TEMPERATURE_OPEN_ENDED") or 0.4),
+    },
+}
+GENERATION_STATS_LOG = (
+    os.path.join(basedir, os.environ["GENERATION_STATS_LOG"])
+    if os.environ.get("GENERATION_STATS_LOG")
+    else None
+)
+
 
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY") or secrets.token_hex(32)
@@ -0,0 +1,84 @@
+"""Add per-chat message sequence numbers and server-side timestamp defaults
+
+Revision ID: b7c4e9a2d615
+Revises: 8e3b6d1f0a42
+Create Date: 2026-10-19 14:02:37.915230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c4e9a2d615'
+down_revision = '8e3b6d1f0a42'
+branch_labels = None
+depends_on = None
+
+TIMESTAMP_COLUMNS = (
+    ('users', 'created_at'),
+    ('token_blocklist', 'created_at'),
+    ('chats', 'created_at'),
+    ('messages', 'timestamp'),
+    ('complaints', 'created_at'),
+)
+
+
+def server_now():
+    """Same default as app.models.server_now, in the dialect being migrated."""
+    if op.get_bind().dialect.name == 'sqlite':
+        return sa.text("(strftime('%Y-%m-%d %H:%M:%f000', 'now'))")
+    return sa.text('CURRENT_TIMESTAMP')
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_message_seq', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.Integer(), nullable=True))
+
+    # Number existing messages in id order: ids follow insertion order, whereas the
+    # old Python-side timestamps were evaluated once at import and are mostly equal
+    op.execute(
+        """
+        UPDATE messages SET seq = numbered.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY id) AS seq
+            FROM messages
+        ) AS numbered
+        WHERE messages.id = numbered.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE chats SET last_message_seq = COALESCE(
+            (SELECT MAX(seq) FROM messages WHERE messages.chat_id = chats.id), 0
+        )
+        """
+    )
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.alter_column('seq', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_index('ix_messages_chat_id_timestamp')
+        batch_op.create_index('ix_messages_chat_id_seq', ['chat_id', 'seq'], unique=True)
+
+    for table, column in TIMESTAMP_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(
+                column, existing_type=sa.DateTime(), server_default=server_now()
+            )
+
+
+def downgrade():
+    for table, column in TIMESTAMP_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(column, existing_type=sa.DateTime(), server_default=None)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_chat_id_seq')
+        batch_op.create_index('ix_messages_chat_id_timestamp', ['chat_id', 'timestamp', 'id'], unique=False)
+        batch_op.drop_column('seq')
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('last_message_seq')
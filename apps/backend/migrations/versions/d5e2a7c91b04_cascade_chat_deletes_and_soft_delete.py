@@ -0,0 +1,77 @@
+"""Cascade chat and message deletes in the schema; add chats.deleted_at
+
+Revision ID: d5e2a7c91b04
+Revises: c3a8f51e7d20
+Create Date: 2026-10-19 17:46:12.538204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e2a7c91b04'
+down_revision = 'c3a8f51e7d20'
+branch_labels = None
+depends_on = None
+
+# Names SQLite's unnamed foreign keys when batch mode reflects them
+NAMING_CONVENTION = {
+    "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
+}
+
+# Recreating `messages` on SQLite drops the triggers feeding messages_fts
+SQLITE_FTS_TRIGGERS = (
+    """CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+)
+
+
+def fk_name(table, column, referred):
+    if op.get_bind().dialect.name == 'sqlite':
+        return f'fk_{table}_{column}_{referred}'
+    # PostgreSQL's default name for an unnamed foreign key
+    return f'{table}_{column}_fkey'
+
+
+def replace_foreign_key(table, column, referred, ondelete):
+    name = fk_name(table, column, referred)
+    with op.batch_alter_table(table, schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def restore_fts_triggers():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_chats_deleted_at', ['deleted_at'], unique=False)
+
+    replace_foreign_key('chats', 'user_id', 'users', 'CASCADE')
+    replace_foreign_key('messages', 'chat_id', 'chats', 'CASCADE')
+    restore_fts_triggers()
+
+
+def downgrade():
+    replace_foreign_key('messages', 'chat_id', 'chats', None)
+    restore_fts_triggers()
+    replace_foreign_key('chats', 'user_id', 'users', None)
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_index('ix_chats_deleted_at')
+        batch_op.drop_column('deleted_at')
@@ -0,0 +1,54 @@
+"""Track the rolling summary cutoff by message seq instead of message id
+
+Revision ID: f2b6c8d4a193
+Revises: d5e2a7c91b04
+Create Date: 2026-10-19 19:12:48.306514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6c8d4a193'
+down_revision = 'd5e2a7c91b04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary_seq', sa.Integer(), nullable=True))
+
+    # Ids and seqs both follow insertion order within a chat, so the cutoff is the
+    # highest seq at or below the old id (the summarized message itself may be gone)
+    op.execute(
+        """
+        UPDATE chats SET summary_seq = (
+            SELECT MAX(seq) FROM messages
+            WHERE messages.chat_id = chats.id AND messages.id <= chats.summary_message_id
+        )
+        WHERE summary_message_id IS NOT NULL
+        """
+    )
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('summary_message_id')
+
+
+def downgrade():
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('summary_message_id', sa.Integer(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE chats SET summary_message_id = (
+            SELECT MAX(id) FROM messages
+            WHERE messages.chat_id = chats.id AND messages.seq <= chats.summary_seq
+        )
+        WHERE summary_seq IS NOT NULL
+        """
+    )
+
+    with op.batch_alter_table('chats', schema=None) as batch_op:
+        batch_op.drop_column('summary_seq')
@@ -6,6 +6,7 @@ from flask_migrate import Migrate
 
 from app import create_app, db
 from app.models import Chat, Complaint, Message, User
+from app.services.deletion import purge_deleted_chats
 
 # API Documentation is at /apidoc/swagger/
 
@@ -28,5 +29,12 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+@app.cli.command("purge-chats")
+def purge_chats():
+    """Delete soft-deleted chats and their messages."""
+    purged = purge_deleted_chats()
+    print(f"Purged {purged} chats")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
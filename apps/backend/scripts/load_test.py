@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end load test for the backend API.
+
+Seeds a throwaway SQLite database with users, chats and messages, indexes the
+FAQ files into a throwaway vector store, swaps in the stub embedding and LLM
+providers, and drives the chat, history and auth endpoints in-process with
+concurrent workers. Prints (or writes) a JSON report with throughput, latency
+percentiles and DB query counts per endpoint. Needs no network access.
+
+Usage:
+  python scripts/load_test.py --concurrency 16 --requests 2000 --latency-ms 300
+  python scripts/load_test.py --duration 60 --output loadtest.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_ROOT = os.path.normpath(os.path.join(SCRIPT_DIR, ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="UniPal API load test (offline)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--chats-per-user", type=int, default=5)
+    parser.add_argument("--messages-per-chat", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Total requests to send")
+    parser.add_argument("--duration", type=float, default=None, help="Run for N seconds instead")
+    parser.add_argument(
+        "--latency-ms", type=float, default=0, help="Simulated stub embedding/LLM latency"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write JSON here")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="unipal-loadtest-")
+    # Must be set before the app (and config) is imported: provider defaults bind at import
+    os.environ["TEST_DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "loadtest.db")
+    os.environ["CHROMA_PATH"] = os.path.join(workdir, "chroma")
+    os.environ["EMBEDDINGS_PROVIDER"] = "stub"
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["LLM_FALLBACK_PROVIDER"] = ""
+    os.environ["STUB_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["RETRIEVAL_SCORE_LOG"] = ""
+    os.environ["GENERATION_STATS_LOG"] = ""
+
+    from app import create_app, db
+    from app.core.loadtest import LoadTest, seed_database, seed_vector_store
+    from app.core.rag.vectorstore import VectorStore
+
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        accounts = seed_database(
+            args.users, args.chats_per_user, args.messages_per_chat, seed=args.seed
+        )
+        seed_vector_store(VectorStore())
+
+        report = LoadTest(
+            app,
+            accounts,
+            concurrency=args.concurrency,
+            requests=args.requests,
+            duration_s=args.duration,
+            seed=args.seed,
+        ).run()
+    report["stub_latency_ms"] = args.latency_ms
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Load test report written to {args.output}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
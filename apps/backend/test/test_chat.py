@@ -1,9 +1,29 @@
 import json
+import logging
+import os
+import queue
+import tempfile
+import time
 import unittest
 from unittest.mock import patch
 
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
 from app import create_app, db
-from app.models import User
+from app.core.rag.llm import LLM
+from app.models import Chat, Message, User
+from app.services import metrics
+from app.services.logger import (
+    JsonFormatter,
+    LazyQueueHandler,
+    RequestIdFilter,
+    SamplingFilter,
+    get_logger,
+)
+from app.services.memory import ConversationMemory, contextualize_query, to_chat_messages
+from app.services.profiling import ProfilingMiddleware
+from app.services.tracing import FileSpanExporter, SlowRequestSampler, current_trace
 
 # python -m unittest discover -s test -p "test_chat.py" -v
 
@@ -144,6 +164,241 @@ class ChatTestCase(unittest.TestCase):
         )
         self.assertEqual(res.status_code, 403)
 
+    @patch("app.core.rag.llm.LLM.get_response")
+    def test_post_message_sends_recent_history(self, mock_get_response):
+        mock_get_response.return_value = "Undergraduate tuition is listed in the fee schedule."
+        token, uid = self.get_guest_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        res = self.client.post("/api/v1/chat", headers=headers, json={"title": "Fees"})
+        chat_id = json.loads(res.data)["chat_id"]
+
+        for text in ["How much is tuition for Nursing?", "what about for postgraduates?"]:
+            res = self.client.post(
+                f"/api/v1/chat/{chat_id}/message", headers=headers, json={"content": text}
+            )
+            self.assertEqual(res.status_code, 201)
+
+        kwargs = mock_get_response.call_args.kwargs
+        self.assertEqual(
+            [m.content for m in kwargs["history"]],
+            ["How much is tuition for Nursing?", mock_get_response.return_value],
+        )
+        # The short follow-up is expanded with the previous question for retrieval
+        self.assertIn("Nursing", kwargs["retrieval_query"])
+        self.assertIn("postgraduates", kwargs["retrieval_query"])
+
+    @patch("app.core.rag.llm.LLM.get_response")
+    def test_metrics_endpoint_reports_stage_and_request_latency(self, mock_get_response):
+        self.assertNotIn("metrics", self.app.view_functions)  # Off unless enabled
+        with (
+            patch("app.services.metrics.METRICS_ENABLED", True),
+            patch("app.services.metrics.METRICS_TOKEN", "scrape-secret"),
+        ):
+            metrics.init_app(self.app)
+        mock_get_response.return_value = "Metered reply"
+        token, uid = self.get_guest_token()
+        headers = {"Authorization": f"Bearer {token}"}
+        chat_id = self.client.post("/api/v1/chat", headers=headers, json={}).get_json()["chat_id"]
+        res = self.client.post(
+            f"/api/v1/chat/{chat_id}/message", headers=headers, json={"content": "Hi"}
+        )
+        self.assertEqual(res.status_code, 201)
+
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        res = self.client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        self.assertEqual(res.status_code, 401)
+        res = self.client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith("text/plain"))
+        text = res.get_data(as_text=True)
+        self.assertIn("# TYPE unipal_stage_duration_seconds histogram", text)
+        self.assertIn('unipal_stage_duration_seconds_count{stage="rag_total"', text)
+        self.assertIn('stage="db_commit_assistant_message"', text)
+        # Route templates, not raw paths, so chat ids don't become label values
+        self.assertIn('endpoint="/api/v1/chat/<chat_id>/message",status="201"', text)
+        self.assertNotIn(chat_id, text)
+
+    @patch("app.services.tracing.TRACING_ENABLED", True)
+    def test_request_trace_spans_retriever_prompt_llm_attempts_and_parser(self):
+        tracer = self.app.extensions["tracing"]
+        llm = LLM(provider="stub", fallback_provider="stub")
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+        retriever = RunnableLambda(lambda query: docs)
+
+        with tempfile.TemporaryDirectory() as td:
+            path = os.path.join(td, "traces.jsonl")
+            tracer.exporters = [FileSpanExporter(path)]
+            tracer.sampler = SlowRequestSampler(slow_ms=0)
+            with self.app.test_request_context(
+                "/api/v1/chat/1/message", method="POST", headers={"X-Request-ID": "turn-1"}
+            ):
+                self.app.preprocess_request()
+                llm.get_response("What time is curfew?", retriever)
+                response = self.app.process_response(self.app.response_class())
+            with open(path, encoding="utf-8") as f:
+                exported = json.loads(f.read())
+
+            # Fast requests are dropped by the slow-request sampler
+            tracer.sampler = SlowRequestSampler(slow_ms=60_000)
+            res = self.client.get("/")
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(len(f.read().splitlines()), 1)
+
+        # Without an exporter there is nothing to keep a trace for, so none is built
+        tracer.exporters = []
+        with self.app.test_request_context("/"):
+            self.app.preprocess_request()
+            self.assertIsNone(current_trace())
+
+        self.assertEqual(response.headers["X-Request-ID"], "turn-1")
+        self.assertEqual(len(res.headers["X-Request-ID"]), 32)
+        spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        by_name = {span["name"]: span for span in spans}
+        root = by_name["POST /api/v1/chat/<chat_id>/message"]
+        self.assertEqual({span["traceId"] for span in spans}, {root["traceId"]})
+        for name in ("retriever", "prompt", "llm", "parser"):
+            self.assertEqual(by_name[name]["parentSpanId"], root["spanId"])
+        attempt = by_name["llm.attempt"]
+        self.assertEqual(attempt["parentSpanId"], by_name["llm"]["spanId"])
+        attributes = {a["key"]: a["value"] for a in attempt["attributes"]}
+        self.assertEqual(attributes["gen_ai.system"], {"stringValue": "stub"})
+        self.assertIn("gen_ai.usage.output_tokens", attributes)
+
+    def test_profiling_middleware_writes_folded_stacks_per_request(self):
+        def slow_view():
+            time.sleep(0.05)
+            return "ok"
+
+        self.app.add_url_rule("/slow", "slow", slow_view)
+        with tempfile.TemporaryDirectory() as td:
+            self.app.wsgi_app = ProfilingMiddleware(
+                self.app.wsgi_app, directory=td, token="s3cret", interval_ms=1, max_bytes=10**6
+            )
+            client = self.app.test_client()
+
+            client.get("/slow", headers={"X-Profile-Token": "wrong"}, buffered=True)
+            self.assertEqual(os.listdir(td), [])
+
+            res = client.get("/slow", headers={"X-Profile-Token": "s3cret"}, buffered=True)
+            request_id = res.headers["X-Request-ID"]
+            self.assertEqual(os.listdir(td), [f"{request_id}.folded"])
+            with open(os.path.join(td, f"{request_id}.folded"), encoding="utf-8") as f:
+                stacks = f.read().splitlines()
+            self.assertTrue(any("slow_view" in line for line in stacks))
+            stack, count = stacks[0].rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+
+            # The oldest profiles are dropped once the directory is over its cap
+            self.app.wsgi_app.max_bytes = 1
+            client.get("/slow", headers={"X-Profile-Token": "s3cret"}, buffered=True)
+            self.assertLessEqual(len(os.listdir(td)), 1)
+
+    def test_log_records_are_queued_unformatted_with_request_id(self):
+        records = queue.SimpleQueue()
+        handler = LazyQueueHandler(records)
+        handler.addFilter(RequestIdFilter())
+        log = logging.getLogger("test.logging.pipeline")
+        log.addHandler(handler)
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        rendered = []
+
+        class Arg:
+            def __str__(self):
+                rendered.append(True)
+                return "lazy"
+
+        try:
+            with self.app.test_request_context("/", headers={"X-Request-ID": "req-42"}):
+                self.app.preprocess_request()
+                log.info("value=%s", Arg())
+            log.addFilter(SamplingFilter(0.0))
+            log.info("sampled out")
+            log.warning("always kept")
+        finally:
+            log.removeHandler(handler)
+
+        record = records.get_nowait()
+        # Formatting is left to the listener thread
+        self.assertEqual(rendered, [])
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry["message"], "value=lazy")
+        self.assertEqual(entry["request_id"], "req-42")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(records.get_nowait().getMessage(), "always kept")
+        self.assertTrue(records.empty())
+
+    def test_app_loggers_do_not_repeat_records_through_root(self):
+        root_records = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                root_records.append(record)
+
+        root = logging.getLogger()
+        collect = Collect()
+        root.addHandler(collect)
+        try:
+            get_logger("test.logging.once").warning("written once")
+        finally:
+            root.removeHandler(collect)
+        self.assertEqual(root_records, [])
+
+    def test_memory_window_and_rolling_summary(self):
+        user = User(full_name="Memory User", email="memory@example.com", is_guest=True)
+        db.session.add(user)
+        db.session.commit()
+        chat = Chat(user_id=user.id, title="Long chat")
+        db.session.add(chat)
+        db.session.commit()
+        for i in range(10):
+            role = "user" if i % 2 == 0 else "assistant"
+            db.session.add(Message(chat_id=chat.id, role=role, content=f"message {i}"))
+        db.session.commit()
+
+        memory = ConversationMemory(max_messages=4, max_tokens=1000, summary_batch=4)
+        window = memory.recent_messages(chat)
+        self.assertEqual([m.content for m in window], [f"message {i}" for i in range(6, 10)])
+        self.assertTrue(memory.needs_summary(chat, window))
+
+        class FakeLLM:
+            def __init__(self):
+                self.calls = []
+
+            def summarize(self, previous_summary, messages):
+                self.calls.append((previous_summary, [m.content for m in messages]))
+                return "summary of " + ", ".join(m.content for m in messages)
+
+        llm = FakeLLM()
+        self.assertTrue(memory.update_summary(chat, llm))
+        self.assertEqual(llm.calls[0][1], [f"message {i}" for i in range(6)])
+        self.assertTrue(chat.summary.startswith("summary of message 0"))
+        # The cutoff is the per-chat seq of the last summarized message, not its global id
+        self.assertEqual(chat.summary_seq, 6)
+        before_last = memory.recent_messages(chat, before_seq=10)
+        self.assertEqual([m.seq for m in before_last], [7, 8, 9])
+
+        # Summarized messages never come back into the window or the summary queue
+        window = memory.recent_messages(chat)
+        self.assertFalse(memory.needs_summary(chat, window))
+        self.assertFalse(memory.update_summary(chat, llm))
+        self.assertEqual(len(llm.calls), 1)
+
+    def test_contextualize_query_only_expands_short_follow_ups(self):
+        history = to_chat_messages(
+            [
+                Message(role="user", content="Hostel fees for Nursing?"),
+                Message(role="AI", content="N100"),
+            ]
+        )
+        self.assertEqual(
+            contextualize_query("and for Law?", history), "Hostel fees for Nursing?\nand for Law?"
+        )
+        long_query = "How do I apply for a transcript from the registry after graduating from BU?"
+        self.assertEqual(contextualize_query(long_query, history), long_query)
+        self.assertEqual(contextualize_query("and for Law?", []), "and for Law?")
+
 
 if __name__ == "__main__":
     unittest.main()
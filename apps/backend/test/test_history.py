@@ -1,9 +1,17 @@
+from datetime import datetime
 import json
+import tempfile
 import unittest
 from unittest.mock import patch
 
+from sqlalchemy import event
+
 from app import create_app, db
-from app.models import User
+from app.core.loadtest import LOADTEST_PASSWORD, seed_database
+from app.core.rag import history_index
+from app.core.rag.embeddings.local import HashingEmbedding
+from app.models import Chat, Complaint, Message, User
+from app.services.deletion import purge_deleted_chats
 
 # python -m unittest discover -s test -p "test_history.py" -v
 
@@ -149,7 +157,7 @@ class HistoryTestCase(unittest.TestCase):
         )
         self.assertEqual(res.status_code, 200)
         results = json.loads(res.data)["results"]
-        self.assertTrue(any("UniqueSearchTerm" in r["content"] for r in results))
+        self.assertTrue(any("<mark>UniqueSearchTerm</mark>" in r["content"] for r in results))
 
     @patch("app.core.rag.llm.LLM.get_response")
     def test_clear_all_chats(self, mock_get_response):
@@ -177,6 +185,294 @@ class HistoryTestCase(unittest.TestCase):
         body = json.loads(res.data)
         self.assertEqual(len(body["chats"]), 0)
 
+    def test_listings_are_keyset_paginated(self):
+        account = seed_database(users=1, chats_per_user=3, messages_per_chat=5)[0]
+        chat_id = account["chat_ids"][0]
+        # Equal timestamps: pages follow the per-chat sequence, not the clock
+        same_time = datetime(2026, 1, 1, 12, 0)
+        Message.query.filter_by(chat_id=chat_id).update({"timestamp": same_time})
+        for i in range(3):
+            db.session.add(
+                Complaint(user_id=account["user_id"], title=f"Issue {i}", description="x")
+            )
+        db.session.commit()
+        res = self.client.post(
+            "/api/v1/auth/login", json={"email": account["email"], "password": LOADTEST_PASSWORD}
+        )
+        headers = {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+
+        def walk(url, key):
+            items, cursor, pages = [], None, 0
+            while True:
+                page_url = f"{url}?limit=2" + (f"&after={cursor}" if cursor else "")
+                res = self.client.get(page_url, headers=headers)
+                self.assertEqual(res.status_code, 200)
+                body = res.get_json()
+                items.extend(body[key])
+                pages += 1
+                cursor = body["next_cursor"]
+                if cursor is None:
+                    return items, pages
+
+        messages, pages = walk(f"/api/v1/history/chat/{chat_id}/messages", "messages")
+        expected = [m.id for m in Message.query.filter_by(chat_id=chat_id).order_by(Message.id)]
+        self.assertEqual([m["id"] for m in messages], expected)
+        self.assertEqual(pages, 3)
+        history, _ = walk(f"/api/v1/chat/{chat_id}", "messages")
+        self.assertEqual([m["id"] for m in history], expected)
+
+        chats, pages = walk("/api/v1/history/chats", "chats")
+        self.assertEqual(sorted(c["id"] for c in chats), sorted(account["chat_ids"]))
+        created = [c["created_at"] for c in chats]
+        self.assertEqual(created, sorted(created, reverse=True))
+        self.assertEqual(pages, 2)
+
+        complaints, _ = walk("/api/v1/complaints", "complaints")
+        self.assertEqual([c["title"] for c in complaints], ["Issue 2", "Issue 1", "Issue 0"])
+
+        res = self.client.get("/api/v1/history/chats?after=not-a-cursor", headers=headers)
+        self.assertEqual(res.status_code, 400)
+        res = self.client.get("/api/v1/history/chats?limit=0", headers=headers)
+        self.assertEqual(res.status_code, 422)
+
+    def test_messages_are_numbered_per_chat_in_insert_order(self):
+        account = seed_database(users=1, chats_per_user=2, messages_per_chat=3)[0]
+        first, second = account["chat_ids"]
+        for chat_id in (second, first, second):
+            db.session.add(Message(chat_id=chat_id, role="user", content="more"))
+            db.session.commit()
+
+        for chat_id, count in ((first, 4), (second, 5)):
+            messages = Message.query.filter_by(chat_id=chat_id).order_by(Message.id).all()
+            self.assertEqual([m.seq for m in messages], list(range(1, count + 1)))
+            self.assertIsNotNone(messages[-1].timestamp)
+            self.assertEqual(db.session.get(Chat, chat_id).last_message_seq, count)
+
+    def test_search_ranks_highlights_and_paginates(self):
+        account, other = seed_database(users=2, chats_per_user=1, messages_per_chat=1)
+        chat_id = account["chat_ids"][0]
+        filler = " ".join(["The registry office opens on weekdays."] * 6)
+        contents = [
+            "Hostel allocation starts in August.",
+            f"{filler} Hostel allocation is handled by the Student Affairs office. {filler}",
+            "Hostel fees are paid before allocation of rooms.",
+            "Library hours are posted weekly.",
+        ]
+        for content in contents:
+            db.session.add(Message(chat_id=chat_id, role="assistant", content=content))
+        db.session.add(
+            Message(chat_id=other["chat_ids"][0], role="user", content="Hostel allocation?")
+        )
+        db.session.commit()
+        res = self.client.post(
+            "/api/v1/auth/login", json={"email": account["email"], "password": LOADTEST_PASSWORD}
+        )
+        headers = {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+
+        res = self.client.get("/api/v1/history/search?q=hostel allocation", headers=headers)
+        self.assertEqual(res.status_code, 200)
+        results = res.get_json()["results"]
+        # Only this user's matches; the short, dense message outranks the padded one
+        self.assertEqual(len(results), 3)
+        self.assertEqual({r["chat_id"] for r in results}, {chat_id})
+        self.assertIn("<mark>Hostel</mark> <mark>allocation</mark>", results[0]["content"])
+        ranks = [r["rank"] for r in results]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        padded = next(r for r in results if "Student Affairs" in r["content"])
+        self.assertLess(len(padded["content"]), len(contents[1]))
+        self.assertEqual(padded["rank"], ranks[-1])
+
+        pages, cursor = [], None
+        while True:
+            url = "/api/v1/history/search?q=hostel allocation&limit=2"
+            res = self.client.get(url + (f"&after={cursor}" if cursor else ""), headers=headers)
+            body = res.get_json()
+            pages.append([r["id"] for r in body["results"]])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(pages, [[r["id"] for r in results[:2]], [results[2]["id"]]])
+
+        # The index follows edits and deletes
+        message = db.session.get(Message, results[0]["id"])
+        message.content = "Room keys are collected at the porter's lodge."
+        db.session.delete(db.session.get(Message, results[1]["id"]))
+        db.session.commit()
+        res = self.client.get("/api/v1/history/search?q=allocation", headers=headers)
+        self.assertEqual([r["id"] for r in res.get_json()["results"]], [results[2]["id"]])
+        res = self.client.get("/api/v1/history/search?q=porter's lodge", headers=headers)
+        self.assertEqual([r["id"] for r in res.get_json()["results"]], [results[0]["id"]])
+
+        # Snippets are HTML: the message text is escaped around the highlights
+        script = "<script>alert('hostel')</script> & friends"
+        db.session.add(Message(chat_id=chat_id, role="user", content=script))
+        db.session.commit()
+        res = self.client.get("/api/v1/history/search?q=alert", headers=headers)
+        content = res.get_json()["results"][0]["content"]
+        self.assertNotIn("<script>", content)
+        self.assertEqual(
+            content,
+            "&lt;script&gt;<mark>alert</mark>(&#x27;hostel&#x27;)&lt;/script&gt; &amp; friends",
+        )
+
+        res = self.client.get('/api/v1/history/search?q="AND (*', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get("/api/v1/history/search?q=%20", headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_falls_back_to_substring_scan_without_fulltext_index(self):
+        account = seed_database(users=1, chats_per_user=1, messages_per_chat=0)[0]
+        chat_id = account["chat_ids"][0]
+        for content in ("Pay 50% of fees by May.", "Fees are due in <b>June</b>."):
+            db.session.add(Message(chat_id=chat_id, role="assistant", content=content))
+        db.session.commit()
+        res = self.client.post(
+            "/api/v1/auth/login", json={"email": account["email"], "password": LOADTEST_PASSWORD}
+        )
+        headers = {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+
+        # As on a database with neither FTS5 nor tsvector support
+        with patch.dict("app.services.search._MATCHERS", clear=True):
+            res = self.client.get("/api/v1/history/search?q=FEES&limit=1", headers=headers)
+            self.assertEqual(res.status_code, 200)
+            body = res.get_json()
+            self.assertEqual(
+                [r["content"] for r in body["results"]],
+                ["Fees are due in &lt;b&gt;June&lt;/b&gt;."],
+            )
+            url = f"/api/v1/history/search?q=FEES&after={body['next_cursor']}"
+            res = self.client.get(url, headers=headers)
+            body = res.get_json()
+            self.assertEqual([r["content"] for r in body["results"]], ["Pay 50% of fees by May."])
+            self.assertIsNone(body["next_cursor"])
+            # Wildcards in the query are matched literally
+            res = self.client.get("/api/v1/history/search?q=50%25", headers=headers)
+            self.assertEqual(len(res.get_json()["results"]), 1)
+            res = self.client.get("/api/v1/history/search?q=_", headers=headers)
+            self.assertEqual(res.get_json()["results"], [])
+
+    @patch("app.core.rag.llm.LLM.get_response")
+    def test_semantic_and_hybrid_search_over_own_history(self, mock_get_response):
+        mock_get_response.return_value = "Hostel allocation opens in August for returning students."
+        account, other = seed_database(users=2, chats_per_user=1, messages_per_chat=0)
+        tokens = {}
+        for who in (account, other):
+            res = self.client.post(
+                "/api/v1/auth/login", json={"email": who["email"], "password": LOADTEST_PASSWORD}
+            )
+            tokens[who["user_id"]] = {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+        headers = tokens[account["user_id"]]
+
+        with tempfile.TemporaryDirectory() as td:
+            index = history_index.HistoryIndex(
+                directory=td, use_model="hash", embeddings=HashingEmbedding()
+            )
+            indexer = history_index.HistoryIndexer(index)
+            with (
+                patch.object(history_index, "_shared", indexer),
+                patch("app.api.chat.HISTORY_SEMANTIC_SEARCH", True),
+                patch("app.api.history.HISTORY_SEMANTIC_SEARCH", True),
+            ):
+                for who, question in (
+                    (account, "When does hostel allocation start?"),
+                    (account, "Where is the library?"),
+                    (other, "When does hostel allocation start?"),
+                ):
+                    res = self.client.post(
+                        f"/api/v1/chat/{who['chat_ids'][0]}/message",
+                        json={"content": question},
+                        headers=tokens[who["user_id"]],
+                    )
+                    self.assertEqual(res.status_code, 201)
+                indexer.wait()
+                self.assertEqual(len(index.load(account["user_id"])[0]), 4)
+
+                url = "/api/v1/history/search?q=hostel allocation start"
+                res = self.client.get(url + "&mode=semantic", headers=headers)
+                self.assertEqual(res.status_code, 200)
+                results = res.get_json()["results"]
+                # Only this user's four messages, the closest question first
+                self.assertEqual(len(results), 4)
+                self.assertEqual(results[0]["content"], "When does hostel allocation start?")
+                self.assertEqual({r["chat_id"] for r in results}, {account["chat_ids"][0]})
+
+                res = self.client.get(url + "&mode=hybrid&limit=1", headers=headers)
+                body = res.get_json()
+                self.assertIn("<mark>", body["results"][0]["content"])
+                res = self.client.get(
+                    url + f"&mode=hybrid&limit=10&after={body['next_cursor']}", headers=headers
+                )
+                rest = res.get_json()["results"]
+                self.assertEqual(len(rest), 3)
+                self.assertNotIn(body["results"][0]["id"], [r["id"] for r in rest])
+
+                # Deleted messages drop out; clearing all chats drops the partition
+                chat_id = account["chat_ids"][0]
+                res = self.client.delete(
+                    f"/api/v1/history/chat/{chat_id}/message/{results[0]['id']}", headers=headers
+                )
+                self.assertEqual(res.status_code, 200)
+                res = self.client.get(url + "&mode=semantic", headers=headers)
+                self.assertEqual(len(res.get_json()["results"]), 3)
+                self.client.delete("/api/v1/history/chats", headers=headers)
+                self.assertEqual(len(index.load(account["user_id"])[0]), 0)
+
+            res = self.client.get(url + "&mode=semantic", headers=headers)
+            self.assertEqual(res.status_code, 400)
+            res = self.client.get(url + "&mode=fuzzy", headers=headers)
+            self.assertEqual(res.status_code, 422)
+
+    def test_clearing_chats_deletes_in_bulk_and_purges_large_histories(self):
+        small, large = seed_database(users=2, chats_per_user=3, messages_per_chat=4)
+        headers = {}
+        for who in (small, large):
+            res = self.client.post(
+                "/api/v1/auth/login", json={"email": who["email"], "password": LOADTEST_PASSWORD}
+            )
+            headers[who["user_id"]] = {"Authorization": f"Bearer {res.get_json()['access_token']}"}
+
+        def owned_messages(account):
+            return Message.query.filter(Message.chat_id.in_(account["chat_ids"])).count()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # Small history: deleted at once, with a fixed number of statements
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            res = self.client.delete("/api/v1/history/chats", headers=headers[small["user_id"]])
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(owned_messages(small), 0)
+        self.assertEqual(Chat.query.filter_by(user_id=small["user_id"]).count(), 0)
+        deletes = [s for s in statements if s.lstrip().upper().startswith("DELETE")]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(owned_messages(large), 12)
+
+        # Large history: hidden at once, purged later in batches
+        with (
+            patch("app.api.history.CLEAR_CHATS_SYNC_MAX_MESSAGES", 5),
+            patch("app.api.history.purge_deleted_chats_async") as purge_async,
+        ):
+            res = self.client.delete("/api/v1/history/chats", headers=headers[large["user_id"]])
+        self.assertEqual(res.status_code, 200)
+        purge_async.assert_called_once()
+        self.assertEqual(owned_messages(large), 12)
+        res = self.client.get("/api/v1/history/chats", headers=headers[large["user_id"]])
+        self.assertEqual(res.get_json()["chats"], [])
+        chat_id = large["chat_ids"][0]
+        res = self.client.get(f"/api/v1/chat/{chat_id}", headers=headers[large["user_id"]])
+        self.assertEqual(res.status_code, 404)
+        res = self.client.delete("/api/v1/history/chats", headers=headers[large["user_id"]])
+        self.assertEqual(res.get_json()["message"], "No chats to delete")
+
+        self.assertEqual(purge_deleted_chats(batch_size=5), 3)
+        self.assertEqual(owned_messages(large), 0)
+        self.assertEqual(Chat.query.count(), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,69 @@
+from functools import partial
+import unittest
+from unittest.mock import patch
+
+from app import create_app, db
+from app.core.loadtest import LoadTest, seed_database
+from app.core.rag.llm import LLM
+from app.models import Chat, Message, User
+from app.services.memory import ConversationMemory
+
+# python -m unittest discover -s test -p "test_loadtest.py" -v
+
+
+class LoadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_seed_database_creates_users_chats_and_messages(self):
+        accounts = seed_database(users=3, chats_per_user=2, messages_per_chat=5)
+
+        self.assertEqual(len(accounts), 3)
+        self.assertEqual(User.query.count(), 3)
+        self.assertEqual(Chat.query.count(), 6)
+        self.assertEqual(Message.query.count(), 30)
+        self.assertEqual(
+            [m.role for m in Message.query.filter_by(chat_id=accounts[0]["chat_ids"][0])][:2],
+            ["user", "assistant"],
+        )
+
+    @patch("app.core.rag.llm.LLM.get_response")
+    def test_load_test_reports_latency_and_queries_per_endpoint(self, mock_get_response):
+        mock_get_response.return_value = "Stub answer"
+        accounts = seed_database(users=2, chats_per_user=2, messages_per_chat=4)
+
+        # Summaries run on background threads; keep them offline and finish them before teardown
+        summaries = []
+        update_summary_async = ConversationMemory.update_summary_async
+
+        def track_summary(memory, *args):
+            summaries.append(update_summary_async(memory, *args))
+            return summaries[-1]
+
+        with (
+            patch("app.api.chat.LLM", partial(LLM, provider="stub", fallback_provider=None)),
+            patch.object(ConversationMemory, "update_summary_async", track_summary),
+        ):
+            report = LoadTest(self.app, accounts, concurrency=1, requests=30).run()
+            for thread in summaries:
+                thread.join()
+
+        self.assertEqual(report["requests"], 30)
+        self.assertEqual(report["errors"], 0)
+        self.assertIn("POST /auth/login", report["endpoints"])
+        for stats in report["endpoints"].values():
+            self.assertGreater(stats["db_queries_mean"], 0)
+            self.assertIn("p99_ms", stats)
+        self.assertGreater(report["throughput_rps"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+from datetime import datetime
+import unittest
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.api.pagination import encode_cursor, keyset_query
+from app.models import Chat, Complaint, Message
+from app.services.search import matching_messages
+
+# python -m unittest discover -s test -p "test_query_plans.py" -v
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """The hot listing queries must be served by their composite index.
+
+    Each plan is checked for the index and for the absence of a full table
+    scan or a temporary sort (`USE TEMP B-TREE FOR ORDER BY`).
+    """
+
+    def setUp(self):
+        self.app = create_app("testing")
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def explain(self, query) -> str:
+        statement = getattr(query, "statement", query)
+        sql = statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+        rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return "\n".join(row[-1] for row in rows)
+
+    def assertUsesIndex(self, query, index: str):
+        plan = self.explain(query)
+        self.assertIn(f"INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        for line in plan.splitlines():
+            if line.startswith("SCAN"):
+                self.assertIn("USING", line, f"full scan in plan:\n{plan}")
+
+    def test_chat_messages_in_order_use_chat_seq_index(self):
+        query = Message.query.filter_by(chat_id="chat-1").order_by(Message.seq.asc())
+        self.assertUsesIndex(query, "ix_messages_chat_id_seq")
+
+    def test_user_chats_newest_first_use_user_created_index(self):
+        query = Chat.query.filter_by(user_id="user-1").order_by(Chat.created_at.desc())
+        self.assertUsesIndex(query, "ix_chats_user_id_created_at")
+
+    def test_complaint_listings_use_created_indexes(self):
+        own = Complaint.query.filter_by(user_id="user-1").order_by(Complaint.created_at.desc())
+        self.assertUsesIndex(own, "ix_complaints_user_id_created_at")
+        every = Complaint.query.order_by(Complaint.created_at.desc())
+        self.assertUsesIndex(every, "ix_complaints_created_at")
+
+    def test_keyset_pages_seek_into_the_index(self):
+        messages = Message.query.filter_by(chat_id="chat-1")
+        page = keyset_query(messages, Message.seq, None, 50, encode_cursor(10))
+        self.assertUsesIndex(page, "ix_messages_chat_id_seq")
+
+        after = encode_cursor(datetime(2026, 1, 1), 10)
+        chats = Chat.query.filter_by(user_id="user-1")
+        page = keyset_query(chats, Chat.created_at, Chat.id, 50, after, descending=True)
+        self.assertUsesIndex(page, "ix_chats_user_id_created_at")
+
+    def test_search_matches_through_full_text_index(self):
+        query, rank, message_id = matching_messages("user-1", "hostel allocation")
+        page = keyset_query(query, rank, message_id, 50, encode_cursor(1.5, 10), descending=True)
+        plan = self.explain(page)
+        self.assertIn("SCAN messages_fts VIRTUAL TABLE INDEX", plan)
+        # Matches are joined to their messages and chats by key, never scanned
+        for line in plan.splitlines():
+            if line.startswith("SCAN"):
+                self.assertIn("messages_fts", line, f"full scan in plan:\n{plan}")
+
+
+if __name__ == "__main__":
+    unittest.main()
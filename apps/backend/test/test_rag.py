@@ -1,18 +1,46 @@
 import os
 import tempfile
+import threading
+import time
 import unittest
+from unittest.mock import patch
 
 from langchain_core.documents import Document
-from langchain_core.prompts import PromptTemplate
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
+import numpy as np
+
+from config import GENERATION_BUDGETS
 
 # python -m unittest discover -s test -p "test_rag.py" -v
 # Try to import project modules; tests will skip if dependencies aren't available
 try:
-    from app.core.rag.llm import LLM
+    from app.core.benchmark import (
+        benchmark_hierarchical,
+        build_golden_set,
+        compare_reports,
+        sweep_retrieval,
+    )
+    from app.core.ingest import build_quantized_index, update_document_index
+    from app.core.rag.classifier import GenerationStats, QueryClassifier
+    from app.core.rag.compressor import ContextCompressor
+    from app.core.rag.doc_index import DocumentIndex
+    from app.core.rag.embeddings.batching import MicroBatchingEmbeddings
+    from app.core.rag.embeddings.local import HashingEmbedding, LocalOnnxEmbedding
+    from app.core.rag.history_index import HistoryIndex, HistoryIndexer
+    from app.core.rag.llm import ERROR_RESPONSE, LLM, NO_CONTEXT_RESPONSE
     from app.core.rag.loader import DocumentLoader
+    from app.core.rag.mmr import maximal_marginal_relevance
+    from app.core.rag.parents import ParentStore
+    from app.core.rag.providers import EMBEDDING_PROVIDERS, get_embedding_provider
+    from app.core.rag.reranker import LocalReranker, RerankBudgetExceeded
     from app.core.rag.retriever import Retriever
     from app.core.rag.splitter import DocumentSplitter
-    from app.core.rag.vectorstore import VectorStore
+    from app.core.rag.stub import StubChatModel, StubEmbedding
+    from app.core.rag.vectorstore import VectorStore, relevance_score
+    from app.services.metrics import LLM_ERRORS, LLM_FALLBACKS, RETRIEVAL_ERRORS, STAGE_DURATION
 
     HAS_MODULES = True
 except Exception:
@@ -125,7 +153,569 @@ class TestRagPipeline(unittest.TestCase):
         # Force prompt template fallback by pointing to a non-existing file
         llm.prompt_path = "nonexistent_prompt_file.txt"
         prompt = llm._get_prompt_template()
-        self.assertTrue(isinstance(prompt, PromptTemplate))
+        self.assertTrue(isinstance(prompt, ChatPromptTemplate))
+
+    def test_llm_prompt_has_static_system_message(self):
+        llm = LLM()
+        prompt = llm._get_prompt_template()
+        first = prompt.invoke({"context": "Curfew is 10pm.", "query": "Curfew?"}).to_messages()
+        second = prompt.invoke({"context": "Fees are listed.", "query": "Fees?"}).to_messages()
+
+        # The system prefix must not change between requests so it can be cached
+        self.assertEqual(first[0].type, "system")
+        self.assertEqual(first[0].content, second[0].content)
+        self.assertNotIn("{context}", first[0].content)
+        self.assertIn("Curfew is 10pm.", first[1].content)
+        self.assertIn("Curfew?", first[1].content)
+
+    def test_scored_retriever_applies_threshold_and_budget(self):
+        class ScoredVectorStore:
+            def __init__(self):
+                self.requested_k = None
+
+            def search_with_scores(self, query, K=5):
+                self.requested_k = K
+                return [
+                    (Document(page_content="Curfew is 10pm.", metadata={}), 0.82),
+                    (Document(page_content="Hall rules.", metadata={}), 0.51),
+                    (Document(page_content="Cafeteria menu.", metadata={}), 0.12),
+                ]
+
+        with tempfile.TemporaryDirectory() as td:
+            log_path = os.path.join(td, "scores.jsonl")
+            vs = ScoredVectorStore()
+            retriever = Retriever(
+                vector_store=vs, mode="scored", min_score=0.5, max_k=3, score_log_path=log_path
+            )
+            results = retriever.retrieve("what time is curfew?")
+
+            self.assertEqual(vs.requested_k, 3)
+            self.assertEqual([d.page_content for d in results], ["Curfew is 10pm.", "Hall rules."])
+            self.assertEqual(retriever.last_scores, [0.82, 0.51, 0.12])
+            with open(log_path) as f:
+                self.assertIn('"kept": 2', f.read())
+
+    def test_mmr_skips_near_duplicates(self):
+        query = [1.0, 0.0, 0.0]
+        candidates = [[0.9, 0.1, 0.0], [0.9, 0.11, 0.0], [0.6, 0.0, 0.8]]
+        self.assertEqual(
+            maximal_marginal_relevance(query, candidates, k=2, lambda_mult=1.0), [0, 1]
+        )
+        self.assertEqual(
+            maximal_marginal_relevance(query, candidates, k=2, lambda_mult=0.5), [0, 2]
+        )
+        self.assertEqual(maximal_marginal_relevance(query, [], k=2), [])
+
+    def test_mmr_retriever_diversifies_chroma_results(self):
+        texts = ["Curfew is 10pm.", "Curfew is 10pm.", "Visiting hours end at 6pm."]
+        with tempfile.TemporaryDirectory() as td:
+            vs = VectorStore(
+                persist_directory=td,
+                use_model="fake",
+                embeddings=DeterministicFakeEmbedding(size=16),
+            )
+            vs.add_documents(
+                ids=["a", "b", "c"],
+                metadata=None,
+                documents=[
+                    Document(page_content=t, metadata={"source": f"doc{i}.md"})
+                    for i, t in enumerate(texts)
+                ],
+            )
+
+            similarity = Retriever(vector_store=vs, top_k=2).retrieve("Curfew is 10pm.")
+            mmr = Retriever(vector_store=vs, top_k=2, mode="mmr", fetch_k=3, lambda_mult=0.5)
+            diverse = mmr.retrieve("Curfew is 10pm.")
+
+            self.assertEqual([d.page_content for d in similarity], texts[:2])
+            self.assertEqual(
+                [d.page_content for d in diverse], ["Curfew is 10pm.", "Visiting hours end at 6pm."]
+            )
+            self.assertIn("score", diverse[0].metadata)
+            self.assertEqual(len(mmr.last_scores), 2)
+
+    def test_reranker_promotes_lexical_match_in_retriever(self):
+        class CandidateVectorStore:
+            def search_candidates(self, query, K=5):
+                docs = [
+                    Document(page_content="General hostel rules.", metadata={"score": 0.8}),
+                    Document(page_content="Library opening hours.", metadata={"score": 0.7}),
+                    Document(
+                        page_content="Hostel curfew is 10pm on weekdays.",
+                        metadata={"score": 0.6, "source": "cat05_hostel_faqs.json"},
+                    ),
+                ]
+                return np.ones(3), docs, np.ones((3, 3))
+
+        retriever = Retriever(
+            vector_store=CandidateVectorStore(),
+            reranker=LocalReranker(budget_ms=1000),
+            rerank_top_k=2,
+        )
+        results = retriever.retrieve("what time is the hostel curfew?")
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0].page_content, "Hostel curfew is 10pm on weekdays.")
+        self.assertIn("rerank_score", results[0].metadata)
+        self.assertFalse(retriever.reranker.last_stats["fallback"])
+
+    def test_reranker_keeps_dense_order_when_over_budget(self):
+        class SlowCrossEncoder:
+            # 50 ms per text, checking the deadline between texts like a real batch loop
+            def score(self, query, texts, deadline=None):
+                for _ in texts:
+                    if deadline is not None and time.perf_counter() > deadline:
+                        raise RerankBudgetExceeded()
+                    time.sleep(0.05)
+                return np.arange(len(texts), dtype=np.float32)
+
+        docs = [
+            Document(page_content=f"chunk {i}", metadata={"score": 1 - i / 10}) for i in range(4)
+        ]
+        reranker = LocalReranker(budget_ms=20, cross_encoder=SlowCrossEncoder())
+
+        start = time.perf_counter()
+        results = reranker.rerank("chunk", docs, top_k=2)
+
+        self.assertLess(time.perf_counter() - start, 0.15)
+        self.assertEqual(results, docs[:2])
+        self.assertTrue(reranker.last_stats["fallback"])
+
+        # Stats are per thread, so concurrent requests don't overwrite each other's
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(reranker.last_stats))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [{}])
+
+    def test_parent_documents_expand_children_to_whole_sections(self):
+        rows = "\n".join(f"| Programme {i} | N{i},000 |" for i in range(40))
+        text = (
+            "# Fees\n## Tuition\n| Programme | Fee |\n|---|---|\n"
+            f"{rows}\n## Hostel\nHostel fees are paid per session."
+        )
+        splitter = DocumentSplitter(model="hf")
+        parents, children = splitter.split_with_parents(
+            [Document(page_content=text, metadata={"source": "fees.md"})]
+        )
+
+        self.assertEqual(len(parents), 2)
+        self.assertGreater(len(children), len(parents))
+        self.assertTrue(all(c.metadata["parent_id"] in parents for c in children))
+
+        class ChildVectorStore:
+            def search(self, query, K=5):
+                return children[1:3] + children[-1:]
+
+        with tempfile.TemporaryDirectory() as td:
+            store = ParentStore(os.path.join(td, "parents.sqlite3"))
+            store.put_many(parents)
+            self.assertEqual(len(store), 2)
+
+            results = Retriever(vector_store=ChildVectorStore(), parent_store=store).retrieve(
+                "nursing fee"
+            )
+            self.assertEqual(len(results), 2)
+            self.assertIn("| Programme 0 |", results[0].page_content)
+            self.assertIn("| Programme 39 |", results[0].page_content)
+            self.assertEqual(results[0].metadata["Header_2"], "Tuition")
+            self.assertEqual(results[1].page_content, "Hostel fees are paid per session.")
+
+            self.assertEqual(store.delete_by_source("fees.md"), 2)
+            self.assertEqual(len(store), 0)
+
+            shared = ParentStore.shared(store.path)
+            self.assertIs(ParentStore.shared(store.path), shared)
+
+    def test_hierarchical_retrieval_searches_only_top_files(self):
+        files = {
+            "fees.md": ["Tuition is paid per semester.", "Hostel fees vary by hall."],
+            "sports.md": ["The gym opens at 6am.", "Football trials hold in October."],
+            "library.md": ["The library closes at midnight.", "Borrow up to five books."],
+        }
+        with tempfile.TemporaryDirectory() as td:
+            vs = VectorStore(
+                persist_directory=td,
+                use_model="fake",
+                embeddings=DeterministicFakeEmbedding(size=16),
+            )
+            docs = [
+                Document(page_content=text, metadata={"source": source, "Header_1": source})
+                for source, texts in files.items()
+                for text in texts
+            ]
+            vs.add_documents([f"id{i}" for i in range(len(docs))], None, docs)
+
+            doc_index = DocumentIndex(os.path.join(td, "doc_index.npz"))
+            self.assertEqual(update_document_index(vs, doc_index, list(files)), 3)
+            self.assertEqual(len(DocumentIndex(doc_index.path)), 3)
+            shared = DocumentIndex.shared(doc_index.path)
+            self.assertIs(DocumentIndex.shared(doc_index.path), shared)
+            self.assertEqual(len(shared), 3)
+
+            retriever = Retriever(vector_store=vs, top_k=4, doc_index=doc_index, top_files=1)
+            results = retriever.retrieve("when does the library close?")
+            self.assertEqual(len(retriever.last_sources), 1)
+            self.assertEqual(len(results), 2)
+            self.assertEqual({d.metadata["source"] for d in results}, set(retriever.last_sources))
+
+            report = benchmark_hierarchical(vs, doc_index, ["gym hours"], k=2, top_files=(1, 3))
+            self.assertEqual(report["files_indexed"], 3)
+            self.assertEqual(report["hierarchical"][1]["recall_vs_flat"], 1.0)
+
+    def test_quantized_index_matches_full_precision_search(self):
+        with tempfile.TemporaryDirectory() as td:
+            embeddings = DeterministicFakeEmbedding(size=32)
+            vs = VectorStore(persist_directory=td, use_model="fake", embeddings=embeddings)
+            docs = [
+                Document(page_content=f"Chunk number {i}", metadata={"source": f"f{i % 4}.md"})
+                for i in range(60)
+            ]
+            vs.add_documents([f"id{i}" for i in range(60)], None, docs)
+
+            report = build_quantized_index(vs, reduction="pca", dimensions=16)
+            self.assertEqual(report["chunks"], 60)
+            self.assertEqual(report["dimensions"], 16)
+            self.assertLess(report["index_bytes"], report["float32_bytes"])
+            self.assertGreaterEqual(report["recall_at_k_rescored"], report["recall_at_k_int8"])
+
+            quantized = VectorStore(
+                persist_directory=td, use_model="fake", embeddings=embeddings, quantized=True
+            )
+            quantized.rescore_factor = 60  # Shortlist everything so rescoring is exact
+            query = "Chunk number 7"
+            expected = [(d.id, round(s, 4)) for d, s in vs.search_with_scores(query, K=5)]
+            actual = [(d.id, round(s, 4)) for d, s in quantized.search_with_scores(query, K=5)]
+            self.assertIsNotNone(quantized.quantized_index)
+            self.assertEqual(actual, expected)
+
+            in_source = quantized.search(query, K=5, sources=["f1.md"])
+            self.assertEqual({d.metadata["source"] for d in in_source}, {"f1.md"})
+
+            # The index file is loaded once per process, until a re-ingest rewrites it
+            again = VectorStore(
+                persist_directory=td, use_model="fake", embeddings=embeddings, quantized=True
+            )
+            again.initialize_db()
+            self.assertIs(again.quantized_index, quantized.quantized_index)
+            vs.add_documents(["id60"], None, [Document(page_content="Chunk number 60")])
+            build_quantized_index(vs, reduction="none")
+            again.initialize_db()
+            self.assertEqual(len(again.quantized_index), 61)
+
+    def test_history_index_keeps_compact_per_user_partitions(self):
+        with tempfile.TemporaryDirectory() as td:
+            index = HistoryIndex(directory=td, use_model="hash", embeddings=HashingEmbedding())
+            indexer = HistoryIndexer(index, max_batch=4)
+            indexer.submit("alice", [(1, "hostel allocation for freshers"), (2, "exam timetable")])
+            indexer.submit("bob", [(3, "hostel allocation rules")])
+            indexer.submit("alice", [(4, "library opening hours"), (5, "cafeteria menu")])
+            indexer.wait()
+
+            ids, vectors = index.load("alice")
+            self.assertEqual(sorted(ids.tolist()), [1, 2, 4, 5])
+            self.assertEqual(vectors.dtype, np.float16)
+            path = index.partition_path("alice")
+            self.assertEqual(os.path.getsize(path), 8 + 4 * (8 + 2 * 256))
+
+            hits = index.search("alice", "hostel allocation", K=2)
+            self.assertEqual(hits[0][0], 1)
+            self.assertEqual(len(hits), 2)
+            self.assertEqual([h[0] for h in index.search("bob", "hostel", K=5)], [3])
+
+            # A torn append is ignored rather than misread
+            with open(path, "ab") as f:
+                f.write(b"\x01\x02\x03")
+            self.assertEqual(len(index.load("alice")[0]), 4)
+
+            index.drop("alice")
+            self.assertEqual(index.search("alice", "hostel", K=5), [])
+
+    def test_micro_batching_coalesces_concurrent_queries(self):
+        class CountingEmbeddings:
+            def __init__(self):
+                self.calls = []
+
+            def embed_documents(self, texts):
+                self.calls.append(len(texts))
+                time.sleep(0.02)
+                return [[float(len(t))] for t in texts]
+
+        inner = CountingEmbeddings()
+        batcher = MicroBatchingEmbeddings(inner, window_ms=50, max_batch=4)
+        results = {}
+
+        def query(text):
+            results[text] = batcher.embed_query(text)
+
+        threads = [threading.Thread(target=query, args=("q" * n,)) for n in range(1, 9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=5)
+
+        self.assertEqual(results, {"q" * n: [float(n)] for n in range(1, 9)})
+        self.assertEqual(sum(inner.calls), 8)
+        self.assertLess(len(inner.calls), 8)
+        self.assertTrue(all(size <= 4 for size in inner.calls))
+
+        stats = batcher.stats.snapshot()
+        self.assertEqual(stats["requests"], 8)
+        self.assertEqual(stats["batches"], len(inner.calls))
+        self.assertGreater(stats["mean_fill"], 0.25)
+        self.assertLess(stats["wait_p95_ms"], 1000)
+
+    def test_hash_embedding_model_runs_offline(self):
+        embedder = HashingEmbedding(size=64)
+        self.assertEqual(
+            embedder.embed_query("Hostel curfew"), embedder.embed_query("Hostel curfew")
+        )
+        self.assertAlmostEqual(float(np.linalg.norm(embedder.embed_query("Hostel curfew"))), 1.0)
+
+        with tempfile.TemporaryDirectory() as td:
+            vs = VectorStore(persist_directory=td, use_model="hash")
+            self.assertIsInstance(vs.embeddings, HashingEmbedding)
+            docs = [
+                Document(page_content="The hostel curfew is 10pm.", metadata={"source": "a.md"}),
+                Document(page_content="Tuition is paid per semester.", metadata={"source": "b.md"}),
+            ]
+            vs.add_documents(["a", "b"], None, docs)
+            results = vs.search("what time is the hostel curfew", K=1)
+            self.assertEqual(results[0].page_content, "The hostel curfew is 10pm.")
+
+        with self.assertRaises(ValueError):
+            LocalOnnxEmbedding(model_dir=None)
+
+    def test_llm_skips_generation_without_context(self):
+        llm = LLM()
+        llm.llm_chain = None  # Any LLM call would fail loudly
+        response = llm.get_response("who won the world cup?", lambda query: [])
+        self.assertEqual(response, NO_CONTEXT_RESPONSE)
+
+    def test_llm_reports_retrieval_failure_as_error(self):
+        class DownVectorStore:
+            def search(self, query, K=5):
+                raise ConnectionError("vector store unreachable")
+
+        llm = LLM()
+        llm.llm_chain = None
+        errors = RETRIEVAL_ERRORS.value()
+        retriever = Retriever(vector_store=DownVectorStore(), mode="similarity")
+        response = llm.get_response("what time is curfew?", retriever.as_runnable())
+        self.assertEqual(response, ERROR_RESPONSE)
+        self.assertEqual(RETRIEVAL_ERRORS.value(), errors + 1)
+
+    def test_relevance_scores_follow_the_distance_metric(self):
+        self.assertAlmostEqual(relevance_score(0.0, "l2"), 1.0)
+        self.assertAlmostEqual(relevance_score(2**0.5, "l2"), 0.0)
+        self.assertAlmostEqual(relevance_score(0.25, "cosine"), 0.75)
+        self.assertAlmostEqual(relevance_score(0.25, "ip"), 0.75)
+        self.assertAlmostEqual(relevance_score(-0.5, "ip"), 0.5)
+
+    def test_compressor_keeps_relevant_rows_within_budget(self):
+        rows = "\n".join(f"| Programme {i} | N{i}00,000 |" for i in range(60))
+        table = "| Programme | Tuition |\n|---|---|\n" + rows + "\n| Nursing | N999,000 |"
+        docs = [
+            Document(page_content=table, metadata={"source": "fees.md", "score": 0.8}),
+            Document(
+                page_content="The library opens at 8am. Students must show ID cards.",
+                metadata={"source": "library.md", "score": 0.3},
+            ),
+        ]
+        compressor = ContextCompressor(max_tokens=60)
+        compressed = compressor.compress("What is the tuition for Nursing?", docs)
+
+        merged = "\n".join(d.page_content for d in compressed)
+        self.assertIn("| Nursing | N999,000 |", merged)
+        # The table header travels with the selected row
+        self.assertIn("| Programme | Tuition |", merged)
+        self.assertLessEqual(compressor.last_stats["output_tokens"], 60)
+        self.assertLess(compressor.last_stats["ratio"], 0.5)
+
+    def test_compressor_leaves_small_context_untouched(self):
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+        compressor = ContextCompressor(max_tokens=100)
+        self.assertIs(compressor.compress("curfew?", docs), docs)
+        self.assertEqual(compressor.last_stats["ratio"], 1.0)
+
+    def test_query_classifier_buckets(self):
+        classifier = QueryClassifier()
+        self.assertEqual(classifier.classify("What time is curfew?"), "factual")
+        self.assertEqual(classifier.classify("How much are the Engineering fees?"), "factual")
+        self.assertEqual(classifier.classify("How much is the application fee?"), "factual")
+        self.assertEqual(classifier.classify("When does registration close?"), "factual")
+        self.assertEqual(classifier.classify("How do I apply for admission?"), "procedural")
+        self.assertEqual(classifier.classify("Steps to request a transcript"), "procedural")
+        self.assertEqual(classifier.classify("Tell me about hostel accommodation."), "open_ended")
+        self.assertEqual(
+            classifier.classify("Why does Babcock have a citizenship grading system?"),
+            "open_ended",
+        )
+
+    def test_llm_uses_query_class_budget_and_records_stats(self):
+        llm = LLM()
+        called = []
+
+        def fake_chain(name):
+            def run(prompt_value):
+                called.append(name)
+                return AIMessage(
+                    content="Curfew is 10pm.",
+                    usage_metadata={"input_tokens": 900, "output_tokens": 6, "total_tokens": 906},
+                    response_metadata={"finish_reason": "STOP"},
+                )
+
+            return RunnableLambda(run)
+
+        llm.budget_chains = {name: fake_chain(name) for name in llm.budget_chains}
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+
+        with patch("app.core.rag.llm.generation_stats", GenerationStats(log_path=None)) as stats:
+            response = llm.get_response("What time is curfew?", lambda query: docs)
+
+            self.assertEqual(response, "Curfew is 10pm.")
+            self.assertEqual(called, ["factual"])
+            snapshot = stats.snapshot()
+            self.assertEqual(snapshot["factual"]["requests"], 1)
+            self.assertEqual(snapshot["factual"]["output_tokens_p50"], 6)
+
+    def test_budget_chains_carry_output_limits(self):
+        llm = LLM()
+        primary = llm.budget_chains["factual"].bound.runnable
+        self.assertEqual(
+            primary.max_output_tokens, GENERATION_BUDGETS["factual"]["max_output_tokens"]
+        )
+        self.assertEqual(primary.temperature, GENERATION_BUDGETS["factual"]["temperature"])
+
+    def test_llm_instances_share_chat_models(self):
+        first, second = LLM(), LLM()
+        self.assertIs(first.primary_llm, second.primary_llm)
+        self.assertIs(
+            first.budget_chains["factual"].bound.runnable,
+            second.budget_chains["factual"].bound.runnable,
+        )
+        # Each instance still wraps them with its own callback handler
+        self.assertIsNot(first.callback_handler, second.callback_handler)
+
+    def test_provider_registry_declares_limits(self):
+        gemini = get_embedding_provider("gemini")
+        self.assertEqual(gemini.chunk_size, 1500)
+        self.assertAlmostEqual(gemini.batch_interval_s, 10.0)
+        self.assertEqual(get_embedding_provider("hf").batch_interval_s, 0.0)
+        self.assertEqual(DocumentSplitter(model="gemini").chunk_size, 1500)
+        self.assertEqual(DocumentSplitter(model="hash").chunk_size, 500)
+        self.assertIn("stub", EMBEDDING_PROVIDERS)
+
+        with self.assertRaises(ValueError):
+            get_embedding_provider("no-such-provider")
+        with self.assertRaises(ValueError):
+            LLM(provider="no-such-provider")
+
+    def test_stub_providers_answer_offline_with_latency(self):
+        self.assertEqual(len(StubEmbedding(size=32).embed_query("fees")), 32)
+        slow = StubChatModel(latency_ms=50)
+        start = time.perf_counter()
+        message = slow.invoke("What time is curfew?")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+        self.assertGreater(message.usage_metadata["output_tokens"], 0)
+
+        llm = LLM(provider="stub", fallback_provider=None)
+        self.assertIsNone(llm.fallback_llm)
+        self.assertEqual(
+            llm.budget_chains["factual"].bound.max_output_tokens,
+            GENERATION_BUDGETS["factual"]["max_output_tokens"],
+        )
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+        response = llm.get_response("What time is curfew?", lambda query: docs)
+        self.assertTrue(response.startswith("This is a stub answer"))
+
+    def test_llm_metrics_count_errors_and_fallbacks(self):
+        llm = LLM(provider="stub", fallback_provider="stub")
+        primary = llm.budget_chains["factual"].bound.runnable
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("primary down")
+
+        errors = LLM_ERRORS.value(provider="stub", model="stub")
+        fallbacks = LLM_FALLBACKS.value(provider="stub")
+        attempts = STAGE_DURATION.count(stage="llm", provider="stub", model="stub")
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+        with patch.object(type(primary), "_generate", fail):
+            llm.get_response("What time is curfew?", lambda query: docs)
+        # Both stub chat models share the patched class, so the fallback fails too
+        self.assertEqual(LLM_ERRORS.value(provider="stub", model="stub"), errors + 2)
+        self.assertEqual(LLM_FALLBACKS.value(provider="stub"), fallbacks + 1)
+
+        response = llm.get_response("What time is curfew?", lambda query: docs)
+        self.assertTrue(response.startswith("This is a stub answer"))
+        self.assertEqual(LLM_FALLBACKS.value(provider="stub"), fallbacks + 1)
+        self.assertEqual(
+            STAGE_DURATION.count(stage="llm", provider="stub", model="stub"), attempts + 3
+        )
+
+    def test_generate_metric_labels_the_provider_that_served(self):
+        class DownChatModel(StubChatModel):
+            def _generate(self, *args, **kwargs):
+                raise RuntimeError("primary down")
+
+        class BackupChatModel(StubChatModel):
+            @property
+            def _llm_type(self) -> str:
+                return "stub-backup"
+
+        llm = LLM(provider="stub", fallback_provider=None)
+        llm.providers["stub-backup"] = "backup"
+        llm.budget_chains = {
+            "factual": llm._with_fallback(DownChatModel(), BackupChatModel(latency_ms=0))
+        }
+        served = STAGE_DURATION.count(stage="generate", provider="backup", model="stub-backup")
+        primary = STAGE_DURATION.count(stage="generate", provider="stub", model="stub")
+        docs = [Document(page_content="Curfew is 10pm.", metadata={})]
+
+        response = llm.get_response("What time is curfew?", lambda query: docs)
+        self.assertTrue(response.startswith("This is a stub answer"))
+        self.assertEqual(
+            STAGE_DURATION.count(stage="generate", provider="backup", model="stub-backup"),
+            served + 1,
+        )
+        self.assertEqual(
+            STAGE_DURATION.count(stage="generate", provider="stub", model="stub"), primary
+        )
+
+    def test_retrieval_benchmark_scores_golden_set(self):
+        with tempfile.TemporaryDirectory() as td:
+            files = {
+                "hostel.md": "# Hostels\n\nThe hostel curfew is 10pm on weeknights.\n\n## Notes\n---",
+                "fees.md": "# Fees\n\nTuition fees are paid per semester at the bursary.",
+                "faqs.json": '[{"question": "When is curfew?", '
+                '"answer": "Curfew in the hostel is 10pm on weeknights."}]',
+            }
+            for name, text in files.items():
+                with open(os.path.join(td, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            corpus = [os.path.join(td, "hostel.md"), os.path.join(td, "fees.md")]
+
+            golden = build_golden_set([os.path.join(td, "faqs.json")], corpus, root=td)
+            self.assertEqual(golden[0]["expected_sources"], ["hostel.md"])
+
+            report = sweep_retrieval(
+                golden,
+                corpus,
+                model="hash",
+                chunk_sizes=(200,),
+                overlaps=(20,),
+                top_ks=(1, 2),
+                modes=("similarity",),
+                root=td,
+            )
+
+        self.assertEqual(len(report["runs"]), 2)
+        best = report["runs"][0]
+        self.assertEqual(best["chunks"], 2)  # the lone "---" rule is not indexed
+        self.assertEqual((best["recall_at_k"], best["mrr"]), (1.0, 1.0))
+        self.assertGreater(best["context_tokens_mean"], 0)
+        self.assertIn("p95_ms", best)
+        self.assertTrue(all(d["recall_at_k"] == 0 for d in compare_reports(report, report)))
 
 
 if __name__ == "__main__":